@@ -0,0 +1,488 @@
+"""
+Cache for read endpoints and service methods.
+
+    @router.get("/{source_id}/tree")
+    @cached("sources.tree", tags=source_tags)
+    async def get_source_tree(source_id: int, ..., db: AsyncSession = Depends(get_db)):
+
+The key is the namespace plus the call's arguments (except `db` and `self`). Values
+live in an in-process LRU bounded by CACHE_MAX_ENTRIES and CACHE_MAX_BYTES and, with
+CACHE_REDIS_URL, in a Redis-compatible server shared by all API processes; values sent
+there must be JSON-serialisable, as route responses are.
+
+An entry is fresh for its ttl, then served stale for CACHE_STALE_SECONDS while one
+background call refreshes it (stale-while-revalidate). Concurrent misses of a key
+make a single call that all of them wait for (single-flight), so an expired popular
+page does not send a burst of identical queries to Postgres.
+
+Entries are tagged, with source_tags "source:<id>" (or "source:*" for reads across all
+sources). invalidate_source() drops the entries of a source and the cross-source ones;
+SourceIntakeService calls it when it writes a source. With a shared backend the
+invalidation is published so that every process drops its local entries as well.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from . import config
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+ALL_SOURCES_TAG = "source:*"
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Adds a key (ARGV[1]) to its tag sets (KEYS) and keeps each set until at least ARGV[2]
+# seconds from now, so a set expires with the last of its entries; TTL is -1 without one
+TAG_SCRIPT = """
+for _, tag_key in ipairs(KEYS) do
+    redis.call("SADD", tag_key, ARGV[1])
+    if redis.call("TTL", tag_key) < tonumber(ARGV[2]) then
+        redis.call("EXPIRE", tag_key, ARGV[2])
+    end
+end
+"""
+
+
+def source_tags(params: dict) -> List[str]:
+    """Tags of a call with a source_id argument: that source, or every source without one."""
+    source_id = params.get("source_id")
+    return [f"source:{source_id}"] if source_id is not None else [ALL_SOURCES_TAG]
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0  # fresh entries served
+    stale_hits: int = 0  # stale entries served while being refreshed
+    shared_hits: int = 0  # misses of the local cache found in the shared backend
+    misses: int = 0  # calls made
+    coalesced: int = 0  # misses that waited for a call already in flight
+    evictions: int = 0  # entries dropped for space
+    expirations: int = 0  # entries dropped past their stale period
+    invalidations: int = 0  # entries dropped by invalidate_tags
+    errors: int = 0  # failed shared backend operations
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.shared_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+    tags: Tuple[str, ...]
+    size: int
+
+
+class LocalCache:
+    """
+    LRU of entries with a fresh and a stale deadline, bounded by entry count and by the
+    total size of the values (their JSON length, as measured by the caller).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, metrics: CacheMetrics):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.bytes = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tagged: Dict[str, Set[str]] = {}
+        # Bumped by every invalidation of a tag: a call that started before one must not
+        # store what it read
+        self._generations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now >= entry.stale_until:
+            self._remove(key)
+            self.metrics.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def generations(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(self, key: str, entry: _Entry, generations: Optional[Tuple[int, ...]] = None) -> bool:
+        if generations is not None and generations != self.generations(entry.tags):
+            return False
+        if entry.size > self.max_bytes:
+            return False
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        for tag in entry.tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.metrics.evictions += 1
+        return True
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in self._tagged.pop(tag, set()):
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+        self.metrics.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tagged.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+
+class RedisCacheBackend:
+    """
+    Entries in a Redis-compatible server (Redis, Valkey, KeyDB, Dragonfly), shared by
+    the API processes: a JSON envelope per key, expiring with its stale deadline, and a
+    set of keys per tag, expiring with the last of them.
+    """
+
+    def __init__(self, url: str, prefix: str = "cache:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[_Entry]:
+        data = await self.client.get(self.prefix + key)
+        if data is None:
+            return None
+        envelope = json.loads(data)
+        return _Entry(envelope["value"], envelope["fresh_until"], envelope["stale_until"],
+                      tuple(envelope["tags"]), len(data))
+
+    async def set(self, key: str, entry: _Entry, encoded_value: str) -> None:
+        envelope = (
+            f'{{"value": {encoded_value}, "fresh_until": {entry.fresh_until}, '
+            f'"stale_until": {entry.stale_until}, "tags": {json.dumps(list(entry.tags))}}}'
+        )
+        # Deadlines are wall-clock here (time.time()), as they are compared across hosts
+        ttl = max(int(entry.stale_until - time.time()) + 1, 1)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, envelope, ex=ttl)
+            if entry.tags:
+                pipe.eval(TAG_SCRIPT, len(entry.tags), *(self.prefix + "tag:" + tag for tag in entry.tags), key, ttl)
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: List[str]) -> None:
+        tag_keys = [self.prefix + "tag:" + tag for tag in tags]
+        async with self.client.pipeline(transaction=True) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            pipe.delete(*tag_keys)
+            members = (await pipe.execute())[:len(tag_keys)]
+        keys = {self.prefix + key.decode() for keys in members for key in keys}
+        if keys:
+            await self.client.delete(*keys)
+        await self.client.publish(INVALIDATION_CHANNEL, json.dumps(tags))
+
+    async def invalidations(self):
+        """Tag lists invalidated by any process, as they are published."""
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.close()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class RequestCoalescer:
+    """
+    Runs identical concurrent calls once: a call made while one with the same key is in
+    flight waits for that one's result instead of running again. The shared call runs
+    in its own task, so a caller that goes away (a client disconnecting) does not cancel
+    it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here as well, for when every caller went away
+            logger.debug("Coalesced call %r failed: %r", key, task.exception())
+
+
+class Cache:
+    """The local LRU, the optional shared backend, and the single-flight of misses."""
+
+    def __init__(
+        self,
+        ttl: float = config.CACHE_TTL_SECONDS,
+        stale_ttl: float = config.CACHE_STALE_SECONDS,
+        max_entries: int = config.CACHE_MAX_ENTRIES,
+        max_bytes: int = config.CACHE_MAX_BYTES,
+        shared: Optional[RedisCacheBackend] = None,
+        enabled: bool = config.CACHE_ENABLED
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.enabled = enabled
+        self.metrics = CacheMetrics()
+        self.local = LocalCache(max_entries, max_bytes, self.metrics)
+        self.shared = shared
+        self._flights = RequestCoalescer()
+        self._refreshes: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def get_or_call(
+        self,
+        key: str,
+        call: Callable[[], Awaitable],
+        tags: Tuple[str, ...] = (),
+        ttl: Optional[float] = None,
+        shared: bool = True,
+        refresh: Optional[Callable[[], Awaitable]] = None
+    ):
+        """
+        The cached value of key, or that of call() (made once for concurrent misses).
+        A stale entry is refreshed in the background by refresh() (call() if None): a
+        call that outlives the caller needs resources of its own, such as a session.
+        """
+        if not self.enabled:
+            return await call()
+        ttl = self.ttl if ttl is None else ttl
+
+        entry = self.local.get(key, time.time())
+        if entry is None and shared and self.shared is not None:
+            entry = await self._shared_get(key)
+            if entry is not None:
+                self.metrics.shared_hits += 1
+                self.local.set(key, entry)
+                return self._serve_stale(key, entry, refresh or call, tags, ttl, shared)
+        if entry is not None:
+            if time.time() < entry.fresh_until:
+                self.metrics.hits += 1
+                return entry.value
+            self.metrics.stale_hits += 1
+            return self._serve_stale(key, entry, refresh or call, tags, ttl, shared)
+
+        if self._flights.in_flight(key):
+            self.metrics.coalesced += 1
+        return await self._flights.run(key, lambda: self._fill(key, call, tags, ttl, shared))
+
+    def _serve_stale(self, key, entry: _Entry, call, tags, ttl, shared):
+        if time.time() >= entry.fresh_until and not self._flights.in_flight(key):
+            refresh = asyncio.ensure_future(self._flights.run(key, lambda: self._fill(key, call, tags, ttl, shared)))
+            self._refreshes.add(refresh)
+            refresh.add_done_callback(self._refreshed)
+        return entry.value
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Refreshing a stale cache entry failed: %r", task.exception())
+
+    async def _fill(self, key: str, call, tags: Tuple[str, ...], ttl: float, shared: bool):
+        self.metrics.misses += 1
+        generations = self.local.generations(tags)
+        value = await call()
+        encoded = json.dumps(value, default=str) if shared and self.shared is not None else None
+        now = time.time()
+        entry = _Entry(value, now + ttl, now + ttl + self.stale_ttl, tags, len(encoded) if encoded else _size(value))
+        if self.local.set(key, entry, generations) and encoded is not None:
+            try:
+                await self.shared.set(key, entry, encoded)
+            except Exception:
+                self.metrics.errors += 1
+                logger.exception("Writing cache entry %s to the shared backend failed", key)
+        return value
+
+    async def _shared_get(self, key: str) -> Optional[_Entry]:
+        try:
+            entry = await self.shared.get(key)
+        except Exception:
+            self.metrics.errors += 1
+            logger.exception("Reading cache entry %s from the shared backend failed", key)
+            return None
+        if entry is None or time.time() >= entry.stale_until:
+            return None
+        return entry
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Drop the entries with any of the tags, here and in the shared backend."""
+        tags = list(tags)
+        removed = self.local.invalidate_tags(tags)
+        if self.shared is not None:
+            try:
+                await self.shared.invalidate_tags(tags)
+            except Exception:
+                self.metrics.errors += 1
+                logger.exception("Invalidating cache tags %s in the shared backend failed", tags)
+        return removed
+
+    async def invalidate_source(self, source_id: int) -> int:
+        """Drop what was read from a source, and every cross-source read, after it changed."""
+        return await self.invalidate_tags([f"source:{source_id}", ALL_SOURCES_TAG])
+
+    def stats(self) -> dict:
+        return {
+            **self.metrics.snapshot(),
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "shared": self.shared is not None,
+        }
+
+    async def start(self) -> None:
+        # Other processes' invalidations reach this one's local entries
+        if self.shared is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(), name="cache-invalidations")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for tags in self.shared.invalidations():
+                    self.local.invalidate_tags(tags)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed, resubscribing")
+                # Whatever was published meanwhile was missed
+                self.local.clear()
+                await asyncio.sleep(1)
+
+
+def _size(value) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024  # not JSON (a local-only service result): counted at a nominal size
+
+
+_cache: Optional[Cache] = None
+
+
+def get_cache() -> Cache:
+    """The process-wide Cache, sharing entries through CACHE_REDIS_URL when set."""
+    global _cache
+    if _cache is None:
+        _cache = Cache(shared=RedisCacheBackend(config.CACHE_REDIS_URL) if config.CACHE_REDIS_URL else None)
+    return _cache
+
+
+def cache_key(namespace: str, params: dict) -> str:
+    encoded = json.dumps(params, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha1(encoded.encode()).hexdigest()}"
+
+
+def cached(
+    namespace: str,
+    tags: Optional[Callable[[dict], Iterable[str]]] = None,
+    ttl: Optional[float] = None,
+    shared: bool = True,
+    exclude: Tuple[str, ...] = ("self", "db"),
+    session_factory: Optional[Callable] = None
+):
+    """
+    Cache the results of a coroutine function (a route or a service function) by its
+    arguments, except those in `exclude`. tags(params) tags the entry, params being
+    the arguments by name. With shared=False the results stay in this process, for
+    values that are not JSON-serialisable. Cached values are shared between callers
+    and must not be modified.
+
+    A miss runs with the caller's arguments, `db` (the request's session) included.
+    A stale entry is refreshed in the background, after the request is gone, so that
+    call gets a session of its own from session_factory: by default the get_db
+    dependency, run outside of a request.
+    """
+    open_session = session_factory or asynccontextmanager(get_db)
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        takes_db = "db" in signature.parameters
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = {name: value for name, value in bound.arguments.items() if name not in exclude}
+
+            async def call():
+                return await func(*bound.args, **bound.kwargs)
+
+            async def refresh():
+                async with open_session() as db:
+                    detached = signature.bind(**{**bound.arguments, "db": db})
+                    return await func(*detached.args, **detached.kwargs)
+
+            return await get_cache().get_or_call(
+                cache_key(namespace, params), call, tuple(tags(params)) if tags else (), ttl, shared,
+                refresh if takes_db else None
+            )
+
+        return wrapper
+
+    return decorator
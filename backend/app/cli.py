@@ -0,0 +1,97 @@
+"""
+Maintenance commands.
+
+    cd backend
+    python -m app.cli snapshot export --dir /var/lib/studyai/vectors [--dtype float16] [--source-id 3 ...]
+    python -m app.cli snapshot append --dir /var/lib/studyai/vectors
+    python -m app.cli snapshot compact --dir /var/lib/studyai/vectors
+    python -m app.cli snapshot info --dir /var/lib/studyai/vectors
+
+--dir defaults to VECTOR_SNAPSHOT_DIR. Run export once, append periodically (for
+example from cron) and compact when the segments pile up.
+
+    python -m app.cli export --dir /var/lib/studyai/export [--format arrow] [--embeddings] [--source-id 3 ...]
+    python -m app.cli export --dir /var/lib/studyai/export --incremental
+
+export writes the sources and their content to --dir (see services/export.py) with an
+export.json manifest; --incremental exports only what changed since the watermark
+of the manifest found there, and --since since a given time.
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+
+from . import config
+from .database import AsyncSessionLocal, engine
+from .services.export import EXPORT_FORMATS, export_to_directory, read_manifest
+from .services.vector_snapshot import (
+    DTYPE_CODES,
+    VectorSnapshot,
+    append_snapshot,
+    compact_snapshot,
+    export_snapshot,
+)
+
+
+async def _with_session(operation):
+    try:
+        async with AsyncSessionLocal() as db:
+            return await operation(db)
+    finally:
+        await engine.dispose()
+
+
+def snapshot_command(args) -> dict:
+    directory = Path(args.dir)
+    if args.action == "export":
+        return asyncio.run(_with_session(
+            lambda db: export_snapshot(db, directory, dtype=args.dtype, source_ids=args.source_id)
+        ))
+    if args.action == "append":
+        return asyncio.run(_with_session(lambda db: append_snapshot(db, directory)))
+    if args.action == "compact":
+        return compact_snapshot(directory)
+    return VectorSnapshot(directory).info()
+
+
+def export_command(args) -> dict:
+    directory = Path(args.dir)
+    since = args.since
+    if args.incremental:
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise SystemExit(f"No export manifest in {directory} to continue from")
+        since = datetime.fromisoformat(manifest["watermark"])
+    return asyncio.run(_with_session(lambda db: export_to_directory(
+        db, directory, args.format, source_ids=args.source_id, since=since, embeddings=args.embeddings
+    )))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="memory-mapped embedding snapshots")
+    snapshot.add_argument("action", choices=["export", "append", "compact", "info"])
+    snapshot.add_argument("--dir", default=config.VECTOR_SNAPSHOT_DIR, required=not config.VECTOR_SNAPSHOT_DIR)
+    snapshot.add_argument("--dtype", choices=sorted(DTYPE_CODES), default="float32", help="export only")
+    snapshot.add_argument("--source-id", type=int, action="append", help="export only; repeatable, default all sources")
+
+    export = commands.add_parser("export", help="NDJSON or Arrow exports of sources and content")
+    export.add_argument("--dir", required=True)
+    export.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    export.add_argument("--embeddings", action="store_true", help="include embeddings as float16")
+    export.add_argument("--source-id", type=int, action="append", help="repeatable, default all sources")
+    since = export.add_mutually_exclusive_group()
+    since.add_argument("--since", type=datetime.fromisoformat, help="only rows changed at or after this time")
+    since.add_argument("--incremental", action="store_true", help="since the watermark of the last export in --dir")
+
+    args = parser.parse_args(argv)
+    command = snapshot_command if args.command == "snapshot" else export_command
+    print(json.dumps(command(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+
+# Runtime settings, read from environment variables with development defaults.
+
+def _env_flag(name: str, default: bool) -> bool:
+    """A boolean setting: "1", "true" or "yes" (in any case) turn it on, anything else off."""
+    value = os.getenv(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes")
+
+# --- Ingestion job queue ---
+
+# Number of ingestion jobs processed concurrently by each API process (0 disables the workers)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# Processes used for CPU-bound PDF work; keep this below the core count so the
+# event loop serving read endpoints always has a core to itself
+INGEST_PROCESS_POOL_SIZE = int(os.getenv("INGEST_PROCESS_POOL_SIZE", "2"))
+
+# Back-pressure: uploads are rejected with 503 once this many jobs are waiting
+INGEST_MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", "100"))
+
+# Seconds between queue polls when no local wake-up arrives (jobs enqueued by other processes)
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2.0"))
+
+# A running job not updated for this long is considered abandoned and re-queued
+INGEST_STALE_JOB_SECONDS = int(os.getenv("INGEST_STALE_JOB_SECONDS", "600"))
+
+# Give up on a job after this many attempts
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+
+# --- Database connection pools ---
+
+# API requests and ingestion use separate engines: ingestion holds connections for the
+# length of a bulk transaction, and a burst of uploads must not leave the read
+# endpoints queueing for a connection. Timeouts are seconds to wait for a free one.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Each ingestion worker holds a session for the job and briefly a second one for progress
+INGEST_DB_POOL_SIZE = int(os.getenv("INGEST_DB_POOL_SIZE", str(2 * INGEST_WORKERS + 1)))
+INGEST_DB_MAX_OVERFLOW = int(os.getenv("INGEST_DB_MAX_OVERFLOW", "4"))
+INGEST_DB_POOL_TIMEOUT = float(os.getenv("INGEST_DB_POOL_TIMEOUT", "60"))
+
+# Both pools: connections older than this (seconds) are replaced, and connections are
+# checked with a ping before use (drops after a database restart or failover)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", True)
+
+# Prepared statements cached per asyncpg connection; 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# --- Read replicas ---
+
+# Comma-separated replica URLs (same form as DATABASE_URL). API sessions send plain
+# SELECTs to a replica and everything else to the primary; empty uses only the primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# How a replica is picked for each session: "round_robin" or "least_connections"
+DB_REPLICA_POLICY = os.getenv("DB_REPLICA_POLICY", "round_robin")
+
+# Seconds between replica health checks; a replica that fails one, or lags the primary
+# by more than DB_REPLICA_MAX_LAG_SECONDS (0 disables the lag check), gets no reads
+# until it passes again
+DB_REPLICA_HEALTH_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_INTERVAL", "5"))
+DB_REPLICA_HEALTH_TIMEOUT = float(os.getenv("DB_REPLICA_HEALTH_TIMEOUT", "2"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+
+# Read-your-writes: for this many seconds after an ingest commits, this process sends
+# all reads to the primary, so a new source is visible at once (0 disables)
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "0"))
+
+# --- Uploads ---
+
+# Uploads up to this size are kept in memory and handed to PyMuPDF as bytes by the
+# worker that picks up their job; larger ones are read back from UPLOAD_DIR (0 disables).
+# The bytes are pickled into every extraction task of the process pool, so raising this
+# well past Starlette's 1MB spooling threshold costs more than reading the page cache
+UPLOAD_MEMORY_MAX_BYTES = int(os.getenv("UPLOAD_MEMORY_MAX_BYTES", str(1024 * 1024)))
+
+# Total bytes of queued uploads a process keeps in memory; beyond it jobs read from disk
+UPLOAD_MEMORY_BUDGET_BYTES = int(os.getenv("UPLOAD_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024)))
+
+# Buffer for copying a spooled upload into UPLOAD_DIR (one executor call per upload)
+UPLOAD_COPY_BUFFER_BYTES = int(os.getenv("UPLOAD_COPY_BUFFER_BYTES", str(1024 * 1024)))
+
+# Resumable uploads: default and allowed part sizes (every part but the last has exactly
+# part_size bytes) and the most parts a session may have
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+UPLOAD_MIN_PART_SIZE = int(os.getenv("UPLOAD_MIN_PART_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_PART_SIZE = int(os.getenv("UPLOAD_MAX_PART_SIZE", str(256 * 1024 * 1024)))
+UPLOAD_MAX_PARTS = int(os.getenv("UPLOAD_MAX_PARTS", "10000"))
+
+# Unfinished upload sessions untouched for this long are deleted with their parts
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+
+# Seconds between sweeps for abandoned upload sessions
+UPLOAD_GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", "900"))
+
+# --- PDF extraction ---
+
+# Pages handed to an executor worker per task; larger shards amortise opening the document
+EXTRACT_SHARD_PAGES = int(os.getenv("EXTRACT_SHARD_PAGES", "16"))
+
+# Shards in flight per executor worker; bounds the extracted text held in memory
+EXTRACT_SHARDS_PER_WORKER = int(os.getenv("EXTRACT_SHARDS_PER_WORKER", "2"))
+
+# --- Chunking ---
+
+# Bounds of the text chunks cut from documents (characters); chunks broken in running
+# text repeat the last CHUNK_OVERLAP characters of the previous chunk
+CHUNK_MIN_SIZE = int(os.getenv("CHUNK_MIN_SIZE", "200"))
+CHUNK_MAX_SIZE = int(os.getenv("CHUNK_MAX_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+
+# --- Streaming ingestion pipeline ---
+
+# Items buffered between two pipeline stages; with the persist batch this bounds peak memory
+INGEST_STAGE_BUFFER = int(os.getenv("INGEST_STAGE_BUFFER", "8"))
+
+# Sections embedded per call to the embedding backend
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+
+# Content rows flushed to the database per batch
+INGEST_PERSIST_BATCH_SIZE = int(os.getenv("INGEST_PERSIST_BATCH_SIZE", "100"))
+
+# --- Bulk persistence ---
+
+# Content rows at or above which SourceIntakeService writes with COPY instead of ORM inserts
+BULK_COPY_MIN_ROWS = int(os.getenv("BULK_COPY_MIN_ROWS", "50"))
+
+# Rows sent per copy_records_to_table call
+BULK_COPY_BATCH_SIZE = int(os.getenv("BULK_COPY_BATCH_SIZE", "5000"))
+
+# --- Batch source import (POST /sources/batch) ---
+
+# Sources saved per transaction; a failing batch is retried one source at a time
+SOURCE_BATCH_SIZE = int(os.getenv("SOURCE_BATCH_SIZE", "500"))
+
+# Largest single item (NDJSON line or array element) read from a batch body
+SOURCE_BATCH_MAX_ITEM_BYTES = int(os.getenv("SOURCE_BATCH_MAX_ITEM_BYTES", str(16 * 1024 * 1024)))
+
+# --- Embeddings ---
+
+# "hash" is a deterministic offline backend (tests, development); "openai" calls the OpenAI API
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hash")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Must match the VECTOR(768) column of knowledge_base_content
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "768"))
+
+# Micro-batching: texts from concurrent callers are sent to the backend together,
+# once EMBEDDING_BATCH_SIZE texts are waiting or after EMBEDDING_BATCH_WAIT_MS
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+EMBEDDING_MAX_CONCURRENT_BATCHES = int(os.getenv("EMBEDDING_MAX_CONCURRENT_BATCHES", "4"))
+
+# Vectors kept in the content-hash keyed cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+
+# --- Vector search ---
+
+VECTOR_SEARCH_DEFAULT_K = int(os.getenv("VECTOR_SEARCH_DEFAULT_K", "10"))
+VECTOR_SEARCH_MAX_K = int(os.getenv("VECTOR_SEARCH_MAX_K", "100"))
+
+# Index build parameters (HNSW: graph degree and build-time candidate list; IVFFlat: cluster count)
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "1000"))
+
+# In-process index for hot sources: comma-separated source ids, or "all" to load every
+# source at startup and track new ones. Searches restricted to a loaded source are
+# answered from memory instead of pgvector.
+VECTOR_INDEX_SOURCES = os.getenv("VECTOR_INDEX_SOURCES", "")
+# float32, float16 (half the memory, but slower to score where NumPy lacks fast
+# half-precision conversion) or int8 (a quarter of the memory, small recall loss)
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+
+# Directory of the memory-mapped embedding snapshot (written by `python -m app.cli
+# snapshot export`); when it exists, hot sources are loaded from it instead of the database
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "")
+
+# --- Export ---
+
+# Rows fetched per round trip of an export's server-side cursor, and written per
+# NDJSON chunk or Arrow record batch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# --- Full-text search ---
+
+# Results per page of /search/text (pages are fetched with a cursor, not an offset)
+TEXT_SEARCH_DEFAULT_LIMIT = int(os.getenv("TEXT_SEARCH_DEFAULT_LIMIT", "20"))
+TEXT_SEARCH_MAX_LIMIT = int(os.getenv("TEXT_SEARCH_MAX_LIMIT", "100"))
+
+# Language a query is parsed in when the request names none and no source_id is given
+# (see knowledge_base_text_config in models.py)
+TEXT_SEARCH_DEFAULT_LANGUAGE = os.getenv("TEXT_SEARCH_DEFAULT_LANGUAGE", "english")
+
+# --- Hybrid retrieval (/chat) ---
+
+# Hits returned, and the candidates each leg (vector, full-text) contributes to fusion
+RETRIEVAL_DEFAULT_K = int(os.getenv("RETRIEVAL_DEFAULT_K", "8"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "40"))
+
+# Reciprocal-rank fusion constant: a hit at rank r of a leg scores 1 / (RETRIEVAL_RRF_K + r)
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+# Per-query latency budget; legs still running then are cancelled and the hits of the
+# others are returned, marked partial
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "100"))
+
+# --- Question bank ---
+
+# Generator of the practice questions served by /questions: "template" (offline,
+# deterministic cloze questions) or "openai" (QUESTION_MODEL)
+QUESTION_GENERATOR = os.getenv("QUESTION_GENERATOR", "template")
+QUESTION_MODEL = os.getenv("QUESTION_MODEL", "gpt-4o-mini")
+QUESTIONS_PER_SECTION = int(os.getenv("QUESTIONS_PER_SECTION", "3"))
+
+# Generate the questions of a source when its ingestion job finishes
+QUESTIONS_AT_INGEST = _env_flag("QUESTIONS_AT_INGEST", True)
+
+# Sections generated at once, and written per transaction, by a refresh
+QUESTION_GENERATION_CONCURRENCY = int(os.getenv("QUESTION_GENERATION_CONCURRENCY", "4"))
+QUESTION_REFRESH_BATCH = int(os.getenv("QUESTION_REFRESH_BATCH", "100"))
+
+# Questions per page of /questions
+QUESTIONS_DEFAULT_LIMIT = int(os.getenv("QUESTIONS_DEFAULT_LIMIT", "20"))
+QUESTIONS_MAX_LIMIT = int(os.getenv("QUESTIONS_MAX_LIMIT", "100"))
+
+# --- Response cache ---
+
+# Cache of the read endpoints (see app/cache.py): entries are fresh for
+# CACHE_TTL_SECONDS, then served for CACHE_STALE_SECONDS more while being refreshed.
+# Writes to a source invalidate its entries straight away.
+CACHE_ENABLED = _env_flag("CACHE_ENABLED", True)
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_STALE_SECONDS = float(os.getenv("CACHE_STALE_SECONDS", "60"))
+
+# Bounds of the in-process LRU: entries, and total size of their values (JSON bytes)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Redis-compatible server shared by the API processes (e.g. redis://localhost:6379/0),
+# needs the redis package; empty keeps the cache in-process
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+
+# --- Profiling ---
+
+# Requests asking for it (X-Profile: 1 header or ?profile=1) run under the sampling
+# profiler and answer with an X-Profile-Id header; uploads profiled this way also
+# profile their ingestion job (see GET /jobs/{job_id})
+PROFILING_ENABLED = _env_flag("PROFILING_ENABLED", False)
+
+# Always-on sampling: one request in PROFILE_SAMPLE_EVERY is profiled (0 disables), and
+# its profile kept when it took at least PROFILE_SLOW_SECONDS
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "1.0"))
+
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Where profiles are written (collapsed stacks, one file each); the oldest are deleted
+# beyond PROFILE_MAX_FILES
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
@@ -1,7 +1,20 @@
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+from pgvector.utils import from_db, from_db_binary, to_db_binary
+from sqlalchemy import event, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import Select
+
+from . import config
+from .metrics import observe_query
 
 # Get database URL from environment variable or use default
 DATABASE_URL = os.getenv(
@@ -9,13 +22,304 @@ DATABASE_URL = os.getenv(
     "postgresql+asyncpg://postgres:postgres@db:5432/studyai"
 )
 
-# Create SQLAlchemy async engine
-engine = create_async_engine(DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the connection wait histogram buckets
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+@dataclass
+class PoolMetrics:
+    """Checkout counters of one connection pool, with a histogram of the time spent waiting."""
+    waiting: int = 0  # checkouts in progress: waiting for a free connection or opening one
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_seconds: float = 0.0
+    # Cumulative counts per POOL_WAIT_BUCKETS bound, plus one for waits above the last
+    wait_buckets: List[int] = field(default_factory=lambda: [0] * (len(POOL_WAIT_BUCKETS) + 1))
+
+    def observe_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds += seconds
+        self.wait_buckets[bisect_left(POOL_WAIT_BUCKETS, seconds)] += 1
+
+    def histogram(self) -> Dict[str, int]:
+        """Cumulative counts keyed by upper bound, "+Inf" last (Prometheus style)."""
+        counts, total = {}, 0
+        for bound, count in zip(POOL_WAIT_BUCKETS + ("+Inf",), self.wait_buckets):
+            total += count
+            counts[str(bound)] = total
+        return counts
+
+class MeteredPoolMixin:
+    """
+    Records every checkout of a pool in its class's `metrics`. Engines get their own
+    subclass (see metered_pool_class), so the metrics survive Pool.recreate() on dispose.
+    """
+    metrics: PoolMetrics
+
+    def connect(self):
+        metrics = self.metrics
+        metrics.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        finally:
+            metrics.waiting -= 1
+            metrics.observe_wait(time.perf_counter() - started)
+
+def metered_pool_class(name: str, base=AsyncAdaptedQueuePool) -> type:
+    return type(f"{name.title()}Pool", (MeteredPoolMixin, base), {"metrics": PoolMetrics()})
+
+def make_engine(
+    name: str,
+    pool_size: int,
+    max_overflow: int,
+    pool_timeout: float,
+    url: str = DATABASE_URL
+) -> AsyncEngine:
+    """An async engine with its own metered connection pool (see pool_metrics)."""
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["statement_cache_size"] = config.DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        poolclass=metered_pool_class(name),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+
+# Engine for API requests: reads and short writes that users wait on
+engine = make_engine("serving", config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW, config.DB_POOL_TIMEOUT)
+
+# Engine for ingestion (workers, bulk writes, upload cleanup), whose long transactions
+# must not take connections from the API
+ingest_engine = make_engine(
+    "ingest", config.INGEST_DB_POOL_SIZE, config.INGEST_DB_MAX_OVERFLOW, config.INGEST_DB_POOL_TIMEOUT
+)
+
+# Read replicas (DATABASE_REPLICA_URLS), sized like the serving pool
+replica_engines = [
+    make_engine(f"replica{number}", config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW, config.DB_POOL_TIMEOUT, url)
+    for number, url in enumerate(config.DATABASE_REPLICA_URLS, start=1)
+]
+
+ENGINES = {
+    "serving": engine,
+    "ingest": ingest_engine,
+    **{f"replica-{number}": replica for number, replica in enumerate(replica_engines, start=1)},
+}
+
+# Seconds a replica is behind the primary: 0 once it replayed all the WAL it received,
+# and for a server that is not in recovery (a stand-in replica in development)
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class ReplicaSet:
+    """
+    Picks the replica each routing session reads from (see RoutingSession).
+
+    Replicas are health-checked every health_interval seconds once start() was
+    called: one that does not answer within health_timeout, or lags the primary by
+    more than max_lag_seconds, gets no new sessions until a later check passes. With
+    no healthy replica, reads fall back to the primary. For read_your_writes_seconds
+    after note_write(), every read goes to the primary.
+    """
+
+    POLICIES = ("round_robin", "least_connections")
+
+    def __init__(
+        self,
+        engines: Sequence[AsyncEngine],
+        policy: str = config.DB_REPLICA_POLICY,
+        health_interval: float = config.DB_REPLICA_HEALTH_INTERVAL,
+        health_timeout: float = config.DB_REPLICA_HEALTH_TIMEOUT,
+        max_lag_seconds: float = config.DB_REPLICA_MAX_LAG_SECONDS,
+        read_your_writes_seconds: float = config.DB_READ_YOUR_WRITES_SECONDS
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown replica policy {policy!r}, expected one of {', '.join(self.POLICIES)}")
+        self.engines = list(engines)
+        self.policy = policy
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_lag_seconds = max_lag_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.healthy = [True] * len(self.engines)
+        self._next = 0
+        self._last_write: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """The replica a new session should read from, or None for the primary."""
+        if self._last_write is not None and time.monotonic() - self._last_write < self.read_your_writes_seconds:
+            return None
+        candidates = [replica for replica, healthy in zip(self.engines, self.healthy) if healthy]
+        if not candidates:
+            return None
+        if self.policy == "least_connections":
+            return min(candidates, key=lambda replica: replica.pool.checkedout())
+        self._next += 1
+        return candidates[self._next % len(candidates)]
+
+    def note_write(self) -> None:
+        """An ingest committed: open the read-your-writes window (when enabled)."""
+        if self.read_your_writes_seconds > 0:
+            self._last_write = time.monotonic()
+
+    async def check(self, replica: AsyncEngine) -> bool:
+        try:
+            lag = await asyncio.wait_for(self._lag(replica), self.health_timeout)
+        except Exception as e:
+            logger.warning("Replica %s failed its health check: %s", replica.url.host, e)
+            return False
+        if self.max_lag_seconds and lag > self.max_lag_seconds:
+            logger.warning("Replica %s is %.1fs behind the primary", replica.url.host, lag)
+            return False
+        return True
+
+    async def _lag(self, replica: AsyncEngine) -> float:
+        async with replica.connect() as conn:
+            return float((await conn.execute(REPLICA_LAG_QUERY)).scalar_one())
 
-# Create async session factory
+    async def check_all(self) -> List[bool]:
+        self.healthy = list(await asyncio.gather(*(self.check(replica) for replica in self.engines)))
+        return self.healthy
+
+    async def start(self) -> None:
+        if self._task is None and self.engines and self.health_interval > 0:
+            self._task = asyncio.create_task(self._run(), name="replica-health-checks")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_interval)
+
+replicas = ReplicaSet(replica_engines)
+
+def _reads_only(clause, read_only: bool) -> bool:
+    # Text statements are only routed when the caller vouches for them with
+    # bind_arguments={"read_only": True}; SELECT ... FOR UPDATE needs the primary
+    return read_only or (isinstance(clause, Select) and clause._for_update_arg is None)
+
+class RoutingSession(Session):
+    """
+    Session of the API engine that sends reads to a replica and writes to the primary.
+
+    A plain SELECT goes to the replica picked by `replicas` for this session (one
+    replica per session, so its reads are consistent with each other). Anything else
+    (flushes, DML, text statements not marked read_only) goes to the primary, and
+    from then on so does every read of the session, so it sees its own writes.
+    Without replicas this behaves like a plain Session on the primary.
+    """
+
+    def __init__(self, *args, replica_set: Optional[ReplicaSet] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica_set = replica_set if replica_set is not None else replicas
+
+    def get_bind(self, mapper=None, clause=None, read_only: bool = False, **kwargs):
+        if not self.info.get("primary") and not self._flushing and _reads_only(clause, read_only):
+            if "replica" not in self.info:
+                self.info["replica"] = self.replica_set.choose()
+            if self.info["replica"] is not None:
+                return self.info["replica"].sync_engine
+        else:
+            self.info["primary"] = True
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+def _encode_vector(value):
+    # The ORM's Vector type binds vectors as '[1.0,2.0]' strings; bulk COPY passes lists or arrays
+    if isinstance(value, str):
+        value = from_db(value)
+    return to_db_binary(value)
+
+async def _register_vector_codec(connection):
+    try:
+        await connection.set_type_codec(
+            'vector', encoder=_encode_vector, decoder=from_db_binary, format='binary'
+        )
+    except ValueError:
+        # The vector extension has not been created in this database yet
+        logger.warning("pgvector type not found, vectors will use text format")
+
+def register_vector_codec(dbapi_connection, connection_record):
+    """
+    Give every asyncpg connection a binary codec for pgvector's vector type.
+    Binary vectors are what makes COPY of the embedding column possible, and they
+    are also smaller on the wire than the text form.
+    """
+    if engine.dialect.driver == "asyncpg":
+        dbapi_connection.run_async(_register_vector_codec)
+
+def instrument_queries(name: str, query_engine: AsyncEngine) -> None:
+    """Time every statement of an engine for /metrics (see metrics.observe_query)."""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe_query(name, time.perf_counter() - conn.info["query_started"].pop())
+
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    event.listen(query_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(query_engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(query_engine.sync_engine, "handle_error", handle_error)
+
+for _name, _engine in ENGINES.items():
+    event.listen(_engine.sync_engine, "connect", register_vector_codec)
+    instrument_queries(_name, _engine)
+
+# Create async session factories; API sessions read from the replicas, if any
 AsyncSessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
+    engine, class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False
 )
+IngestSessionLocal = sessionmaker(
+    ingest_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+def pool_metrics() -> Dict[str, dict]:
+    """Per-engine pool state: configured size, connections in use, waiters and wait times."""
+    snapshot = {}
+    for name, pool_engine in ENGINES.items():
+        pool = pool_engine.pool
+        metrics = pool.metrics
+        snapshot[name] = {
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "waiting": metrics.waiting,
+            "checkouts": metrics.checkouts,
+            "timeouts": metrics.timeouts,
+            "wait_seconds": round(metrics.wait_seconds, 6),
+            "mean_wait_ms": round(metrics.wait_seconds / metrics.checkouts * 1000, 3) if metrics.checkouts else None,
+            "wait_seconds_histogram": metrics.histogram(),
+        }
+    for number, healthy in enumerate(replicas.healthy, start=1):
+        snapshot[f"replica-{number}"]["healthy"] = healthy
+    return snapshot
+
+async def dispose_engines():
+    for pool_engine in ENGINES.values():
+        await pool_engine.dispose()
 
 # Create base class for models
 Base = declarative_base()
@@ -28,4 +332,15 @@ async def get_db():
         try:
             yield session
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close() 
+
+async def get_ingest_db():
+    """
+    Dependency for endpoints that write uploads and bulk content: a session from the
+    ingestion pool, so they cannot starve the read endpoints of connections.
+    """
+    async with IngestSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -1,17 +1,36 @@
-from fastapi import FastAPI, Depends, UploadFile, File, HTTPException
+from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-import os
-from typing import List
+from pydantic import BaseModel
+import hashlib
+import logging
+from typing import List, Optional
 
-from .database import get_db, engine, Base
+from . import config
+from .cache import get_cache
+from .database import get_db, get_ingest_db, engine, Base, AsyncSessionLocal, dispose_engines, pool_metrics, replicas
 from . import models
-from .routers import sources
-from .services.document_processor import DocumentProcessor
-from .services.source_intake import InformationSource
+from .metrics import REGISTRY, MetricsMiddleware, observe_cache, observe_jobs, observe_pools
+from .profiling import ProfilingMiddleware
+from .routers import jobs, profiles, questions, search, sources, uploads
+from .services.deduplication import get_stored_embeddings
+from .services.document_processor import stage_upload
+from .services.embeddings import get_embedding_service
+from .services.hybrid_search import HybridSearchService
+from .services.ingestion_jobs import IngestionJobService, IngestionQueueFull, get_ingestion_workers, submit_upload
+from .services.resumable_uploads import UploadSessionCollector
+from .services.vector_index import load_configured_sources
 
 app = FastAPI(title="Study AI API")
 
+logger = logging.getLogger(__name__)
+
+# Background workers that drain the ingestion job queue
+ingestion_workers = get_ingestion_workers()
+
+# Deletes resumable uploads that were abandoned before completion
+upload_collector = UploadSessionCollector()
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -21,18 +40,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Requests that ask for it (X-Profile header, profile query flag) and a sample of the
+# rest run under the sampling profiler; see GET /profiles/{profile_id}
+if config.PROFILING_ENABLED or config.PROFILE_SAMPLE_EVERY > 0:
+    app.add_middleware(ProfilingMiddleware)
+
+# Request latency and database query counts per route, for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Create database tables
 @app.on_event("startup")
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+@app.on_event("startup")
+async def load_vector_index():
+    # Hot sources (VECTOR_INDEX_SOURCES) are searched from memory
+    async with AsyncSessionLocal() as db:
+        await load_configured_sources(db)
+
+@app.on_event("startup")
+async def start_ingestion_workers():
+    await ingestion_workers.start()
+
+@app.on_event("shutdown")
+async def stop_ingestion_workers():
+    await ingestion_workers.stop()
+
+@app.on_event("startup")
+async def start_upload_collector():
+    await upload_collector.start()
+
+@app.on_event("shutdown")
+async def stop_upload_collector():
+    await upload_collector.stop()
+
+@app.on_event("startup")
+async def start_replica_health_checks():
+    await replicas.start()
+
+@app.on_event("shutdown")
+async def stop_replica_health_checks():
+    await replicas.stop()
+
+@app.on_event("startup")
+async def start_cache():
+    await get_cache().start()
+
+@app.on_event("shutdown")
+async def stop_cache():
+    await get_cache().stop()
+
+@app.on_event("shutdown")
+async def close_database_pools():
+    await dispose_engines()
+
 # Include routers
 app.include_router(sources.router)
+app.include_router(jobs.router)
+app.include_router(search.router)
+app.include_router(uploads.router)
+app.include_router(profiles.router)
+app.include_router(questions.router)
 
 @app.get("/")
 def read_root():
-    print("--- Root endpoint '/' was hit ---")
     return {"message": "Simple test response"}
 
 @app.get("/health")
@@ -40,101 +113,127 @@ def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
 
-@app.post("/upload")
+@app.get("/embeddings/metrics")
+def embedding_metrics():
+    """Embedding service counters: batch sizes, cache hit rate and throughput."""
+    return {
+        **get_embedding_service().metrics.snapshot(),
+        "reused_from_database": get_stored_embeddings().metrics.reused,
+    }
+
+@app.get("/metrics")
+async def metrics(db: AsyncSession = Depends(get_db)):
+    """
+    Metrics in the Prometheus text format: request latency and database queries per
+    route, query durations, ingestion stage timings, job counts and pool usage.
+    """
+    observe_pools(pool_metrics())
+    observe_cache(get_cache().stats())
+    try:
+        counts = await IngestionJobService(db).status_counts()
+        observe_jobs((status, counts.get(status, 0)) for status in ("queued", "running", "succeeded", "failed"))
+    except Exception:
+        # The process metrics are still worth serving while the database is unreachable
+        logger.exception("Could not count ingestion jobs")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/metrics")
+def cache_metrics():
+    """
+    Response cache counters: hits (fresh, stale, from the shared backend), misses,
+    misses coalesced into one call, evictions, expirations and invalidations.
+    """
+    return get_cache().stats()
+
+@app.get("/database/pools")
+def database_pools():
+    """
+    Connection pools of the serving, ingestion and replica engines: connections
+    checked out, checkouts waiting, timeouts and a histogram of the time spent
+    waiting; replicas also report whether they passed their last health check.
+    """
+    return pool_metrics()
+
+@app.post("/upload", status_code=202)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_ingest_db)
 ):
     """
-    Upload and process a document (currently supports PDF).
+    Upload a document (currently supports PDF) for background processing.
     
     The document will be:
-    1. Saved temporarily
-    2. Processed into chunks
-    3. Each chunk will be saved as a KnowledgeBaseContent
-    4. The document metadata will be saved as a KnowledgeBaseSource
+    1. Saved to the upload directory, hashed (sha256) while it is written; small
+       files are also kept in memory for the worker (UPLOAD_MEMORY_MAX_BYTES)
+    2. Queued as an ingestion job, whose id is returned immediately
+    
+    The ingestion workers then process it into chunks and save it as a
+    KnowledgeBaseSource with its KnowledgeBaseContent. Poll GET /jobs/{job_id}
+    for progress.
+    
+    A file identical to one already ingested is not processed again: the response
+    (200, status "duplicate") carries the existing source_id. One identical to a
+    file still waiting or being processed returns that job's id.
+    
+    Very large files can be sent resumably, in parallel parts, through /uploads.
+    
+    With PROFILING_ENABLED, an upload sent with an X-Profile: 1 header (or ?profile=1)
+    is profiled, and so is its ingestion job: the response carries the request's
+    X-Profile-Id header and the job's profile_id (see GET /profiles/{profile_id}).
     """
+    # Validate file type
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are currently supported")
+    
+    service = IngestionJobService(db)
     try:
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are currently supported")
+        # Reject before writing anything to disk when the queue is full
+        await service.ensure_capacity()
         
-        # Initialize document processor
-        processor = DocumentProcessor()
-        
-        # Save uploaded file temporarily
-        temp_path = await processor.save_upload_file(file)
-        
-        try:
-            # Process the document
-            chunks = await processor.process_file(temp_path, 'pdf')
-            
-            if not chunks:
-                raise HTTPException(status_code=400, detail="Could not extract content from PDF")
-            
-            # Create a source from the first chunk's metadata
-            first_chunk = chunks[0]
-            metadata = first_chunk.metadata
-            
-            source = InformationSource(
-                name=metadata.get('title', file.filename),
-                source=metadata.get('creator', 'PDF Upload'),
-                source_description=metadata.get('subject', ''),
-                source_type='pdf_document',
-                author=metadata.get('author', ''),
-                publisher=metadata.get('producer', ''),
-                publication_date=None,  # Could parse creation_date if needed
-                license=None,
-                language='en',  # Could use langdetect here
-                url='',  # Local upload
-                content_text=first_chunk.content,
-                content_type='document'
-            )
-            
-            # Create sections for remaining chunks
-            source.sections = [
-                InformationSource(
-                    name=f"Page {chunk.page_number} - Chunk {chunk.chunk_number}",
-                    source=source.source,
-                    source_description=f"Extracted from page {chunk.page_number}",
-                    source_type=source.source_type,
-                    author=source.author,
-                    publisher=source.publisher,
-                    publication_date=source.publication_date,
-                    license=source.license,
-                    language=source.language,
-                    url=source.url,
-                    content_text=chunk.content,
-                    content_type='section'
-                )
-                for chunk in chunks[1:]
-            ]
-            
-            # Save to database using existing service
-            from .services.source_intake import SourceIntakeService
-            service = SourceIntakeService(db)
-            result = await service.process_source(source)
-            
-            return {
-                "status": "success",
-                "message": "Document processed successfully",
-                "source_id": result.source_id,
-                "chunks_processed": len(chunks)
-            }
-            
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_path)
-            
+        digest = hashlib.sha256()
+        staged = await stage_upload(file, digest)
+        status_code, body = await submit_upload(
+            db, file.filename, staged.path, digest.hexdigest(), staged.data
+        )
+    except IngestionQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    response.status_code = status_code
+    return body
+
+class ChatRequest(BaseModel):
+    message: str
+    source_id: Optional[int] = None  # only retrieve from this source
+    content_type: Optional[str] = None
+    k: int = config.RETRIEVAL_DEFAULT_K
 
 @app.post("/chat")
-async def chat(db: AsyncSession = Depends(get_db)):
-    """Chat with the AI about uploaded documents."""
-    return {"status": "success", "message": "Chat response"}
-
-@app.get("/questions")
-async def get_questions(db: AsyncSession = Depends(get_db)):
-    """Get generated questions about uploaded documents."""
-    return {"status": "success", "questions": ["Sample question 1?", "Sample question 2?"]} 
\ No newline at end of file
+async def chat(request: ChatRequest):
+    """
+    Chat with the AI about uploaded documents.
+
+    The message retrieves the k most relevant passages, each with its enclosing
+    section: vector and full-text search run concurrently and are fused by reciprocal
+    rank (see HybridSearchService). The searches are bounded by RETRIEVAL_BUDGET_MS;
+    when one does not finish in time or fails, "partial" is true and the context
+    comes from the other.
+    """
+    try:
+        retrieval = await HybridSearchService().retrieve(
+            request.message, k=request.k, source_id=request.source_id, content_type=request.content_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "status": "success",
+        "message": "Chat response",
+        "context": [hit.to_dict() for hit in retrieval.hits],
+        "partial": retrieval.partial,
+    } 
\ No newline at end of file
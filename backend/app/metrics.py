@@ -0,0 +1,379 @@
+"""
+Process metrics in the Prometheus text exposition format, served by GET /metrics.
+
+Counters and histograms are plain Python objects updated on the event loop thread
+(extraction workers and other threads report through their awaiting coroutine), so
+recording a sample is a dict lookup and a few additions, without locks. Hot paths
+hold on to the series of their labels (Counter.cell, Histogram.series) and skip the
+lookup too, which keeps MetricsMiddleware to a couple of microseconds per request
+(see benchmarks/bench_metrics_overhead.py).
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets (seconds) for requests and ingestion stages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class _Cell:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._cells: Dict[Tuple[str, ...], _Cell] = {}
+
+    def cell(self, *label_values: str) -> _Cell:
+        """The value holder of one label set; add to its `value` to count."""
+        cell = self._cells.get(label_values)
+        if cell is None:
+            cell = self._cells[label_values] = _Cell()
+        return cell
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.cell(*label_values).value += amount
+
+    def value(self, *label_values: str) -> float:
+        cell = self._cells.get(label_values)
+        return cell.value if cell else 0
+
+    def samples(self) -> Iterator[str]:
+        for label_values, cell in sorted(self._cells.items()):
+            yield f"{self.name}{_labels(self.label_names, label_values)} {_number(cell.value)}"
+
+
+class Gauge(Metric):
+    """A value set when it is known, e.g. refreshed right before each scrape."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def value(self, *label_values: str) -> Optional[float]:
+        return self._values.get(label_values)
+
+    def samples(self) -> Iterator[str]:
+        for label_values, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}"
+
+
+class _Series:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """Observations counted per bucket (upper bounds, plus +Inf) with their sum."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def series(self, *label_values: str) -> _Series:
+        """The buckets of one label set; call its observe(value) to record."""
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = _Series(self.buckets)
+        return series
+
+    def observe(self, value: float, *label_values: str) -> None:
+        self.series(*label_values).observe(value)
+
+    def set_series(self, label_values: Tuple[str, ...], counts: List[int], total: float) -> None:
+        """Replace a series with counts kept elsewhere (non-cumulative, one per bucket plus +Inf)."""
+        series = self._series[label_values] = _Series(self.buckets)
+        series.counts = list(counts)
+        series.sum = total
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series.counts) if series else 0
+
+    def total(self, *label_values: str) -> float:
+        series = self._series.get(label_values)
+        return series.sum if series else 0.0
+
+    def samples(self) -> Iterator[str]:
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series.counts):
+                cumulative += count
+                le = 'le="' + bound + '"'
+                yield f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}"
+            labels = _labels(self.label_names, label_values)
+            yield f"{self.name}_sum{labels} {_number(series.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Requests ---
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to handle a request, by route template.", ("method", "route")
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Requests handled, by route template and status code.", ("method", "route", "status")
+)
+HTTP_REQUEST_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "Database queries run while handling a request.", ("route",), COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds", "Time spent in database queries while handling a request.", ("route",)
+)
+
+# --- Database ---
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_duration_seconds", "Duration of database queries, by engine.", ("engine",), QUERY_BUCKETS
+)
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "db_pool_connections", "Connections of each pool, by state (checked_out, idle, waiting).", ("pool", "state")
+)
+DB_POOL_SIZE = REGISTRY.gauge("db_pool_size", "Configured size of each connection pool.", ("pool",))
+DB_POOL_TIMEOUTS = REGISTRY.gauge("db_pool_timeouts", "Checkouts that timed out, per pool.", ("pool",))
+# Buckets are database.POOL_WAIT_BUCKETS (not imported: database imports this module)
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection.", ("pool",),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+# --- Ingestion ---
+
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "ingest_stage_duration_seconds",
+    "Time spent per ingestion stage (save, extract, chunk, embed, persist, questions), per call.",
+    ("stage",)
+)
+INGEST_JOBS = REGISTRY.gauge("ingest_jobs", "Ingestion jobs by status.", ("status",))
+
+# --- Response cache ---
+
+CACHE_EVENTS = REGISTRY.gauge(
+    "cache_events", "Response cache lookups and removals since start, by event (hits, misses, evictions, ...).",
+    ("event",)
+)
+CACHE_ENTRIES = REGISTRY.gauge("cache_entries", "Entries in the in-process response cache.")
+CACHE_BYTES = REGISTRY.gauge("cache_bytes", "Size of the values in the in-process response cache.")
+
+
+class RequestStats:
+    """Database work of the request being handled (see MetricsMiddleware)."""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def observe_query(engine_name: str, seconds: float) -> None:
+    DB_QUERY_SECONDS.observe(seconds, engine_name)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += seconds
+
+
+def observe_pools(pools: Dict[str, dict]) -> None:
+    """Copy a database.pool_metrics() snapshot into the pool gauges and wait histogram."""
+    for name, pool in pools.items():
+        DB_POOL_SIZE.set(pool["size"], name)
+        DB_POOL_TIMEOUTS.set(pool["timeouts"], name)
+        for state in ("checked_out", "idle", "waiting"):
+            DB_POOL_CONNECTIONS.set(pool[state], name, state)
+        cumulative = list(pool["wait_seconds_histogram"].values())
+        counts = [count - previous for count, previous in zip(cumulative, [0] + cumulative[:-1])]
+        DB_POOL_WAIT_SECONDS.set_series((name,), counts, pool["wait_seconds"])
+
+
+def observe_cache(stats: dict) -> None:
+    """Copy a Cache.stats() snapshot into the cache gauges."""
+    for event in ("hits", "stale_hits", "shared_hits", "misses", "coalesced", "evictions", "expirations",
+                  "invalidations", "errors"):
+        CACHE_EVENTS.set(stats[event], event)
+    CACHE_ENTRIES.set(stats["entries"])
+    CACHE_BYTES.set(stats["bytes"])
+
+
+def observe_jobs(counts: Iterable[Tuple[str, int]]) -> None:
+    for status, count in counts:
+        INGEST_JOBS.set(count, status)
+
+
+class _RouteMetrics:
+    """The series one (method, route) records into, resolved once."""
+    __slots__ = ("method", "route", "latency", "queries", "query_seconds", "statuses")
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.latency = HTTP_REQUEST_SECONDS.series(method, route)
+        self.queries = HTTP_REQUEST_DB_QUERIES.series(route)
+        self.query_seconds = HTTP_REQUEST_DB_SECONDS.series(route)
+        self.statuses: Dict[int, _Cell] = {}
+
+    def status(self, status: int) -> _Cell:
+        cell = self.statuses.get(status)
+        if cell is None:
+            cell = self.statuses[status] = HTTP_REQUESTS.cell(self.method, self.route, str(status))
+        return cell
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled with its route template
+    ("/sources/{source_id}/tree", not the raw path, to keep the number of series
+    bounded) and counting the database queries it ran.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Tuple[str, object], _RouteMetrics] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            current_request.reset(token)
+            # The router leaves the matched endpoint in the scope
+            key = (scope["method"], scope.get("endpoint"))
+            route = self._routes.get(key)
+            if route is None:
+                route = self._routes[key] = _RouteMetrics(key[0], self._template(scope))
+            route.latency.observe(elapsed)
+            route.status(status).value += 1
+            route.queries.observe(stats.queries)
+            route.query_seconds.observe(stats.seconds)
+
+    def _template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is not None:
+            for candidate in getattr(scope.get("app"), "routes", ()):
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    return candidate.path
+        return "unmatched"
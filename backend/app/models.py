@@ -1,10 +1,28 @@
-from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import DDL, BigInteger, Column, Computed, Integer, String, Text, Date, DateTime, ForeignKey, Index, event, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.types import UserDefinedType
 from pgvector.sqlalchemy import Vector
 
 from .database import Base
 
 
+class RegConfig(UserDefinedType):
+    """Postgres regconfig: a text search configuration such as 'english' or 'simple'."""
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "REGCONFIG"
+
+
+# Full-text document of a content row: its title (weight A) and text (weight B),
+# parsed with the text search configuration of its source's language
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector(coalesce(search_config, 'simple'), coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector(coalesce(search_config, 'simple'), coalesce(content, '')), 'B')"
+)
+
+
 class KnowledgeBaseSource(Base):
     __tablename__ = "knowledge_base_sources"
     
@@ -29,14 +47,50 @@ class KnowledgeBaseContent(Base):
     __tablename__ = "knowledge_base_content"
     
     content_id = Column(Integer, primary_key=True, index=True)
-    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="CASCADE"))
-    parent_content_id = Column(Integer, ForeignKey("knowledge_base_content.content_id", ondelete="CASCADE"), nullable=True)
+    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="CASCADE"), index=True)
+    parent_content_id = Column(Integer, ForeignKey("knowledge_base_content.content_id", ondelete="CASCADE"), nullable=True, index=True)
+    # Materialised path of content ids from the root, e.g. "12/40/41/"; filled in by
+    # the knowledge_base_content_path trigger when not provided (see CONTENT_PATH_DDL)
+    path = Column(Text)
     title = Column(String(255))
     content = Column(Text)
-    content_type = Column(String(50))
+    content_type = Column(String(50), index=True)
+    # Whitespace-normalised sha256 of content (embeddings.content_hash), used to reuse
+    # the embedding of identical text instead of computing it again
+    content_hash = Column(String(64), index=True)
     embedding = Column(Vector(768))
+    # Text search configuration of the source's language, filled in by the
+    # knowledge_base_content_search_config trigger (see TEXT_SEARCH_DDL), and the
+    # generated document searched by /search/text; neither is loaded with the row
+    search_config = deferred(Column(RegConfig))
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True)))
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Indexed for incremental exports (services/export.py)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
+    
+    __table_args__ = (
+        # Approximate nearest-neighbour index for cosine similarity search;
+        # see services/vector_search.py to rebuild it with other parameters or as IVFFlat
+        Index(
+            "idx_knowledge_base_content_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ),
+        # Descendant queries are prefix matches on the path
+        Index(
+            "ix_knowledge_base_content_path",
+            "path",
+            postgresql_ops={"path": "text_pattern_ops"}
+        ),
+        # Full-text search (@@ on search_vector)
+        Index(
+            "ix_knowledge_base_content_search_vector",
+            "search_vector",
+            postgresql_using="gin"
+        ),
+    )
     
     # Relationships
     source = relationship("KnowledgeBaseSource", back_populates="contents")
@@ -44,6 +98,117 @@ class KnowledgeBaseContent(Base):
     tags = relationship("Tag", secondary="content_tags", back_populates="contents")
 
 
+# Keeps knowledge_base_content.path in sync with parent_content_id: a new row without
+# a path gets its parent's path plus its own id, and re-parenting a row rewrites the
+# paths of its whole subtree. Also in init-db.sh. (% is doubled for DDL formatting.)
+CONTENT_PATH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION knowledge_base_content_set_path() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' AND NEW.path IS NOT NULL THEN
+            RETURN NEW;
+        END IF;
+        NEW.path := COALESCE(
+            (SELECT path FROM knowledge_base_content WHERE content_id = NEW.parent_content_id), ''
+        ) || NEW.content_id || '/';
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER knowledge_base_content_path
+        BEFORE INSERT OR UPDATE OF parent_content_id ON knowledge_base_content
+        FOR EACH ROW EXECUTE FUNCTION knowledge_base_content_set_path()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION knowledge_base_content_move_subtree() RETURNS trigger AS $$
+    BEGIN
+        UPDATE knowledge_base_content
+        SET path = NEW.path || substr(path, length(OLD.path) + 1)
+        WHERE path LIKE OLD.path || '%%' AND content_id <> NEW.content_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER knowledge_base_content_move
+        AFTER UPDATE OF parent_content_id ON knowledge_base_content
+        FOR EACH ROW WHEN (OLD.path IS DISTINCT FROM NEW.path)
+        EXECUTE FUNCTION knowledge_base_content_move_subtree()
+    """,
+]
+
+# Text search configuration for a source language: an ISO 639-1 code ("en", "pt-BR")
+# or the name of a configuration ("english"); 'simple' (no stemming, no stop words)
+# when Postgres has none for it. Content rows take their source's configuration when
+# inserted, and again when the source's language changes. Also in init-db.sh.
+TEXT_SEARCH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION knowledge_base_text_config(language TEXT) RETURNS regconfig AS $$
+        SELECT COALESCE(
+            (
+                SELECT oid::regconfig FROM pg_ts_config
+                WHERE cfgname = CASE lower(split_part(language, '-', 1))
+                    WHEN 'ar' THEN 'arabic' WHEN 'hy' THEN 'armenian' WHEN 'eu' THEN 'basque'
+                    WHEN 'ca' THEN 'catalan' WHEN 'da' THEN 'danish' WHEN 'nl' THEN 'dutch'
+                    WHEN 'en' THEN 'english' WHEN 'fi' THEN 'finnish' WHEN 'fr' THEN 'french'
+                    WHEN 'de' THEN 'german' WHEN 'el' THEN 'greek' WHEN 'hi' THEN 'hindi'
+                    WHEN 'hu' THEN 'hungarian' WHEN 'id' THEN 'indonesian' WHEN 'ga' THEN 'irish'
+                    WHEN 'it' THEN 'italian' WHEN 'lt' THEN 'lithuanian' WHEN 'ne' THEN 'nepali'
+                    WHEN 'no' THEN 'norwegian' WHEN 'nb' THEN 'norwegian' WHEN 'pt' THEN 'portuguese'
+                    WHEN 'ro' THEN 'romanian' WHEN 'ru' THEN 'russian' WHEN 'sr' THEN 'serbian'
+                    WHEN 'es' THEN 'spanish' WHEN 'sv' THEN 'swedish' WHEN 'ta' THEN 'tamil'
+                    WHEN 'tr' THEN 'turkish' WHEN 'yi' THEN 'yiddish'
+                    ELSE lower(language)
+                END
+            ),
+            'simple'::regconfig
+        )
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION knowledge_base_content_set_search_config() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.search_config IS NULL THEN
+            NEW.search_config := knowledge_base_text_config(
+                (SELECT language FROM knowledge_base_sources WHERE source_id = NEW.source_id)
+            );
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER knowledge_base_content_search_config
+        BEFORE INSERT ON knowledge_base_content
+        FOR EACH ROW EXECUTE FUNCTION knowledge_base_content_set_search_config()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION knowledge_base_sources_update_search_config() RETURNS trigger AS $$
+    BEGIN
+        UPDATE knowledge_base_content
+        SET search_config = knowledge_base_text_config(NEW.language)
+        WHERE source_id = NEW.source_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER knowledge_base_sources_search_config
+        AFTER UPDATE OF language ON knowledge_base_sources
+        FOR EACH ROW WHEN (OLD.language IS DISTINCT FROM NEW.language)
+        EXECUTE FUNCTION knowledge_base_sources_update_search_config()
+    """,
+]
+
+for statement in CONTENT_PATH_DDL + TEXT_SEARCH_DDL:
+    event.listen(
+        KnowledgeBaseContent.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql")
+    )
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -73,7 +238,7 @@ class ContentTag(Base):
     __tablename__ = "content_tags"
     
     content_id = Column(Integer, ForeignKey("knowledge_base_content.content_id", ondelete="CASCADE"), primary_key=True)
-    tag_id = Column(Integer, ForeignKey("tags.tag_id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.tag_id", ondelete="CASCADE"), primary_key=True, index=True)
 
 
 class UserActivityLog(Base):
@@ -87,4 +252,104 @@ class UserActivityLog(Base):
     
     # Relationships
     user = relationship("User", back_populates="activities")
-    content = relationship("KnowledgeBaseContent") 
\ No newline at end of file
+    content = relationship("KnowledgeBaseContent") 
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    
+    job_id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String(255), nullable=False)
+    file_path = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="SET NULL"), nullable=True)
+    file_digest = Column(String(64), index=True)  # sha256 of the uploaded file
+    pages_total = Column(Integer)
+    pages_processed = Column(Integer, default=0)
+    chunks_processed = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    profile_id = Column(String(32))  # set when the upload asked to be profiled (see app.profiling)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    source = relationship("KnowledgeBaseSource")
+
+
+class SourceFile(Base):
+    """The uploaded file a source was ingested from, by content digest."""
+    __tablename__ = "source_files"
+    
+    digest = Column(String(64), primary_key=True)  # sha256 of the file bytes
+    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String(255))
+    size_bytes = Column(BigInteger)
+    created_at = Column(DateTime, default=func.now())
+    
+    # Relationships
+    source = relationship("KnowledgeBaseSource")
+
+
+class UploadSession(Base):
+    """A resumable multi-part upload: parts are PUT (in any order) before completion."""
+    __tablename__ = "upload_sessions"
+    
+    upload_id = Column(String(36), primary_key=True)  # uuid4, also the parts directory name
+    filename = Column(String(255), nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    part_count = Column(Integer, nullable=False)
+    file_digest = Column(String(64))  # expected sha256 of the whole file, when the client sent one
+    status = Column(String(20), nullable=False, default="open", index=True)  # open, completed
+    job_id = Column(Integer, ForeignKey("ingestion_jobs.job_id", ondelete="SET NULL"), nullable=True)
+    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
+    
+    # Relationships
+    parts = relationship("UploadPart", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class UploadPart(Base):
+    """A received, checksum-verified part of an UploadSession."""
+    __tablename__ = "upload_parts"
+    
+    upload_id = Column(String(36), ForeignKey("upload_sessions.upload_id", ondelete="CASCADE"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)  # 1-based
+    size_bytes = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+
+class QuestionSet(Base):
+    """Generation state of the questions of a content row (see services/question_bank.py)."""
+    __tablename__ = "question_sets"
+    
+    content_id = Column(Integer, ForeignKey("knowledge_base_content.content_id", ondelete="CASCADE"), primary_key=True)
+    # The content_hash of the content and the generator the questions were made from;
+    # a change of either marks them for regeneration
+    content_hash = Column(String(64))
+    generator = Column(String(100), nullable=False)
+    question_count = Column(Integer, nullable=False, default=0)
+    generated_at = Column(DateTime, default=func.now())
+
+
+class Question(Base):
+    """A practice question generated from a content row, served by /questions."""
+    __tablename__ = "questions"
+    
+    question_id = Column(Integer, primary_key=True)
+    content_id = Column(Integer, ForeignKey("knowledge_base_content.content_id", ondelete="CASCADE"), nullable=False)
+    source_id = Column(Integer, ForeignKey("knowledge_base_sources.source_id", ondelete="CASCADE"), nullable=False)
+    question = Column(Text, nullable=False)
+    answer = Column(Text)
+    question_type = Column(String(30))  # e.g. 'cloze', 'short_answer'
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        # Pages of a source's or a section's questions are keyset scans on question_id
+        Index("ix_questions_source_id", "source_id", "question_id"),
+        Index("ix_questions_content_id", "content_id", "question_id"),
+    )
@@ -0,0 +1,379 @@
+"""
+Sampling profiler for single requests and ingestion jobs.
+
+A Profile samples one asyncio task from a background thread every PROFILE_INTERVAL
+seconds (sys._current_frames), so the profiled code runs unchanged. When the task is
+running, the sample is its stack; when it is suspended, the coroutines it is awaiting
+in, ending in "(waiting)", so time spent waiting for Postgres or for extraction shows
+up as well: the profile is wall-clock. Work the task hands off through the helpers
+below is sampled too, while it runs: tasks started with create_task(), thread pool
+calls made with run_in_executor() (under "[thread pool]") and process pool calls,
+which run a sampler in the worker process and send their stacks back with the result
+(under "[process pool]"). A sample can therefore hold several stacks.
+
+Profiles are written to PROFILE_DIR as collapsed stacks ("frame;frame;frame count"
+per line), which flamegraph.pl and speedscope.app open as they are; GET
+/profiles/{profile_id}?format=speedscope converts one to speedscope's JSON format.
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from pathlib import Path
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _label(code) -> str:
+    return f"{code.co_qualname} ({os.path.join(*Path(code.co_filename).parts[-2:])}:{code.co_firstlineno})"
+
+
+class Profile:
+    """
+    Collapsed stacks of the task that enters it (`with Profile() as profile:` inside a
+    coroutine), counted by sample, plus those of the executor calls it makes.
+    """
+
+    def __init__(self, profile_id: Optional[str] = None, interval: float = config.PROFILE_INTERVAL):
+        self.profile_id = profile_id or new_profile_id()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._loop_thread: Optional[int] = None
+        self._root: Optional[FrameType] = None
+        # Tasks started for the profiled task (create_task), sampled while they run
+        self._children: List[asyncio.Task] = []
+        # Threads running a call for this profile, with the frame its stacks start at
+        self._threads: Dict[int, Tuple[str, FrameType]] = {}
+        self._lock = threading.Lock()
+        self._token = None
+        self._started = 0.0
+
+    def __enter__(self) -> "Profile":
+        # The frame of the coroutine (or, in a worker process, the function) using the profile
+        self._root = sys._getframe(1)
+        try:
+            self._task = asyncio.current_task()
+        except RuntimeError:
+            self._task = None
+        if self._task is None:
+            self._threads[threading.get_ident()] = ("", self._root)
+        else:
+            self._loop_thread = threading.get_ident()
+        self._token = current_profile.set(self)
+        self._started = time.perf_counter()
+        _sampler.add(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _sampler.remove(self)
+        self.elapsed = time.perf_counter() - self._started
+        current_profile.reset(self._token)
+        self._task = self._root = None
+        self._children = []
+        self._threads.clear()
+
+    def add_task(self, task: asyncio.Task) -> None:
+        self._children = [child for child in self._children if not child.done()] + [task]
+
+    def sample(self, frames: Dict[int, FrameType], labels: Dict[object, str]) -> None:
+        """Record one sample of the task and the threads working for it (sampler thread)."""
+        stacks = []
+        if self._task is not None:
+            loop_frame = frames.get(self._loop_thread)
+            stack = _stack_above(loop_frame, self._root, labels) if loop_frame is not None else None
+            # Running, or waiting while one of its child tasks runs
+            stacks.append(stack or self._awaiting(labels))
+            if not stack and loop_frame is not None:
+                for child in self._children:
+                    root = child.get_coro().cr_frame
+                    stack = _stack_above(loop_frame, root, labels) if root is not None else None
+                    if stack:
+                        stacks.append(stack)
+                        break
+        for ident, (prefix, root) in list(self._threads.items()):
+            frame = frames.get(ident)
+            stack = _stack_above(frame, root, labels) if frame is not None else None
+            if stack:
+                stacks.append(f"{prefix};{stack}" if prefix else stack)
+        with self._lock:
+            self.samples += 1
+            self.stacks.update(stack for stack in stacks if stack)
+
+    def merge(self, stacks: Dict[str, int], prefix: str) -> None:
+        with self._lock:
+            for stack, count in stacks.items():
+                self.stacks[f"{prefix};{stack}"] += count
+
+    def _awaiting(self, labels: Dict[object, str]) -> Optional[str]:
+        # Follow what each coroutine of the suspended task awaits, from the root frame down
+        names, seen_root = [], False
+        awaitable = self._task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+            if frame is None:
+                break
+            seen_root = seen_root or frame is self._root
+            if seen_root:
+                names.append(labels.get(frame.f_code) or labels.setdefault(frame.f_code, _label(frame.f_code)))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+        if not names:
+            return None
+        names.append("(waiting)")
+        return ";".join(names)
+
+    def track_thread(self, prefix: str, func, *args):
+        """Run func(*args) on this thread with its stacks sampled into the profile."""
+        ident = threading.get_ident()
+        self._threads[ident] = (prefix, sys._getframe())
+        try:
+            return func(*args)
+        finally:
+            self._threads.pop(ident, None)
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def save(self, directory: str = config.PROFILE_DIR, max_files: int = config.PROFILE_MAX_FILES) -> str:
+        """Write the collapsed stacks to directory/<profile_id>.collapsed, deleting the oldest files beyond max_files."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.profile_id}.collapsed")
+        with open(path, "w") as out:
+            out.write(self.collapsed())
+        saved = sorted(Path(directory).glob("*.collapsed"), key=lambda entry: entry.stat().st_mtime)
+        for old in saved[:max(len(saved) - max_files, 0)]:
+            old.unlink(missing_ok=True)
+        return path
+
+
+def _stack_above(frame: Optional[FrameType], root: FrameType, labels: Dict[object, str]) -> Optional[str]:
+    """The stack from root (included) to frame, or None when root is not on it."""
+    names = []
+    while frame is not None:
+        names.append(labels.get(frame.f_code) or labels.setdefault(frame.f_code, _label(frame.f_code)))
+        if frame is root:
+            names.reverse()
+            return ";".join(names)
+        frame = frame.f_back
+    return None
+
+
+class _Sampler:
+    """One daemon thread sampling every active Profile; it exits when none is left."""
+
+    def __init__(self):
+        self.profiles: List[Profile] = []
+        self._labels: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self.profiles.append(profile)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            if profile in self.profiles:
+                self.profiles.remove(profile)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                profiles = list(self.profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            interval = min(profile.interval for profile in profiles)
+            frames = sys._current_frames()
+            frames.pop(own, None)
+            for profile in profiles:
+                try:
+                    profile.sample(frames, self._labels)
+                except Exception:
+                    # A stack that changed under the sampler; the next sample will do
+                    logger.debug("Profile sample failed", exc_info=True)
+            del frames
+            time.sleep(interval)
+
+    def reset(self) -> None:
+        # In a forked worker process, nothing of the parent's sampler is running
+        self.profiles = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+
+_sampler = _Sampler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_sampler.reset)
+
+current_profile: ContextVar[Optional[Profile]] = ContextVar("current_profile", default=None)
+
+
+def create_task(coro, name: Optional[str] = None) -> asyncio.Task:
+    """asyncio.create_task that also samples the new task in the current Profile, if any."""
+    task = asyncio.create_task(coro, name=name)
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_task(task)
+    return task
+
+
+def _sampled_call(func, args, interval: float):
+    """Run func(*args) under a Profile of this (worker process) thread; return (result, stacks)."""
+    with Profile(interval=interval) as profile:
+        result = func(*args)
+    return result, dict(profile.stacks)
+
+
+async def _merged(profile: Profile, future: asyncio.Future):
+    result, stacks = await future
+    profile.merge(stacks, "[process pool]")
+    return result
+
+
+def run_in_executor(executor, func, *args) -> asyncio.Future:
+    """
+    loop.run_in_executor(executor, func, *args) that includes the call in the current
+    Profile, if any. Process pool calls are sampled in the worker process.
+    """
+    loop = asyncio.get_running_loop()
+    profile = current_profile.get()
+    if profile is None:
+        return loop.run_in_executor(executor, func, *args)
+    if isinstance(executor, ProcessPoolExecutor):
+        return asyncio.ensure_future(
+            _merged(profile, loop.run_in_executor(executor, _sampled_call, func, args, profile.interval))
+        )
+    return loop.run_in_executor(executor, profile.track_thread, "[thread pool]", func, *args)
+
+
+def profile_path(profile_id: str, directory: str = config.PROFILE_DIR) -> Optional[str]:
+    """The file of a saved profile, or None for an unknown (or malformed) id."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.collapsed")
+    return path if os.path.exists(path) else None
+
+
+def speedscope(collapsed: str, name: str, interval: float = config.PROFILE_INTERVAL) -> dict:
+    """Convert collapsed stacks to a speedscope "sampled" profile (weights in seconds)."""
+    frames: Dict[str, int] = {}
+    samples, weights = [], []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if not stack:
+            continue
+        samples.append([frames.setdefault(frame, len(frames)) for frame in stack.split(";")])
+        weights.append(int(count) * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "dojang",
+        "shared": {"frames": [{"name": frame} for frame in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running requests under a Profile: those that ask for it (X-Profile
+    header or profile query flag, when `enabled`), and one in `sample_every` whose
+    profile is kept only if the request took at least `slow_seconds`.
+    """
+
+    def __init__(
+        self,
+        app,
+        enabled: bool = config.PROFILING_ENABLED,
+        sample_every: int = config.PROFILE_SAMPLE_EVERY,
+        slow_seconds: float = config.PROFILE_SLOW_SECONDS,
+        interval: float = config.PROFILE_INTERVAL,
+        directory: str = config.PROFILE_DIR
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        self._requests = 0
+
+    def _requested(self, scope) -> bool:
+        if not self.enabled:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return value.lower() in (b"1", b"true", b"yes")
+        return re.search(rb"(^|&)profile=(1|true|yes)(&|$)", scope.get("query_string", b"")) is not None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = self._requested(scope)
+        sampled = False
+        if not requested and self.sample_every > 0:
+            self._requests += 1
+            sampled = self._requests % self.sample_every == 0
+        if not requested and not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(interval=self.interval)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", ()), (b"x-profile-id", profile.profile_id.encode())]
+                }
+            await send(message)
+
+        try:
+            with profile:
+                await self.app(scope, receive, send_with_profile_id if requested else send)
+        finally:
+            if requested or profile.elapsed >= self.slow_seconds:
+                try:
+                    profile.save(self.directory)
+                except OSError:
+                    logger.exception("Could not save profile %s", profile.profile_id)
+                else:
+                    if sampled:
+                        logger.warning(
+                            "Slow request %s %s took %.2fs, profile %s",
+                            scope["method"], scope["path"], profile.elapsed, profile.profile_id
+                        )
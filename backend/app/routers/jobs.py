@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_db
+from ..services.ingestion_jobs import IngestionJobService, job_status
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Report the state of an ingestion job: status, pages processed and throughput.
+    """
+    job = await IngestionJobService(db).get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
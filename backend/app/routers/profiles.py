@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from .. import config
+from ..profiling import profile_path, speedscope
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"]
+)
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str, format: str = "collapsed"):
+    """
+    A saved profile (X-Profile-Id of a profiled request, or profile_id of an ingestion
+    job): collapsed stacks as text, or with format=speedscope a file for speedscope.app.
+    Profiles live in PROFILE_DIR of the API process that ran the request or the job.
+    """
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path) as profile_file:
+        collapsed = profile_file.read()
+    if format == "speedscope":
+        return speedscope(collapsed, profile_id, config.PROFILE_INTERVAL)
+    return PlainTextResponse(collapsed)
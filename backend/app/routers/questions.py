@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from .. import config
+from ..cache import cached, source_tags
+from ..database import get_ingest_db
+from ..models import KnowledgeBaseSource
+from ..services.question_bank import QuestionBankService, serve_questions
+
+router = APIRouter(
+    prefix="/questions",
+    tags=["questions"]
+)
+
+# "" rather than "/": the endpoint has always been /questions, and a redirect to
+# /questions/ would double the requests of every client
+@router.get("")
+@cached("questions", tags=source_tags)
+async def get_questions(
+    source_id: Optional[int] = None,
+    content_id: Optional[int] = None,
+    tag: Optional[str] = None,
+    limit: int = config.QUESTIONS_DEFAULT_LIMIT,
+    cursor: Optional[str] = None
+):
+    """
+    Practice questions from the question bank, generated ahead of time for each
+    section, filtered by source, section (content_id) or tag. Pass the next_cursor of
+    a response as cursor to get the following page; it is null on the last page.
+    """
+    try:
+        questions, next_cursor = await serve_questions(limit, source_id, content_id, tag, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "questions": questions, "next_cursor": next_cursor}
+
+@router.post("/refresh")
+async def refresh_questions(
+    source_id: int,
+    force: bool = False,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    Generate the questions of the sections of a source that changed since theirs were
+    generated, or that have none (every section with force). Sources get their
+    questions when ingested; this catches up after edits or a change of generator.
+    """
+    if await db.get(KnowledgeBaseSource, source_id) is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    counts = await QuestionBankService(db).refresh_source(source_id, force=force)
+    return {"status": "success", "source_id": source_id, **counts}
@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from pydantic import BaseModel
+
+from .. import config
+from ..cache import cached, source_tags
+from ..database import get_db, ingest_engine
+from ..services.embeddings import get_embedding_service
+from ..services.text_search import TextSearchService
+from ..services.vector_index import get_vector_index
+from ..services.vector_search import VectorIndexManager, VectorSearchService
+from ..services.vector_snapshot import open_configured_snapshot
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+class SearchRequest(BaseModel):
+    query: Optional[str] = None  # text to embed, or
+    vector: Optional[List[float]] = None  # a precomputed query embedding
+    k: int = config.VECTOR_SEARCH_DEFAULT_K
+    source_id: Optional[int] = None
+    content_type: Optional[str] = None
+    tags: Optional[List[str]] = None
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+
+class IndexRequest(BaseModel):
+    method: str = "hnsw"
+    m: int = config.HNSW_M
+    ef_construction: int = config.HNSW_EF_CONSTRUCTION
+    lists: int = config.IVFFLAT_LISTS
+
+async def run_search(request: SearchRequest, db: AsyncSession) -> dict:
+    if request.vector is not None:
+        query_vector = request.vector
+    elif request.query:
+        query_vector = await get_embedding_service().embed_one(request.query)
+    else:
+        raise HTTPException(status_code=400, detail="Either query or vector is required")
+
+    try:
+        hits = await VectorSearchService(db).search(
+            query_vector,
+            k=request.k,
+            source_id=request.source_id,
+            content_type=request.content_type,
+            tags=request.tags,
+            ef_search=request.ef_search,
+            probes=request.probes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "results": [hit.to_dict() for hit in hits]}
+
+@router.get("/")
+@cached("search.vector", tags=source_tags)
+async def search(
+    q: str,
+    k: int = config.VECTOR_SEARCH_DEFAULT_K,
+    source_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    tag: List[str] = Query(default=[]),
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Nearest-neighbour search over knowledge base content for a text query.
+    """
+    request = SearchRequest(
+        query=q, k=k, source_id=source_id, content_type=content_type,
+        tags=tag or None, ef_search=ef_search, probes=probes
+    )
+    return await run_search(request, db)
+
+@router.post("/")
+async def search_post(
+    request: SearchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Nearest-neighbour search for a text query or a precomputed query vector.
+    """
+    return await run_search(request, db)
+
+@router.get("/text")
+@cached("search.text", tags=source_tags)
+async def text_search(
+    q: str,
+    limit: int = config.TEXT_SEARCH_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    source_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    language: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Full-text search over knowledge base content, best matches first. q takes web
+    search syntax ("quoted phrase", or, -excluded). Each hit has a snippet with the
+    matching terms in <mark> tags. Pass the next_cursor of a response as cursor to get
+    the following page; it is null on the last page. The query is parsed in `language`
+    (default: the source's language with source_id, else TEXT_SEARCH_DEFAULT_LANGUAGE).
+    """
+    try:
+        hits, next_cursor = await TextSearchService(db).search(
+            q, limit=limit, source_id=source_id, content_type=content_type, language=language, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "results": [hit.to_dict() for hit in hits], "next_cursor": next_cursor}
+
+@router.get("/indexes")
+async def list_indexes():
+    """List the approximate nearest-neighbour indexes on content embeddings."""
+    return {"indexes": await VectorIndexManager(ingest_engine).list_indexes()}
+
+@router.post("/indexes", status_code=201)
+async def create_index(request: IndexRequest):
+    """
+    (Re)build an HNSW or IVFFlat index on content embeddings, concurrently with traffic.
+    """
+    try:
+        index = await VectorIndexManager(ingest_engine).create_index(
+            request.method, m=request.m, ef_construction=request.ef_construction, lists=request.lists
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Index created successfully", "index": index}
+
+@router.delete("/indexes/{name}")
+async def drop_index(name: str):
+    """Drop an approximate nearest-neighbour index on content embeddings."""
+    try:
+        await VectorIndexManager(ingest_engine).drop_index(name)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": "Index dropped successfully"}
+
+@router.get("/memory")
+async def memory_index_stats():
+    """Sources held by the in-process vector index, with vector counts and memory use."""
+    return get_vector_index().stats()
+
+@router.post("/memory/{source_id}")
+async def load_memory_source(
+    source_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Load (or reload) a source's embeddings into the in-process vector index, so that
+    searches restricted to it are answered from memory. Uses the embedding snapshot
+    (VECTOR_SNAPSHOT_DIR) when there is one. Only the API process that serves this
+    request loads it: the others keep answering the source from pgvector (list it in
+    VECTOR_INDEX_SOURCES to load it in every process).
+    """
+    vectors = await get_vector_index().load_source(db, source_id, open_configured_snapshot())
+    return {"message": "Source loaded successfully", "source_id": source_id, "vectors": vectors}
+
+@router.delete("/memory/{source_id}")
+async def unload_memory_source(source_id: int):
+    """Drop a source from the in-process vector index; its searches go back to pgvector."""
+    if not get_vector_index().unload(source_id):
+        raise HTTPException(status_code=404, detail="Source not loaded")
+    return {"message": "Source unloaded successfully"}
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
-from datetime import date
-from pydantic import BaseModel
+from typing import Any, Optional
+from datetime import date, datetime
+from pydantic import BaseModel, ValidationError
 
-from ..database import get_db
+from ..cache import cached, source_tags
+from ..database import AsyncSessionLocal, get_db, get_ingest_db
+from ..models import KnowledgeBaseSource
+from ..services.content_tree import ContentTreeService
+from ..services.deduplication import get_stored_embeddings
+from ..services.export import EXPORT_FORMATS, check_export_format, stream_source_export
+from ..services.source_batches import SourceBatchImporter, read_json_items
 from ..services.source_intake import InformationSource, SourceIntakeService
 
 router = APIRouter(
@@ -32,7 +39,7 @@ class SourceCreate(BaseModel):
 @router.post("/", status_code=201)
 async def create_source(
     source_data: SourceCreate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_ingest_db)
 ):
     """
     Create a new information source with its content.
@@ -44,9 +51,98 @@ async def create_source(
         )
         
         # Process the source
-        service = SourceIntakeService(db)
+        service = SourceIntakeService(db, embed=get_stored_embeddings().embed)
         result = await service.process_source(source)
         
         return {"message": "Source created successfully", "source_id": result.source_id}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_source(item: Any) -> InformationSource:
+    """Validate one item of a batch as a SourceCreate; raises ValueError with the problems."""
+    try:
+        source_data = SourceCreate.model_validate(item)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors()
+        ))
+    return InformationSource(**source_data.model_dump())
+
+@router.post("/batch")
+async def create_sources(
+    request: Request,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    Create many sources from one request: a JSON array of SourceCreate objects, or
+    NDJSON with one per line. The body is read as it arrives and saved
+    SOURCE_BATCH_SIZE sources per transaction. Invalid items do not stop the others;
+    the response has a result per item, in order: its source_id, or why it failed.
+    """
+    importer = SourceBatchImporter(db, parse_source, embed=get_stored_embeddings().embed)
+    results = await importer.run(read_json_items(request.stream()))
+    created = sum(result.error is None for result in results)
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "results": [result.to_dict() for result in results],
+    }
+
+@router.get("/{source_id}/tree")
+@cached("sources.tree", tags=source_tags)
+async def get_source_tree(
+    source_id: int,
+    root_id: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    include_content: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    The content hierarchy of a source (chapters, sections, ...) as nested nodes,
+    fetched with a single query. Pass root_id for the subtree under one content and
+    max_depth to limit how many levels below the root are returned.
+    """
+    if await db.get(KnowledgeBaseSource, source_id) is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    if max_depth is not None and max_depth < 0:
+        raise HTTPException(status_code=400, detail="max_depth must not be negative")
+
+    service = ContentTreeService(db)
+    if root_id is not None:
+        root = await service.subtree(
+            root_id, max_depth=max_depth, include_content=include_content, source_id=source_id
+        )
+        if root is None:
+            raise HTTPException(status_code=404, detail="Content not found")
+        roots = [root]
+    else:
+        roots = await service.source_tree(source_id, max_depth=max_depth, include_content=include_content)
+
+    return {"source_id": source_id, "tree": [root.to_dict(include_content) for root in roots]}
+
+@router.get("/{source_id}/export")
+async def export_source(
+    source_id: int,
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    embeddings: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream a source and its content as NDJSON or an Arrow IPC stream (format=arrow),
+    with embeddings as float16 when asked for. Pass the watermark of a previous
+    export as `since` to get only what changed after it (see services/export.py).
+    """
+    if await db.get(KnowledgeBaseSource, source_id) is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    try:
+        check_export_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    extension = "ndjson" if format == "ndjson" else "arrows"
+    return StreamingResponse(
+        stream_source_export(AsyncSessionLocal, source_id, format, since, embeddings),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="source-{source_id}.{extension}"'}
+    )
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from pydantic import BaseModel
+
+from ..database import get_ingest_db
+from ..services.ingestion_jobs import IngestionQueueFull
+from ..services.resumable_uploads import ResumableUploadService, UploadClosed, UploadNotFound, upload_status
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"]
+)
+
+class UploadInit(BaseModel):
+    filename: str
+    size_bytes: int
+    part_size: Optional[int] = None  # defaults to UPLOAD_PART_SIZE
+    sha256: Optional[str] = None  # of the whole file, checked on completion
+
+class PartChecksum(BaseModel):
+    part_number: int
+    sha256: str
+
+class UploadComplete(BaseModel):
+    parts: Optional[List[PartChecksum]] = None
+
+def queue_full(e: IngestionQueueFull) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+@router.post("/", status_code=201)
+async def create_upload(
+    request: UploadInit,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    Start a resumable upload of a large PDF. The file is sent as part_count parts of
+    part_size bytes (the last one smaller) with PUT /uploads/{upload_id}/parts/{n},
+    in any order and in parallel, then POST /uploads/{upload_id}/complete queues it
+    for ingestion like POST /upload. After a dropped connection, GET the upload to
+    see which parts are missing and send only those.
+    """
+    if not request.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are currently supported")
+    try:
+        session = await ResumableUploadService(db).create(
+            request.filename, request.size_bytes, request.part_size, request.sha256
+        )
+    except IngestionQueueFull as e:
+        raise queue_full(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload_status(session, [])
+
+@router.get("/{upload_id}")
+async def get_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """Report an upload session: received parts with their checksums, and missing parts."""
+    try:
+        return await ResumableUploadService(db).status(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.put("/{upload_id}/parts/{part_number}")
+async def put_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    x_checksum_sha256: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    Upload one part as the raw request body. With an X-Checksum-SHA256 header (hex),
+    a part that arrives corrupted is rejected (400) and must be sent again. The
+    response carries the sha256 of what was stored.
+    """
+    try:
+        return await ResumableUploadService(db).put_part(
+            upload_id, part_number, request.stream(), x_checksum_sha256
+        )
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadClosed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{upload_id}/complete", status_code=202)
+async def complete_upload(
+    upload_id: str,
+    response: Response,
+    request: Optional[UploadComplete] = None,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    Assemble the parts and queue the document for ingestion. Responds like POST
+    /upload: 202 with a job_id to poll, or 200 "duplicate" with the source_id of an
+    identical file already ingested. Missing parts or checksum mismatches are 409.
+    """
+    part_checksums = [(part.part_number, part.sha256) for part in (request.parts or [])] if request else None
+    try:
+        status_code, body = await ResumableUploadService(db).complete(upload_id, part_checksums)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except IngestionQueueFull as e:
+        raise queue_full(e)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    response.status_code = status_code
+    return body
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """Abandon an upload and delete its parts."""
+    try:
+        await ResumableUploadService(db).abort(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "aborted", "upload_id": upload_id}
@@ -0,0 +1,124 @@
+from typing import List, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..models import KnowledgeBaseContent
+
+# Column order of the COPY records
+CONTENT_COLUMNS = (
+    "content_id",
+    "source_id",
+    "parent_content_id",
+    "path",
+    "title",
+    "content",
+    "content_type",
+    "content_hash",
+    "embedding",
+    "created_at",
+    "updated_at",
+)
+
+
+def supports_copy(db: AsyncSession) -> bool:
+    """COPY is only available when the session talks to Postgres through asyncpg."""
+    return db.bind is not None and db.bind.dialect.driver == "asyncpg"
+
+
+class ContentBulkWriter:
+    """
+    Writes knowledge_base_content rows with asyncpg's binary COPY instead of one
+    INSERT per row.
+
+    Ids are pre-allocated from the table's sequence in a single query, so
+    parent_content_id links between rows of the same load (and to rows already in
+    the database) are resolved client-side before anything is sent. The COPY runs
+    on the session's own connection, inside its transaction: nothing is visible
+    until the caller commits, and a rollback discards it.
+    """
+
+    def __init__(self, db: AsyncSession, batch_size: int = config.BULK_COPY_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self._timestamp = None
+
+    async def allocate_ids(self, count: int) -> List[int]:
+        """Reserve `count` content ids from the knowledge_base_content sequence."""
+        if count == 0:
+            return []
+        result = await self.db.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence('knowledge_base_content', 'content_id')) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"count": count}
+        )
+        return [row[0] for row in result]
+
+    async def _transaction_timestamp(self):
+        # created_at/updated_at defaults are applied by SQLAlchemy, not by the table,
+        # so COPY has to send them; use the transaction time like func.now() would
+        if self._timestamp is None:
+            result = await self.db.execute(text("SELECT LOCALTIMESTAMP"))
+            self._timestamp = result.scalar_one()
+        return self._timestamp
+
+    async def _driver_connection(self):
+        connection = await self.db.connection()
+        raw_connection = await connection.get_raw_connection()
+        return raw_connection.driver_connection
+
+    async def write(self, contents: Sequence[KnowledgeBaseContent]) -> int:
+        """
+        COPY the given content models into knowledge_base_content.
+
+        Models without a content_id get one from the sequence (it is set on the model).
+        A model whose parent_content_id is unset but whose `parent` is another model
+        is linked to that parent's id, so parents may be written in the same call.
+        Paths are computed here when the parent's path is known (roots, parents in
+        the same call); otherwise the table's trigger looks up the parent's path.
+        The models are not added to the session.
+        Returns the number of rows written.
+        """
+        if not contents:
+            return 0
+
+        unassigned = [content for content in contents if content.content_id is None]
+        for content, content_id in zip(unassigned, await self.allocate_ids(len(unassigned))):
+            content.content_id = content_id
+
+        timestamp = await self._transaction_timestamp()
+        records = []
+        for content in contents:
+            parent_id = content.parent_content_id
+            if parent_id is None and content.parent is not None:
+                parent_id = content.parent.content_id
+            if content.path is None:
+                if parent_id is None:
+                    content.path = f"{content.content_id}/"
+                elif content.parent is not None and content.parent.path is not None:
+                    content.path = f"{content.parent.path}{content.content_id}/"
+            records.append((
+                content.content_id,
+                content.source_id,
+                parent_id,
+                content.path,
+                content.title,
+                content.content,
+                content.content_type,
+                content.content_hash,
+                content.embedding,
+                timestamp,
+                timestamp,
+            ))
+
+        driver_connection = await self._driver_connection()
+        for start in range(0, len(records), self.batch_size):
+            await driver_connection.copy_records_to_table(
+                "knowledge_base_content",
+                records=records[start:start + self.batch_size],
+                columns=CONTENT_COLUMNS
+            )
+        return len(records)
@@ -0,0 +1,214 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+# Lines that open a new part of a textbook: "Chapter 3: ...", "Section 2.1 ...",
+# "4.2 Cell Structure", "12. Thermodynamics", or short all-caps titles
+KEYWORD_HEADING = re.compile(r"(?:chapter|section|part|unit|lesson|appendix)\s+[\dIVXLC]+\b", re.IGNORECASE)
+NUMBERED_HEADING = re.compile(r"\d+(?:\.\d+)*\.?\s+[A-Z][^.!?]*$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+MAX_HEADING_LENGTH = 100
+
+
+@dataclass
+class TextChunk:
+    text: str
+    page_start: int  # 0-based page of the first character
+    page_end: int  # 0-based page of the last character
+    heading: Optional[str] = None  # the heading the chunk falls under
+    overlap: int = 0  # leading characters repeated from the previous chunk
+
+
+@dataclass
+class _Unit:
+    text: str
+    page: int
+    kind: str  # "heading", or "sentence" (first sentences of paragraphs also carry paragraph_length)
+    paragraph_length: int = 0
+
+
+def is_heading(line: str) -> bool:
+    if not line or len(line) > MAX_HEADING_LENGTH:
+        return False
+    if KEYWORD_HEADING.match(line) or NUMBERED_HEADING.match(line):
+        return True
+    return len(line) >= 4 and line.isupper() and not line.endswith((".", "!", "?"))
+
+
+def split_long(text: str, max_length: int) -> List[str]:
+    """Cut text longer than max_length into pieces of at most max_length, at whitespace when possible."""
+    pieces = []
+    while len(text) > max_length:
+        cut = text.rfind(" ", 0, max_length + 1)
+        if cut <= 0:
+            cut = max_length
+        pieces.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+class TextChunker:
+    """
+    Splits the text of a document, fed one page at a time, into chunks of
+    min_chunk_size..max_chunk_size characters for embedding.
+
+    Each page is cut into headings (see is_heading), paragraphs and sentences.
+    Chunks are filled greedily and broken at the strongest boundary available:
+    a heading starts a new chunk, a paragraph that would not fit starts a new chunk,
+    and otherwise the chunk breaks between sentences. No break happens before the
+    chunk has min_chunk_size characters of its own; long paragraphs are fed sentence
+    by sentence (and over-long sentences in pieces cut at whitespace) so that rule
+    never forces a chunk past max_chunk_size. A chunk broken in running text starts
+    with the last `overlap` characters of the previous one, snapped to a word. A last
+    chunk below min_chunk_size is merged into the previous one when the result fits.
+
+    Every character is appended to a list once and joined once per chunk, so the
+    work is linear in the length of the text. Chunks record the pages they span.
+    """
+
+    def __init__(self, min_chunk_size: int = 200, max_chunk_size: int = 1000, overlap: int = 50):
+        if not 0 < min_chunk_size <= max_chunk_size:
+            raise ValueError("Chunk sizes must satisfy 0 < min_chunk_size <= max_chunk_size")
+        if not 0 <= overlap < min_chunk_size or overlap > max_chunk_size // 2:
+            raise ValueError("overlap must be below min_chunk_size and at most half of max_chunk_size")
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.overlap = overlap
+        # Largest unit (paragraph or sentence piece) that always fits after a chunk that
+        # is still below min_chunk_size, including the overlap and a separator
+        self.unit_size = max(max_chunk_size - min_chunk_size - overlap - 2, max_chunk_size // 4, 1)
+
+        self._parts: List[str] = []
+        self._length = 0
+        self._overlap_length = 0
+        self._page_start = 0
+        self._page_end = 0
+        self._heading: Optional[str] = None
+        self._chunk_heading: Optional[str] = None
+        # One finished chunk is held back so a short last chunk can be merged into it
+        self._held: Optional[TextChunk] = None
+
+    def units(self, page: int, text: str) -> Iterator[_Unit]:
+        """Headings and sentences of one page of (cleaned) text, in order."""
+        for block in text.split("\n\n"):
+            paragraph: List[str] = []
+            for line in block.split("\n"):
+                line = line.strip()
+                if is_heading(line):
+                    yield from self._paragraph_units(page, paragraph)
+                    paragraph = []
+                    yield _Unit(line[:self.max_chunk_size], page, "heading")
+                elif line:
+                    paragraph.append(line)
+            yield from self._paragraph_units(page, paragraph)
+
+    def _paragraph_units(self, page: int, lines: List[str]) -> Iterator[_Unit]:
+        if not lines:
+            return
+        paragraph = "\n".join(lines)
+        if len(paragraph) <= self.unit_size:
+            pieces = [paragraph]
+        else:
+            pieces = []
+            for sentence in SENTENCE_END.split(paragraph):
+                pieces.extend(split_long(sentence, self.unit_size))
+        for index, piece in enumerate(pieces):
+            yield _Unit(piece, page, "sentence", len(paragraph) if index == 0 else 0)
+
+    def feed(self, page: int, text: str) -> Iterator[TextChunk]:
+        """Add the text of the next page; yields the chunks it completes."""
+        for unit in self.units(page, text):
+            yield from self._add(unit)
+
+    def finish(self) -> Iterator[TextChunk]:
+        """Yield the remaining chunks once the last page was fed."""
+        last = self._cut(keep_overlap=False)
+        held, self._held = self._held, None
+        if held is not None and last is not None and len(last.text) - last.overlap < self.min_chunk_size:
+            # Without its overlap the last chunk's text starts with its separator
+            tail = last.text[last.overlap:] if last.overlap else "\n\n" + last.text
+            if len(held.text) + len(tail) <= self.max_chunk_size:
+                held.text += tail
+                held.page_end = last.page_end
+                last = None
+        if held is not None:
+            yield held
+        if last is not None:
+            yield last
+
+    def _add(self, unit: _Unit) -> Iterator[TextChunk]:
+        own_length = self._length - self._overlap_length
+        if unit.kind == "heading":
+            self._heading = unit.text
+            separator = "\n\n"
+            if own_length >= self.min_chunk_size:
+                yield from self._emit(keep_overlap=False)
+        elif unit.paragraph_length:
+            separator = "\n\n"
+            if (own_length >= self.min_chunk_size
+                    and self._length + len(separator) + unit.paragraph_length > self.max_chunk_size):
+                yield from self._emit(keep_overlap=True)
+        else:
+            separator = " "
+
+        if self._length and self._length + len(separator) + len(unit.text) > self.max_chunk_size:
+            # Sections do not start with the tail of the previous one
+            yield from self._emit(keep_overlap=unit.kind != "heading")
+            if self._length and self._length + len(separator) + len(unit.text) > self.max_chunk_size:
+                self._reset()  # the overlap leaves no room for this unit
+
+        if self._length == self._overlap_length:
+            # Nothing but the overlap yet: the chunk belongs to the heading in force now
+            self._chunk_heading = self._heading
+            if self._length == 0:
+                self._page_start = unit.page
+        if self._length:
+            self._parts.append(separator)
+            self._length += len(separator)
+        self._parts.append(unit.text)
+        self._length += len(unit.text)
+        self._page_end = unit.page
+
+    def _emit(self, keep_overlap: bool) -> Iterator[TextChunk]:
+        chunk = self._cut(keep_overlap)
+        if chunk is None:
+            return
+        held, self._held = self._held, chunk
+        if held is not None:
+            yield held
+
+    def _cut(self, keep_overlap: bool) -> Optional[TextChunk]:
+        """Close the current chunk; the next one starts with its overlap tail if asked to."""
+        if self._length == self._overlap_length:
+            self._reset()
+            return None
+        text = "".join(self._parts)
+        chunk = TextChunk(text, self._page_start, self._page_end, self._chunk_heading, self._overlap_length)
+
+        self._reset()
+        if keep_overlap and self.overlap:
+            tail = text[-self.overlap:]
+            space = tail.find(" ")
+            if 0 <= space < len(tail) - 1:
+                tail = tail[space + 1:]
+            self._parts = [tail]
+            self._length = self._overlap_length = len(tail)
+            self._page_start = chunk.page_end
+        return chunk
+
+    def _reset(self) -> None:
+        self._parts = []
+        self._length = 0
+        self._overlap_length = 0
+
+
+def chunk_pages(pages, min_chunk_size: int = 200, max_chunk_size: int = 1000, overlap: int = 50) -> List[TextChunk]:
+    """Chunk an iterable of (page_number, text) in one go (see TextChunker)."""
+    chunker = TextChunker(min_chunk_size, max_chunk_size, overlap)
+    chunks = []
+    for page, text in pages:
+        chunks.extend(chunker.feed(page, text))
+    chunks.extend(chunker.finish())
+    return chunks
@@ -0,0 +1,183 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import KnowledgeBaseContent
+
+
+@dataclass
+class ContentNode:
+    content_id: int
+    parent_content_id: Optional[int]
+    title: Optional[str]
+    content_type: Optional[str]
+    depth: int
+    content: Optional[str] = None
+    children: List["ContentNode"] = field(default_factory=list)
+
+    def to_dict(self, include_content: bool = False) -> dict:
+        """Nested dict of this node and its subtree, built without recursion."""
+        def shallow(node):
+            data = {
+                "content_id": node.content_id,
+                "parent_content_id": node.parent_content_id,
+                "title": node.title,
+                "content_type": node.content_type,
+                "depth": node.depth,
+            }
+            if include_content:
+                data["content"] = node.content
+            data["children"] = []
+            return data
+
+        root = shallow(self)
+        stack = [(self, root)]
+        while stack:
+            node, data = stack.pop()
+            for child in node.children:
+                child_data = shallow(child)
+                data["children"].append(child_data)
+                stack.append((child, child_data))
+        return root
+
+
+def assemble_tree(rows: Iterable) -> List[ContentNode]:
+    """
+    Link flat rows (content_id, parent_content_id, title, content_type, depth and
+    optionally content) into trees in O(n): one pass to index the nodes by id, one
+    to attach each to its parent. Rows whose parent is not among them are roots.
+    Children keep the order of the rows.
+    """
+    nodes: Dict[int, ContentNode] = {}
+    for row in rows:
+        nodes[row.content_id] = ContentNode(
+            content_id=row.content_id,
+            parent_content_id=row.parent_content_id,
+            title=row.title,
+            content_type=row.content_type,
+            depth=row.depth,
+            content=getattr(row, "content", None)
+        )
+
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.parent_content_id)
+        if parent is None:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+    return roots
+
+
+def path_ids(path: Optional[str]) -> List[int]:
+    """Content ids from the root down to the node itself, from a materialised path."""
+    return [int(part) for part in path.split("/") if part] if path else []
+
+
+def build_tree_query(
+    source_id: Optional[int] = None,
+    root_id: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    include_content: bool = False
+):
+    """
+    One recursive CTE for a whole (sub)tree: starting from root_id, or from the root
+    rows (no parent) of source_id, and following parent_content_id downwards, at
+    most max_depth levels below the start. With both, root_id must belong to
+    source_id. Ordered by depth, then content_id.
+    """
+    content = KnowledgeBaseContent
+    columns = [content.content_id, content.parent_content_id, content.title, content.content_type]
+    if include_content:
+        columns.append(content.content)
+
+    # A plain literal, not a bind parameter, so the CTE's depth column is an integer
+    anchor = select(*columns, literal_column("0").label("depth"))
+    if root_id is not None:
+        anchor = anchor.where(content.content_id == root_id)
+    else:
+        anchor = anchor.where(content.parent_content_id.is_(None))
+    if source_id is not None:
+        anchor = anchor.where(content.source_id == source_id)
+    tree = anchor.cte("tree", recursive=True)
+
+    step = (
+        select(*columns, (tree.c.depth + 1).label("depth"))
+        .join(tree, content.parent_content_id == tree.c.content_id)
+    )
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    tree = tree.union_all(step)
+
+    return select(tree).order_by(tree.c.depth, tree.c.content_id)
+
+
+class ContentTreeService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def source_tree(
+        self,
+        source_id: int,
+        max_depth: Optional[int] = None,
+        include_content: bool = False
+    ) -> List[ContentNode]:
+        """The content trees of a source (one per root content), in a single query."""
+        result = await self.db.execute(
+            build_tree_query(source_id=source_id, max_depth=max_depth, include_content=include_content)
+        )
+        return assemble_tree(result)
+
+    async def subtree(
+        self,
+        content_id: int,
+        max_depth: Optional[int] = None,
+        include_content: bool = False,
+        source_id: Optional[int] = None
+    ) -> Optional[ContentNode]:
+        """
+        A content node with its descendants, in a single query.
+        None if it does not exist (or does not belong to source_id, when given).
+        """
+        result = await self.db.execute(build_tree_query(
+            source_id=source_id, root_id=content_id, max_depth=max_depth, include_content=include_content
+        ))
+        roots = assemble_tree(result)
+        return roots[0] if roots else None
+
+    async def ancestors(self, content_id: int) -> List[KnowledgeBaseContent]:
+        """
+        The chain of contents from the root down to (excluding) content_id, e.g. for
+        breadcrumbs. Read off the materialised path, so it costs one indexed lookup
+        whatever the depth.
+        """
+        result = await self.db.execute(
+            select(KnowledgeBaseContent.path).where(KnowledgeBaseContent.content_id == content_id)
+        )
+        ids = path_ids(result.scalar_one_or_none())[:-1]
+        if not ids:
+            return []
+        result = await self.db.execute(
+            select(KnowledgeBaseContent).where(KnowledgeBaseContent.content_id.in_(ids))
+        )
+        by_id = {content.content_id: content for content in result.scalars()}
+        return [by_id[ancestor_id] for ancestor_id in ids if ancestor_id in by_id]
+
+    async def descendant_ids(self, content_id: int) -> List[int]:
+        """Ids of every content below content_id: a prefix scan of the path index."""
+        result = await self.db.execute(
+            select(KnowledgeBaseContent.path).where(KnowledgeBaseContent.content_id == content_id)
+        )
+        path = result.scalar_one_or_none()
+        if path is None:
+            return []
+        # Paths hold only digits and "/", so the prefix needs no LIKE escaping
+        result = await self.db.execute(
+            select(KnowledgeBaseContent.content_id)
+            .where(KnowledgeBaseContent.path.like(f"{path}%"))
+            .where(KnowledgeBaseContent.content_id != content_id)
+            .order_by(KnowledgeBaseContent.content_id)
+        )
+        return list(result.scalars())
@@ -0,0 +1,116 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import IngestSessionLocal
+from ..models import IngestionJob, KnowledgeBaseContent, SourceFile
+from .embeddings import EmbedFunction, content_hash, get_embedding_service
+
+logger = logging.getLogger(__name__)
+
+
+async def find_source_by_digest(db: AsyncSession, digest: str) -> Optional[int]:
+    """The source already ingested from a file with this sha256, if any."""
+    result = await db.execute(select(SourceFile.source_id).where(SourceFile.digest == digest))
+    return result.scalar_one_or_none()
+
+
+async def find_active_job_by_digest(db: AsyncSession, digest: str) -> Optional[IngestionJob]:
+    """A queued or running ingestion job for a file with this sha256, if any."""
+    result = await db.execute(
+        select(IngestionJob)
+        .where(IngestionJob.file_digest == digest)
+        .where(IngestionJob.status.in_(["queued", "running"]))
+        .order_by(IngestionJob.job_id)
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def record_source_file(
+    db: AsyncSession,
+    digest: str,
+    source_id: int,
+    filename: Optional[str] = None,
+    size_bytes: Optional[int] = None
+) -> None:
+    """
+    Remember that the file with this digest was ingested as source_id.
+    If the digest is already recorded (two identical uploads raced), the first
+    source keeps it. Does not commit.
+    """
+    await db.execute(
+        insert(SourceFile)
+        .values(digest=digest, source_id=source_id, filename=filename, size_bytes=size_bytes)
+        .on_conflict_do_nothing(index_elements=[SourceFile.digest])
+    )
+
+
+@dataclass
+class StoredEmbeddingMetrics:
+    texts: int = 0
+    reused: int = 0  # embeddings copied from existing content with the same content_hash
+
+
+class StoredEmbeddings:
+    """
+    EmbedFunction that first reuses the embeddings already stored for identical
+    content (same content_hash, from any source) and only sends the remaining texts
+    to `embed`. Re-ingesting a new edition of a book therefore only embeds the
+    chunks whose text changed.
+
+    Lookups use their own short-lived sessions, so this can run concurrently with
+    the ingestion that writes the rows.
+    """
+
+    def __init__(self, embed: EmbedFunction, session_factory=IngestSessionLocal):
+        self.embed_missing = embed
+        self.session_factory = session_factory
+        self.metrics = StoredEmbeddingMetrics()
+
+    async def lookup(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(KnowledgeBaseContent.content_hash, KnowledgeBaseContent.embedding)
+                .where(KnowledgeBaseContent.content_hash.in_(hashes))
+                .where(KnowledgeBaseContent.embedding.isnot(None))
+                .distinct(KnowledgeBaseContent.content_hash)
+            )
+            return {row.content_hash: np.asarray(row.embedding, dtype=np.float32) for row in result}
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        hashes = [content_hash(text) for text in texts]
+        try:
+            stored = await self.lookup(sorted(set(hashes)))
+        except Exception:
+            # Reuse is an optimisation; fall back to embedding everything
+            logger.exception("Looking up stored embeddings failed")
+            stored = {}
+
+        self.metrics.texts += len(texts)
+        missing = [index for index, key in enumerate(hashes) if key not in stored]
+        self.metrics.reused += len(texts) - len(missing)
+
+        vectors = [stored.get(key) for key in hashes]
+        if missing:
+            for index, vector in zip(missing, await self.embed_missing([texts[index] for index in missing])):
+                vectors[index] = vector
+        return vectors
+
+
+_stored_embeddings: Optional[StoredEmbeddings] = None
+
+
+def get_stored_embeddings() -> StoredEmbeddings:
+    """The process-wide StoredEmbeddings in front of the shared EmbeddingService."""
+    global _stored_embeddings
+    if _stored_embeddings is None:
+        _stored_embeddings = StoredEmbeddings(get_embedding_service().embed)
+    return _stored_embeddings
@@ -1,4 +1,6 @@
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from concurrent.futures import Executor
+from dataclasses import dataclass
 from fastapi import UploadFile
 import re
 from pathlib import Path
@@ -6,16 +8,19 @@ import tempfile
 import fitz  # PyMuPDF
 from marker import extract_from_file
 import openai
-import asyncio
 import asyncpg
-import aiofiles
+import time
 import uuid
 import os
 
-# for the sectioning of the chunks
-from bs4 import BeautifulSoup
-from datetime import datetime
-from sqlalchemy.orm import Session
+from .. import config
+from ..metrics import INGEST_STAGE_SECONDS
+from ..profiling import run_in_executor
+from .chunking import TextChunk, TextChunker
+from .pdf_extraction import PdfSource, read_pdf_info, extract_pages
+
+# progress(pages_done, pages_total), awaited after every chunk of pages
+ProgressCallback = Callable[[int, int], Awaitable[None]]
 
 class DocumentChunk:
     def __init__(
@@ -31,233 +36,228 @@ class DocumentChunk:
         self.metadata = metadata or {}
 
 class DocumentProcessor:
-    def __init__(self):
-        # Configure chunking parameters
-        self.min_chunk_size = 200  # minimum characters per chunk
-        self.max_chunk_size = 1000  # maximum characters per chunk
-        self.overlap = 50  # number of characters to overlap between chunks
-
-# CONSTANTS
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
-CHUNK_SIZE = 64 * 1024  # 64KB chunks for better performance
-
-# -------------------
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        min_chunk_size: int = config.CHUNK_MIN_SIZE,
+        max_chunk_size: int = config.CHUNK_MAX_SIZE,
+        overlap: int = config.CHUNK_OVERLAP
+    ):
+        # Configure chunking parameters (see TextChunker)
+        self.min_chunk_size = min_chunk_size  # minimum characters per chunk
+        self.max_chunk_size = max_chunk_size  # maximum characters per chunk
+        self.overlap = overlap  # number of characters to overlap between chunks
+        self.progress_pages = 5  # pages between progress reports
 
-# for the sectioning of the chunking
+        # PyMuPDF calls are CPU-bound, so they never run on the event loop thread.
+        # Pass a ProcessPoolExecutor for real parallelism; None uses the loop's default thread pool.
+        self.executor = executor
 
-def html_to_text(html):
-    return BeautifulSoup(html, "html.parser").get_text()
+    def _clean_text(self, text: str) -> str:
+        """
+        Normalize text extracted from a PDF: rejoin words hyphenated across lines,
+        collapse runs of spaces and squeeze blank lines down to paragraph breaks.
+        """
+        text = text.replace("\x00", "")
+        text = re.sub(r"-\n(?=\w)", "", text)
+        text = re.sub(r"[ \t\r\f\v]+", " ", text)
+        text = re.sub(r" ?\n ?", "\n", text)
+        text = re.sub(r"\n{3,}", "\n\n", text)
+        return text.strip()
 
-def sub_chunk(json_data, db: Session, source_metadata: dict):
-    """
-    This function takes our marker JSON, takes the sections, 
-    and formulates metadata and extracts content. It saves it into the database with insert_content
-    Args: JSON data from marker, database session, a dictionary which we plug into the knowledge_base_source
-    Returns: success if we get through all of the subchunks
-    """
-    # 1. Insert knowledge_base_sources row (created empty one) AKA the metadata
-    # remember that this is from @models.py courtesy of SQLAlchemy
-    source = models.KnowledgeBaseSource(
-        name=source_metadata.get("title", "Untitled"),
-        author=source_metadata.get("author", "Unknown"),
-        language=source_metadata.get("language", "en"),
-        license=source_metadata.get("license", "unknown"),
-        source_type="textbook",
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
-    )
-    # ADD to database (stages it)
-    db.add(source)
+    async def _iter_pdf_chunks(
+        self,
+        file_path: PdfSource,
+        metadata: Dict,
+        progress: Optional[ProgressCallback] = None
+    ) -> AsyncIterator[DocumentChunk]:
+        """
+        Extract the text of a PDF page by page and yield its chunks as they are ready.
+        Pages are cleaned one at a time and cut by a TextChunker on heading, paragraph
+        and sentence boundaries into chunks of min_chunk_size..max_chunk_size
+        characters, so only the chunk being assembled (plus the extraction shards in
+        flight) is held in memory, whatever the size of the document.
+        Args:
+            file_path: Path to the saved PDF, or its bytes
+            metadata: Additional metadata about the document
+            progress: Optional callback awaited with (pages_done, pages_total)
+        Yields:
+            DocumentChunk objects containing the processed content, in page order
+        """
+        page_count, pdf_metadata = await run_in_executor(self.executor, read_pdf_info, file_path)
+        chunker = TextChunker(self.min_chunk_size, self.max_chunk_size, self.overlap)
+        chunk_number = 0
 
-    # commit the transaction
-    db.commit()
+        def document_chunk(chunk: TextChunk) -> DocumentChunk:
+            return DocumentChunk(
+                content=chunk.text,
+                page_number=chunk.page_start + 1,
+                chunk_number=chunk_number,
+                metadata={
+                    "page_range": f"{chunk.page_start}-{chunk.page_end}",
+                    "heading": chunk.heading,
+                    **pdf_metadata,
+                    **metadata
+                }
+            )
 
-    # reread the new row
-    db.refresh(source)
+        # Pages are extracted in parallel by the executor and arrive in page order;
+        # "extract" is the time spent waiting for the next one, not the workers' CPU time
+        waiting_since = time.perf_counter()
+        async for page_num, text in extract_pages(file_path, page_count, self.executor):
+            started = time.perf_counter()
+            INGEST_STAGE_SECONDS.observe(started - waiting_since, "extract")
+            chunks = list(chunker.feed(page_num, self._clean_text(text)))
+            INGEST_STAGE_SECONDS.observe(time.perf_counter() - started, "chunk")
+            for chunk in chunks:
+                yield document_chunk(chunk)
+                chunk_number += 1
 
-    section_stack = []  # stack of (section_id, level)
+            if progress and ((page_num + 1) % self.progress_pages == 0 or page_num == page_count - 1):
+                await progress(page_num + 1, page_count)
+            waiting_since = time.perf_counter()
 
-    """
-    What is a "block" in marker?
-    they are the "smallest structural units in the PDF"
-    e.g., a section header, a paragraph of text, a list, an image, a page footer
-    """
+        for chunk in chunker.finish():
+            yield document_chunk(chunk)
+            chunk_number += 1
 
-    def insert_content(block, parent_id=None):
+    def iter_chunks(
+        self,
+        file_path: PdfSource,
+        file_type: str,
+        metadata: Optional[Dict] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> AsyncIterator[DocumentChunk]:
         """
-        Inserts the HTML that we got from the marker JSON
-        into the corresponding database table
-
-        title:         
-
+        Stream the chunks of a saved file without materialising the whole document.
+        Currently supports PDF, can be extended for other formats.
         Args:
+            file_path: Path to the saved file, or its bytes (see StagedUpload)
+            file_type: File type, e.g. 'pdf'
+            metadata: Optional metadata about the document
+            progress: Optional callback awaited with (pages_done, pages_total)
         Returns:
+            Async iterator of DocumentChunk
         """
-        content_text = html_to_text(block.get("html", ""))
-        block_type = block.get("block_type", "Unknown")
-        embedding = generate_embedding(content_text)  # your embedding function
+        if file_type.lower() == 'pdf':
+            return self._iter_pdf_chunks(file_path, metadata or {}, progress)
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
 
-        # the reason why title is None for only text and not all others: blocks can be SectionHeader, ListGroup, ListItem, Page, so it makes sense to keep track of those
-        # we don't want to embed the text itself as a title
-        
-        # also, source is from sub_chunk, our parent function
-        # so we're updating the knowledge_base_content row with SQLAlchemy ORM
-        content = models.KnowledgeBaseContent(
-            source_id=source.source_id, # we keep the key consistent
-            parent_content_id=parent_id, # parent is from params
-            title=None if block_type == "Text" else content_text[:100], # add a label if it's not pure text
-            content=content_text, # content is as extracted
-            content_type=block_type, # keep track of type
-            embedding=embedding, # TODO: add embedding
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
-        db.add(content)
-        db.commit()
-        db.refresh(content)
-        return content.content_id
-    
-    def traverse_blocks(blocks, parent_id=None):
-        for block in blocks:
-            block_type = block.get("block_type")
-            
-            # if page, then recurse through it as pages are containers not content
-            # if section header (like "Chapter 1: Limits"), then insert the block with parent id being the page
-            # if text OR ListItem, then we insert the block with parent id being the latest nest (if exists)
-            # if ListGroup, then recurse through the bullet points/numbered list containers with parent id being latest nest (if exists)
-
-            # note: section stack keeps track of nested section headers. [-1][0] gets the top of the stack.
-            if block_type == "Page":
-                traverse_blocks(block.get("children", []), parent_id=parent_id)
-            elif block_type == "SectionHeader":
-                section_id = insert_content(block, parent_id=parent_id)
-                # update the stack for this new section level
-                section_stack.append((section_id, block.get("section_hierarchy", {})))
-                traverse_blocks(block.get("children", []), parent_id=section_id)
-            elif block_type in {"Text", "ListItem"}:
-                # its parent is the latest nested item if we even have one. else it's just the page.
-                insert_content(block, parent_id=section_stack[-1][0] if section_stack else parent_id)
-            elif block_type == "ListGroup":
-                traverse_blocks(block.get("children", []), parent_id=section_stack[-1][0] if section_stack else parent_id)
+    async def process_file(
+        self,
+        file_path: PdfSource,
+        file_type: str,
+        metadata: Optional[Dict] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> List[DocumentChunk]:
+        """
+        Process a saved file and return all of its chunks as a list.
+        Prefer iter_chunks for large documents.
+        Args:
+            file_path: Path to the saved file, or its bytes (see StagedUpload)
+            file_type: File type, e.g. 'pdf'
+            metadata: Optional metadata about the document
+            progress: Optional callback awaited with (pages_done, pages_total)
+        Returns:
+            List[DocumentChunk]: Processed document chunks
+        """
+        return [chunk async for chunk in self.iter_chunks(file_path, file_type, metadata, progress)]
 
-    # 2. Begin traversal
-    traverse_blocks(json_data.get("children", []))
-    return {"status": "success", "source_id": source.source_id}
+# CONSTANTS
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 
 # -------------------
 
 # for the chunking
 
-async def save_upload_file(upload_file: UploadFile) -> str:
+@dataclass
+class StagedUpload:
     """
-    Save an uploaded file asynchronously with improved error handling and cleanup.
-    Args:
-        upload_file: FastAPI UploadFile object
-    Returns:
-        str: Path to the saved file
+    An upload saved to UPLOAD_DIR. `data` also holds its bytes when it was small
+    enough (UPLOAD_MEMORY_MAX_BYTES) to hand straight to the PDF engine.
     """
-    try:
-        # Create uploads directory if it doesn't exist
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
-        # Generate unique filename with original extension
-        ext = Path(upload_file.filename).suffix or '.pdf'
-        filename = f"{uuid.uuid4()}{ext}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        # Save file in chunks
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            while chunk := await upload_file.read(CHUNK_SIZE):
-                await out_file.write(chunk)
-                
-        return file_path
-        
-    except Exception as e:
-        # Clean up partial file if save fails
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-        raise RuntimeError(f"Failed to save upload file: {str(e)}")
+    path: str
+    size: int
+    data: Optional[bytes] = None
+
+    @property
+    def document(self) -> PdfSource:
+        """What to open: the bytes when they were kept, the saved file otherwise."""
+        return self.data if self.data is not None else self.path
+
+def _copy_upload(source, file_path: str, digest, keep_in_memory: bool) -> Optional[bytes]:
+    """
+    Copy a spooled upload into file_path, hashing it on the way, in a single pass on
+    one thread. Small uploads are read whole (they are still in memory) and returned.
+    """
+    source.seek(0)
+    with open(file_path, 'wb') as out_file:
+        if keep_in_memory:
+            data = source.read()
+            if digest is not None:
+                digest.update(data)
+            out_file.write(data)
+            return data
+
+        buffer = bytearray(config.UPLOAD_COPY_BUFFER_BYTES)
+        view = memoryview(buffer)
+        while read := source.readinto(buffer):
+            if digest is not None:
+                digest.update(view[:read])
+            out_file.write(view[:read])
+        return None
 
-async def _split_pdf_into_chunks(
-    self, 
-    upload_file: UploadFile, 
-    source_id: int,
-    metadata: Dict
-) -> List[DocumentChunk]:
+def _upload_size(upload_file: UploadFile) -> int:
+    size = getattr(upload_file, "size", None)
+    if size is None:
+        upload_file.file.seek(0, os.SEEK_END)
+        size = upload_file.file.tell()
+    return size
+
+async def stage_upload(
+    upload_file: UploadFile,
+    digest=None,
+    memory_max_bytes: int = config.UPLOAD_MEMORY_MAX_BYTES
+) -> StagedUpload:
     """
-    Split PDF into semantic chunks, extract text, and return document chunks.
-    This gets us our chunk #1 (from the entire pdf, we chunk into chunks of size X)
-    Note that this is different from taking a chunk and splitting into sections
+    Save an upload to UPLOAD_DIR for its ingestion job without the 64KB async write loop:
+    the file Starlette already spooled is copied (and hashed) by one executor call.
+    Uploads of at most memory_max_bytes are also kept as bytes, so the worker can open
+    them with fitz.open(stream=...) instead of reading the copy back from disk.
     Args:
-        upload_file: FastAPI UploadFile containing the PDF
-        source_id: Unique identifier for this document source
-        metadata: Additional metadata about the document
+        upload_file: FastAPI UploadFile object
+        digest: optional hashlib object, updated with every byte as it is copied
+        memory_max_bytes: largest upload kept in memory (0 never keeps one)
     Returns:
-        List of DocumentChunk objects containing the processed content
+        StagedUpload with the saved path, the size and the bytes of small uploads
     """
-    # Save upload to temp file and get path
-    path = await save_upload_file(upload_file)
-    chunks = []
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    ext = Path(upload_file.filename).suffix or '.pdf'
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
 
     try:
-        # Open PDF handler
-        doc = fitz.open(path)
-        
-        # Process PDF in chunks of pages
-        chunk_size = 5
-
-        for chunk_start in range(0, len(doc), chunk_size):
-            # Get page range for this chunk
-            chunk_end = min(chunk_start + chunk_size, len(doc))
-            
-            # Extract text from pages in this chunk
-            chunk_text = ""
-            for page_num in range(chunk_start, chunk_end):
-                page = doc[page_num]
-                chunk_text += page.get_text()
-            
-            # Clean and normalize the extracted text
-            chunk_text = self._clean_text(chunk_text)
-            
-            # Create chunk object with metadata
-            chunk = DocumentChunk(
-                content=chunk_text,
-                page_number=chunk_start,
-                chunk_number=len(chunks),
-                metadata={
-                    "source_id": source_id,
-                    "page_range": f"{chunk_start}-{chunk_end-1}",
-                    **metadata
-                }
+        size = _upload_size(upload_file)
+        with INGEST_STAGE_SECONDS.time("save"):
+            data = await run_in_executor(
+                None, _copy_upload, upload_file.file, file_path, digest, size <= memory_max_bytes
             )
-            chunks.append(chunk)
-            
-    finally:
-        # Clean up temp file
-        os.remove(path)
-        
-    return chunks
+        return StagedUpload(path=file_path, size=size, data=data)
+    except Exception as e:
+        # Clean up partial file if save fails
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise RuntimeError(f"Failed to save upload file: {str(e)}")
 
-async def process_file(
-    self, 
-    upload_file: UploadFile,
-    source_id: int,
-    metadata: Dict = None
-) -> List[DocumentChunk]:
+async def save_upload_file(upload_file: UploadFile, digest=None) -> str:
     """
-    Process an uploaded file and return chunks.
-    Currently supports PDF, can be extended for other formats.
+    Save an uploaded file to UPLOAD_DIR.
     Args:
         upload_file: FastAPI UploadFile object
-        source_id: Unique identifier for the document
-        metadata: Optional metadata about the document
+        digest: optional hashlib object, updated with every chunk as it is written
+            (so the file is hashed without being read a second time)
     Returns:
-        List[DocumentChunk]: Processed document chunks
+        str: Path to the saved file
     """
-    content_type = upload_file.content_type or ''
-    
-    if 'pdf' in content_type.lower():
-        # now we need to take this, and then run marker on it
-        return await self._split_pdf_into_chunks(upload_file, source_id, metadata or {})
-    else:
-        raise ValueError(f"Unsupported file type: {content_type}")
\ No newline at end of file
+    staged = await stage_upload(upload_file, digest, memory_max_bytes=0)
+    return staged.path
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .. import config
+
+# embed(texts) -> one vector per text
+EmbedFunction = Callable[[List[str]], Awaitable[List[np.ndarray]]]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def content_hash(text: str) -> str:
+    """
+    Digest identifying a piece of content for caching and deduplication.
+    Whitespace is normalised first, so the same paragraph extracted with different
+    line breaks (the same licence boilerplate in two books) hashes the same.
+    """
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingBackend:
+    """Computes embeddings for a batch of texts. Subclasses implement embed()."""
+
+    dimension: int = config.EMBEDDING_DIMENSION
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        raise NotImplementedError
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic offline backend: signed feature hashing of the lowercased words,
+    L2-normalised. Texts sharing vocabulary get similar vectors, which is enough
+    for tests and local development without network access or model weights.
+    """
+
+    def __init__(self, dimension: int = config.EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        return [self.embed_one(text) for text in texts]
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI API, truncated to `dimension` by the model itself."""
+
+    def __init__(self, model: str = config.EMBEDDING_MODEL, dimension: int = config.EMBEDDING_DIMENSION):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI()
+        self.model = model
+        self.dimension = dimension
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        # The API rejects empty strings
+        response = await self.client.embeddings.create(
+            model=self.model,
+            input=[text or " " for text in texts],
+            dimensions=self.dimension
+        )
+        return [np.asarray(item.embedding, dtype=np.float32) for item in response.data]
+
+
+BACKENDS = {
+    "hash": HashEmbeddingBackend,
+    "openai": OpenAIEmbeddingBackend,
+}
+
+
+@dataclass
+class EmbeddingMetrics:
+    texts: int = 0  # texts requested
+    cache_hits: int = 0  # served from the cache or joined an identical in-flight text
+    batches: int = 0  # backend calls
+    embedded: int = 0  # texts sent to the backend
+    backend_seconds: float = 0.0
+    errors: int = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / self.texts, 4) if self.texts else None,
+            "batches": self.batches,
+            "embedded": self.embedded,
+            "mean_batch_size": round(self.embedded / self.batches, 2) if self.batches else None,
+            "embeddings_per_second": round(self.embedded / self.backend_seconds, 1) if self.backend_seconds else None,
+            "errors": self.errors,
+        }
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class EmbeddingService:
+    """
+    Shared front-end to an EmbeddingBackend.
+
+    - Cache: vectors are kept in an LRU keyed by content_hash, so repeated paragraphs
+      are embedded once per process.
+    - Micro-batching: cache misses from all concurrent callers (several ingestions at
+      once) are queued and sent to the backend together, as soon as batch_size texts
+      are waiting or batch_wait_ms after the first one arrived. Identical texts that
+      are already queued, or in a batch the backend has not answered yet, share its
+      result.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        batch_size: int = config.EMBEDDING_BATCH_SIZE,
+        batch_wait_ms: float = config.EMBEDDING_BATCH_WAIT_MS,
+        cache_size: int = config.EMBEDDING_CACHE_SIZE,
+        max_concurrent_batches: int = config.EMBEDDING_MAX_CONCURRENT_BATCHES
+    ):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.cache_size = cache_size
+        self.metrics = EmbeddingMetrics()
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending: Dict[str, Tuple[str, asyncio.Future]] = {}
+        # Futures of queued and in-flight texts, until their batch resolves them
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batch_slots = asyncio.Semaphore(max_concurrent_batches)
+        self._flushes = set()
+
+    @property
+    def dimension(self) -> int:
+        return self.backend.dimension
+
+    def _cache_get(self, key: str) -> Optional[np.ndarray]:
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+        return vector
+
+    def _cache_put(self, key: str, vector: np.ndarray) -> None:
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts, returning one read-only float32 vector per text, in order."""
+        self.metrics.texts += len(texts)
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        waiting = []
+
+        for index, text in enumerate(texts):
+            key = content_hash(text)
+            vector = self._cache_get(key)
+            if vector is not None:
+                self.metrics.cache_hits += 1
+                results[index] = vector
+            elif key in self._inflight:
+                self.metrics.cache_hits += 1
+                waiting.append((index, self._inflight[key]))
+            else:
+                waiting.append((index, self._enqueue(key, text)))
+
+        for index, future in waiting:
+            # Other callers may share the future: cancelling this one must not cancel it for them
+            results[index] = await asyncio.shield(future)
+        return results
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+    def _enqueue(self, key: str, text: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # A failed batch fails every future in it, including those no caller awaits any
+        # more (cancelled, or after an earlier text failed); don't log them as unretrieved
+        future.add_done_callback(_retrieve_exception)
+        future.add_done_callback(lambda done: self._forget(key, done))
+        self._pending[key] = (text, future)
+        self._inflight[key] = future
+
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_wait, self._start_flush)
+        return future
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        # Resolved: the vector is in the cache, or the next caller tries again
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        keys = list(self._pending)[:self.batch_size]
+        batch = [(key, *self._pending.pop(key)) for key in keys]
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+        # Whatever did not fit waits for the next timer, or goes now if a full batch is left
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_wait, self._start_flush)
+
+    async def _flush(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        async with self._batch_slots:
+            started = time.perf_counter()
+            try:
+                vectors = await self.backend.embed([text for _, text, _ in batch])
+            except Exception as e:
+                self.metrics.errors += 1
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            finally:
+                self.metrics.backend_seconds += time.perf_counter() - started
+
+        self.metrics.batches += 1
+        self.metrics.embedded += len(batch)
+        for (key, _, future), vector in zip(batch, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            vector.setflags(write=False)
+            self._cache_put(key, vector)
+            if not future.done():
+                future.set_result(vector)
+
+
+_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """The process-wide EmbeddingService, using the EMBEDDING_BACKEND backend."""
+    global _service
+    if _service is None:
+        _service = EmbeddingService(BACKENDS[config.EMBEDDING_BACKEND]())
+    return _service
@@ -0,0 +1,360 @@
+"""
+Exports of sources and their content for downstream copies (a CDN, a warehouse),
+as NDJSON or Arrow IPC streams.
+
+Rows are read through server-side cursors, EXPORT_BATCH_SIZE at a time, and written
+out batch by batch, so memory use does not grow with the table and the first bytes
+leave before the last row is read. Every export runs in one REPEATABLE READ
+transaction and carries a watermark: passing it as `since` to the next export gets the
+rows created or updated after it.
+
+Rows are stamped with the start time of the transaction that wrote them, and an ingest
+transaction can run for many minutes, so a row committed just after an export's
+snapshot may carry a time long before it. The watermark is therefore the start of the
+oldest transaction open on the primary just before the snapshot is taken (or that
+moment, if none is): anything the snapshot misses was written by a transaction that
+started later. Exports read from the primary, since a replica's snapshot trails it.
+The database role needs to see other sessions in pg_stat_activity (the same role, or
+pg_read_all_stats). Rows are keyed by their ids and may be sent again by the next
+incremental export, so consumers upsert them. Deleted rows are not reported; a full
+export replaces them.
+
+NDJSON is one JSON object per line with a "type": the "source" lines, then the
+"content" lines, then an "end" line with the watermark and row counts; a stream
+without the end line was cut short. Embeddings, when included, are little-endian
+float16 vectors, base64-encoded in NDJSON and raw bytes in Arrow. An Arrow stream
+holds one table, with the watermark in its schema metadata.
+"""
+import base64
+import io
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..models import KnowledgeBaseContent, KnowledgeBaseSource
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Written last by export_to_directory, with the watermark the next incremental export starts from
+MANIFEST = "export.json"
+
+# Start of the oldest transaction of another client session, or now if there is none
+OLDEST_OPEN_TRANSACTION = text(
+    "SELECT LEAST(LOCALTIMESTAMP, min(xact_start)::timestamp) FROM pg_stat_activity "
+    "WHERE backend_type = 'client backend' AND pid <> pg_backend_pid()"
+)
+
+SOURCE_EXPORT_COLUMNS = (
+    "source_id",
+    "name",
+    "description",
+    "source_type",
+    "author",
+    "publisher",
+    "publication_date",
+    "license",
+    "language",
+    "url",
+    "created_at",
+    "updated_at",
+)
+
+CONTENT_EXPORT_COLUMNS = (
+    "content_id",
+    "source_id",
+    "parent_content_id",
+    "path",
+    "title",
+    "content",
+    "content_type",
+    "content_hash",
+    "created_at",
+    "updated_at",
+)
+
+
+def check_export_format(format: str) -> None:
+    """Raises ValueError for an unknown format, or for Arrow without pyarrow installed."""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if format == "arrow":
+        _pyarrow()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("Arrow export needs pyarrow installed")
+    return pyarrow
+
+
+def encode_embedding(vector) -> Optional[bytes]:
+    """A vector as little-endian float16 bytes (half the size of float32)."""
+    if vector is None:
+        return None
+    return np.asarray(vector, dtype="<f2").tobytes()
+
+
+def build_sources_query(source_ids: Optional[Sequence[int]] = None, since: Optional[datetime] = None):
+    query = select(*(getattr(KnowledgeBaseSource, column) for column in SOURCE_EXPORT_COLUMNS))
+    if source_ids is not None:
+        query = query.where(KnowledgeBaseSource.source_id.in_(list(source_ids)))
+    if since is not None:
+        query = query.where(KnowledgeBaseSource.updated_at >= since)
+    return query.order_by(KnowledgeBaseSource.source_id)
+
+
+def build_content_query(
+    source_ids: Optional[Sequence[int]] = None,
+    since: Optional[datetime] = None,
+    embeddings: bool = False
+):
+    columns = [getattr(KnowledgeBaseContent, column) for column in CONTENT_EXPORT_COLUMNS]
+    if embeddings:
+        columns.append(KnowledgeBaseContent.embedding)
+    query = select(*columns)
+    if source_ids is not None:
+        query = query.where(KnowledgeBaseContent.source_id.in_(list(source_ids)))
+    if since is not None:
+        query = query.where(KnowledgeBaseContent.updated_at >= since)
+    return query.order_by(KnowledgeBaseContent.content_id)
+
+
+class ExportService:
+    """
+    One export of the sources `source_ids` (all sources if None) and their content,
+    limited to rows created or updated at or after `since` when given. Call begin()
+    first, then read sources() and content(), each once.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        source_ids: Optional[Sequence[int]] = None,
+        since: Optional[datetime] = None,
+        embeddings: bool = False
+    ):
+        self.db = db
+        self.source_ids = source_ids
+        self.since = since
+        self.embeddings = embeddings
+        self.watermark: Optional[datetime] = None
+        self.counts = {"sources": 0, "content": 0}
+
+    async def begin(self) -> datetime:
+        """Start the export's transaction; returns its watermark."""
+        # In a transaction of its own, so that it is read before the export's snapshot;
+        # not marked read_only, so this and every later statement of the session use the primary
+        self.watermark = (await self.db.execute(OLDEST_OPEN_TRANSACTION)).scalar_one()
+        await self.db.commit()
+        # Sources and content are read from the same snapshot
+        await self.db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+        return self.watermark
+
+    async def sources(self) -> AsyncIterator[List[dict]]:
+        async for rows in self._batches(build_sources_query(self.source_ids, self.since), "sources"):
+            yield rows
+
+    async def content(self) -> AsyncIterator[List[dict]]:
+        query = build_content_query(self.source_ids, self.since, self.embeddings)
+        async for rows in self._batches(query, "content"):
+            if self.embeddings:
+                for row in rows:
+                    row["embedding"] = encode_embedding(row["embedding"])
+            yield rows
+
+    async def _batches(self, query, table: str) -> AsyncIterator[List[dict]]:
+        result = await self.db.stream(query)
+        async for rows in result.partitions(config.EXPORT_BATCH_SIZE):
+            self.counts[table] += len(rows)
+            yield [dict(row._mapping) for row in rows]
+
+    def summary(self) -> dict:
+        return {
+            "watermark": self.watermark.isoformat(),
+            "since": self.since.isoformat() if self.since else None,
+            **self.counts,
+        }
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _ndjson(rows: List[dict], row_type: str) -> bytes:
+    return "".join(
+        json.dumps({"type": row_type, **row}, default=_json_value, ensure_ascii=False) + "\n" for row in rows
+    ).encode()
+
+
+async def ndjson_export(export: ExportService) -> AsyncIterator[bytes]:
+    """The export as NDJSON, a chunk per batch of rows; begin() must have been called."""
+    async for rows in export.sources():
+        yield _ndjson(rows, "source")
+    async for rows in export.content():
+        yield _ndjson(rows, "content")
+    yield _ndjson([export.summary()], "end")
+
+
+def arrow_schema(table: str, embeddings: bool = False, metadata: Optional[Dict[str, str]] = None):
+    pa = _pyarrow()
+    timestamp = pa.timestamp("us")
+    if table == "sources":
+        fields = [
+            ("source_id", pa.int64()), ("name", pa.string()), ("description", pa.string()),
+            ("source_type", pa.string()), ("author", pa.string()), ("publisher", pa.string()),
+            ("publication_date", pa.date32()), ("license", pa.string()), ("language", pa.string()),
+            ("url", pa.string()), ("created_at", timestamp), ("updated_at", timestamp),
+        ]
+    else:
+        fields = [
+            ("content_id", pa.int64()), ("source_id", pa.int64()), ("parent_content_id", pa.int64()),
+            ("path", pa.string()), ("title", pa.string()), ("content", pa.string()),
+            ("content_type", pa.string()), ("content_hash", pa.string()),
+            ("created_at", timestamp), ("updated_at", timestamp),
+        ]
+        if embeddings:
+            fields.append(("embedding", pa.binary(2 * config.EMBEDDING_DIMENSION)))
+    return pa.schema(fields, metadata=metadata)
+
+
+class _Chunks(io.RawIOBase):
+    """Collects what the Arrow stream writer writes, to be sent as it is produced."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+async def arrow_export(
+    export: ExportService,
+    table: str,
+    metadata: Optional[Dict[str, str]] = None
+) -> AsyncIterator[bytes]:
+    """
+    One table of the export ("sources" or "content") as an Arrow IPC stream, a record
+    batch per batch of rows, with the watermark (and `metadata`) in the schema
+    metadata; begin() must have been called.
+    """
+    pa = _pyarrow()
+    schema = arrow_schema(table, export.embeddings, {"watermark": export.watermark.isoformat(), **(metadata or {})})
+    sink = _Chunks()
+    writer = pa.ipc.new_stream(sink, schema)
+    async for rows in export.sources() if table == "sources" else export.content():
+        writer.write_batch(pa.record_batch(
+            [pa.array([row[field.name] for row in rows], type=field.type) for field in schema],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def stream_source_export(
+    session_factory,
+    source_id: int,
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    embeddings: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    The export of one source for GET /sources/{id}/export, in its own session (the
+    response outlives the request's). In Arrow, the stream is the content table and
+    the source row is in the schema metadata, as JSON under "source".
+    """
+    async with session_factory() as db:
+        export = ExportService(db, [source_id], since, embeddings)
+        await export.begin()
+        if format == "ndjson":
+            async for chunk in ndjson_export(export):
+                yield chunk
+            return
+
+        # The source is exported whole, whatever `since`
+        source = (await db.execute(build_sources_query([source_id]))).first()
+        metadata = {"source": json.dumps(dict(source._mapping) if source else None, default=_json_value)}
+        async for chunk in arrow_export(export, "content", metadata):
+            yield chunk
+
+
+async def _write_file(path: Path, chunks: AsyncIterator[bytes]) -> str:
+    # Readers of the directory never see a half-written file
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "wb") as out_file:
+        async for chunk in chunks:
+            out_file.write(chunk)
+    os.replace(partial, path)
+    return path.name
+
+
+def read_manifest(directory: Path) -> Optional[dict]:
+    """The manifest of the last export written to `directory`, or None."""
+    try:
+        return json.loads((Path(directory) / MANIFEST).read_text())
+    except FileNotFoundError:
+        return None
+
+
+async def export_to_directory(
+    db: AsyncSession,
+    directory: Path,
+    format: str = "ndjson",
+    source_ids: Optional[List[int]] = None,
+    since: Optional[datetime] = None,
+    embeddings: bool = False
+) -> dict:
+    """
+    Export to files in `directory`: export.ndjson, or sources.arrows and
+    content.arrows, replacing those of an earlier export, then the manifest.
+    Returns the manifest.
+    """
+    check_export_format(format)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    export = ExportService(db, source_ids, since, embeddings)
+    await export.begin()
+    if format == "ndjson":
+        files = [await _write_file(directory / "export.ndjson", ndjson_export(export))]
+    else:
+        files = [
+            await _write_file(directory / f"{table}.arrows", arrow_export(export, table))
+            for table in ("sources", "content")
+        ]
+
+    manifest = {
+        "format": format,
+        "files": files,
+        "source_ids": sorted(source_ids) if source_ids is not None else None,
+        "embeddings": embeddings,
+        **export.summary(),
+    }
+    partial = directory / (MANIFEST + ".partial")
+    partial.write_text(json.dumps(manifest, indent=2))
+    os.replace(partial, directory / MANIFEST)
+    return manifest
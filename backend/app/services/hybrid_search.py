@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import aliased
+
+from .. import config, profiling
+from ..database import AsyncSessionLocal
+from ..models import KnowledgeBaseContent
+from .embeddings import get_embedding_service
+from .text_search import build_ranked_matches
+from .vector_index import InMemoryVectorIndex, get_vector_index
+from .vector_search import HIT_COLUMNS, build_search_query
+
+logger = logging.getLogger(__name__)
+
+# pgvector's default hnsw.ef_search; an HNSW scan returns at most that many rows
+HNSW_DEFAULT_EF_SEARCH = 40
+
+Parent = aliased(KnowledgeBaseContent, name="parent")
+
+CONTEXT_COLUMNS = HIT_COLUMNS + (
+    Parent.title.label("parent_title"),
+    Parent.content.label("parent_content"),
+)
+
+
+@dataclass
+class RetrievalHit:
+    content_id: int
+    source_id: int
+    parent_content_id: Optional[int]
+    title: Optional[str]
+    content: Optional[str]
+    content_type: Optional[str]
+    parent_title: Optional[str]  # the enclosing section, for context
+    parent_content: Optional[str]
+    score: float = 0.0  # reciprocal-rank fusion score, higher is better
+    ranks: Dict[str, int] = field(default_factory=dict)  # 1-based rank in each leg that found it
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class RetrievalResult:
+    hits: List[RetrievalHit]
+    timed_out: List[str]  # legs cut off by the latency budget
+    elapsed_ms: float
+    failed: List[str] = field(default_factory=list)  # legs that raised
+    cleanup_ms: float = 0.0  # spent after the budget, waiting for cancelled legs to release their connections
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.timed_out or self.failed)
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": [hit.to_dict() for hit in self.hits],
+            "partial": self.partial,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+            "cleanup_ms": round(self.cleanup_ms, 2),
+        }
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = config.RETRIEVAL_RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fuse rankings of content ids: each id scores the sum over the rankings it appears
+    in of 1 / (k + rank). Ranks are comparable across legs where raw scores (cosine
+    distance, ts_rank_cd) are not. Returns (content_id, score), best first.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, content_id in enumerate(ranking, start=1):
+            scores[content_id] = scores.get(content_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def with_context(matches, score_column: str, descending: bool = False):
+    """
+    The hit columns and parent section of each row of `matches` (a query with content_id
+    and `score_column`), in its order: candidates and their context in one statement.
+    """
+    matches = matches.subquery("matches")
+    score = matches.c[score_column]
+    return (
+        select(*CONTEXT_COLUMNS)
+        .select_from(matches)
+        .join(KnowledgeBaseContent, KnowledgeBaseContent.content_id == matches.c.content_id)
+        .outerjoin(Parent, Parent.content_id == KnowledgeBaseContent.parent_content_id)
+        .order_by(*(
+            (score.desc(), matches.c.content_id.desc()) if descending else (score, matches.c.content_id)
+        ))
+    )
+
+
+class HybridSearchService:
+    """
+    Retrieval for /chat: pgvector nearest neighbours and full-text matches of the
+    question, fused by reciprocal rank.
+
+    The two legs run concurrently, each in its own session (so on its own connection),
+    and each fetches its candidates together with their parent sections in a single
+    statement. The question is embedded first, outside the latency budget: the budget
+    bounds the searches, not the embedding API. Legs still running when it is spent
+    are cancelled (asyncpg cancels the statement server-side) and legs that fail are
+    logged; either way the hits of the others are returned, marked partial. Cancelled
+    legs are waited for until they have released their connections; that time is
+    reported apart from elapsed_ms, as cleanup_ms.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        embed: Optional[Callable[[str], Awaitable[np.ndarray]]] = None,
+        memory_index: Optional[InMemoryVectorIndex] = None
+    ):
+        self.session_factory = session_factory
+        self.embed = embed if embed is not None else get_embedding_service().embed_one
+        self.memory_index = memory_index if memory_index is not None else get_vector_index()
+
+    async def retrieve(
+        self,
+        query: str,
+        k: int = config.RETRIEVAL_DEFAULT_K,
+        source_id: Optional[int] = None,
+        content_type: Optional[str] = None,
+        query_vector: Optional[Sequence[float]] = None,
+        budget_ms: float = config.RETRIEVAL_BUDGET_MS
+    ) -> RetrievalResult:
+        """
+        The k best content for `query` with their section context.
+        query_vector skips embedding the query. Raises ValueError for an empty query,
+        k out of range, a query vector of the wrong dimension or a budget that is not
+        positive.
+        """
+        if not query or not query.strip():
+            raise ValueError("query must not be empty")
+        if not 1 <= k <= config.VECTOR_SEARCH_MAX_K:
+            raise ValueError(f"k must be between 1 and {config.VECTOR_SEARCH_MAX_K}")
+        if budget_ms <= 0:
+            raise ValueError("budget_ms must be positive")
+        candidates = max(k, config.RETRIEVAL_CANDIDATES)
+
+        failed = []
+        if query_vector is None:
+            try:
+                query_vector = await self.embed(query)
+            except Exception:
+                logger.exception("Embedding the query failed, searching its text only")
+                failed.append("vector")
+        if query_vector is not None:
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            if query_vector.shape != (config.EMBEDDING_DIMENSION,):
+                raise ValueError(f"query vector must have {config.EMBEDDING_DIMENSION} dimensions")
+
+        started = time.perf_counter()
+        tasks = {}
+        if query_vector is not None:
+            tasks["vector"] = profiling.create_task(
+                self._vector_leg(query_vector, candidates, source_id, content_type), name="retrieval-vector"
+            )
+        tasks["text"] = profiling.create_task(
+            self._text_leg(query, candidates, source_id, content_type), name="retrieval-text"
+        )
+        await asyncio.wait(tasks.values(), timeout=budget_ms / 1000)
+
+        timed_out = [name for name, task in tasks.items() if not task.done()]
+        for name in timed_out:
+            tasks[name].cancel()
+        # The cancelled legs close their sessions (and asyncpg cancels their statements)
+        # before the result is returned, so that nothing is left running without an owner
+        cleanup_started = time.perf_counter()
+        for name, outcome in zip(
+            timed_out, await asyncio.gather(*(tasks[name] for name in timed_out), return_exceptions=True)
+        ):
+            if isinstance(outcome, Exception):
+                logger.error("Cancelling retrieval leg %s failed", name, exc_info=outcome)
+        cleanup_ms = (time.perf_counter() - cleanup_started) * 1000
+
+        legs = {}
+        for name, task in tasks.items():
+            if name in timed_out:
+                continue
+            if task.exception() is not None:
+                logger.error("Retrieval leg %s failed", name, exc_info=task.exception())
+                failed.append(name)
+                continue
+            legs[name] = task.result()
+
+        found = {hit.content_id: hit for hits in legs.values() for hit in hits}
+        for name, hits in legs.items():
+            for rank, hit in enumerate(hits, start=1):
+                found[hit.content_id].ranks[name] = rank
+        fused = reciprocal_rank_fusion([[hit.content_id for hit in hits] for hits in legs.values()])[:k]
+        for content_id, score in fused:
+            found[content_id].score = score
+
+        return RetrievalResult(
+            hits=[found[content_id] for content_id, _ in fused],
+            timed_out=timed_out,
+            elapsed_ms=(time.perf_counter() - started) * 1000 - cleanup_ms,
+            failed=failed,
+            cleanup_ms=cleanup_ms
+        )
+
+    async def _vector_leg(
+        self,
+        query_vector: np.ndarray,
+        candidates: int,
+        source_id: Optional[int],
+        content_type: Optional[str]
+    ) -> List[RetrievalHit]:
+        async with self.session_factory() as db:
+            if await self.memory_index.in_sync(db, source_id):
+                nearest = self.memory_index.search(query_vector, candidates, source_id, content_type)
+                if not nearest:
+                    return []
+                result = await db.execute(
+                    with_context(
+                        select(KnowledgeBaseContent.content_id)
+                        .where(KnowledgeBaseContent.content_id.in_([content_id for content_id, _ in nearest])),
+                        "content_id"
+                    )
+                )
+                rows = {row.content_id: row for row in result}
+                # Content deleted since it was indexed is skipped
+                return [RetrievalHit(**rows[content_id]._mapping) for content_id, _ in nearest if content_id in rows]
+
+            if candidates > HNSW_DEFAULT_EF_SEARCH:
+                await db.execute(
+                    text(f"SET LOCAL hnsw.ef_search = {int(candidates)}"), bind_arguments={"read_only": True}
+                )
+            result = await db.execute(
+                with_context(build_search_query(query_vector, candidates, source_id, content_type), "distance")
+            )
+            return [RetrievalHit(**row._mapping) for row in result]
+
+    async def _text_leg(
+        self,
+        query: str,
+        candidates: int,
+        source_id: Optional[int],
+        content_type: Optional[str]
+    ) -> List[RetrievalHit]:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                with_context(build_ranked_matches(query, candidates, source_id, content_type), "rank", descending=True)
+            )
+            return [RetrievalHit(**row._mapping) for row in result]
@@ -0,0 +1,430 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..database import IngestSessionLocal
+from ..metrics import INGEST_STAGE_SECONDS
+from ..models import IngestionJob
+from ..profiling import Profile, current_profile, new_profile_id
+from .deduplication import (
+    find_active_job_by_digest,
+    find_source_by_digest,
+    get_stored_embeddings,
+    record_source_file,
+)
+from .document_processor import DocumentProcessor
+from .ingestion_pipeline import IngestionPipeline
+from .question_bank import QuestionBankService
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue is at capacity and new uploads must back off."""
+
+
+def job_status(job: IngestionJob) -> dict:
+    """
+    Describe an ingestion job for the API, including its extraction throughput.
+    Throughput is measured between two database timestamps (started_at and the last
+    progress update) so it is not skewed by clock differences between API hosts.
+    """
+    pages_per_second = None
+    if job.started_at and job.pages_processed:
+        end = job.finished_at or job.updated_at
+        elapsed = (end - job.started_at).total_seconds() if end else 0
+        if elapsed > 0:
+            pages_per_second = round(job.pages_processed / elapsed, 2)
+
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "filename": job.filename,
+        "source_id": job.source_id,
+        "pages_total": job.pages_total,
+        "pages_processed": job.pages_processed,
+        "chunks_processed": job.chunks_processed,
+        "pages_per_second": pages_per_second,
+        "attempts": job.attempts,
+        "error": job.error,
+        "profile_id": job.profile_id,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class IngestionJobService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def queue_depth(self) -> int:
+        """Number of jobs waiting to be picked up."""
+        result = await self.db.execute(
+            select(func.count()).select_from(IngestionJob).where(IngestionJob.status == "queued")
+        )
+        return result.scalar_one()
+
+    async def status_counts(self) -> Dict[str, int]:
+        """Number of jobs per status (queued, running, succeeded, failed)."""
+        result = await self.db.execute(
+            select(IngestionJob.status, func.count()).group_by(IngestionJob.status)
+        )
+        return dict(result.all())
+
+    async def ensure_capacity(self) -> None:
+        """
+        Apply back-pressure before accepting an upload.
+        Raises IngestionQueueFull when INGEST_MAX_QUEUED_JOBS jobs are already waiting.
+        """
+        depth = await self.queue_depth()
+        if depth >= config.INGEST_MAX_QUEUED_JOBS:
+            raise IngestionQueueFull(
+                f"Ingestion queue is full ({depth} jobs waiting), retry later"
+            )
+
+    async def enqueue(
+        self,
+        filename: str,
+        file_path: str,
+        file_digest: Optional[str] = None,
+        profile_id: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Persist a new queued job for a saved upload; with a profile_id, the worker
+        processes it under a Profile saved with that id.
+        Returns the created IngestionJob instance.
+        """
+        job = IngestionJob(
+            filename=filename, file_path=file_path, file_digest=file_digest, status="queued", profile_id=profile_id
+        )
+        self.db.add(job)
+        await self.db.commit()
+        return job
+
+    async def get_job(self, job_id: int) -> Optional[IngestionJob]:
+        return await self.db.get(IngestionJob, job_id)
+
+
+class IngestionWorkerPool:
+    """
+    Drains the ingestion_jobs table with a fixed number of asyncio worker tasks.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of API
+    processes can run a pool against the same queue. The CPU-bound PDF extraction is
+    shipped to a shared ProcessPoolExecutor; the worker tasks only orchestrate I/O.
+
+    Small uploads can be handed over in memory (hand_over) so the worker that claims
+    their job opens the bytes instead of reading the saved file back. The file stays
+    the source of truth: jobs claimed by another process, retried after a crash, or
+    over the memory budget read it from disk.
+    """
+
+    def __init__(
+        self,
+        session_factory=IngestSessionLocal,
+        workers: int = config.INGEST_WORKERS,
+        process_pool_size: int = config.INGEST_PROCESS_POOL_SIZE,
+        poll_interval: float = config.INGEST_POLL_INTERVAL
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.process_pool_size = process_pool_size
+        self.poll_interval = poll_interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._staged: Dict[int, bytes] = {}
+        self._staged_bytes = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        if self.running or self.workers <= 0:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.process_pool_size)
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"ingestion-worker-{number}")
+            for number in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs they were running are re-queued once they go stale."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def notify(self) -> None:
+        """Wake idle workers after a job was enqueued by this process."""
+        self._wakeup.set()
+
+    def hand_over(self, job_id: int, data: bytes) -> bool:
+        """
+        Keep the bytes of a just-enqueued upload for the worker that processes it.
+        Returns False (the job will read its file) when this process runs no workers
+        or the in-memory uploads would exceed UPLOAD_MEMORY_BUDGET_BYTES.
+        """
+        if not self.running or self._staged_bytes + len(data) > config.UPLOAD_MEMORY_BUDGET_BYTES:
+            return False
+        self._staged[job_id] = data
+        self._staged_bytes += len(data)
+        return True
+
+    def _take_staged(self, job_id: int) -> Optional[bytes]:
+        data = self._staged.pop(job_id, None)
+        if data is not None:
+            self._staged_bytes -= len(data)
+        return data
+
+    async def _run(self) -> None:
+        while True:
+            # Cleared before claiming so a notify() during the claim is not lost
+            self._wakeup.clear()
+            try:
+                job_id = await self._claim_next()
+            except Exception:
+                logger.exception("Failed to claim ingestion job")
+                job_id = None
+
+            if job_id is None:
+                # Nothing left to claim: staged uploads belong to jobs another process took
+                self._staged.clear()
+                self._staged_bytes = 0
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job_id)
+
+    async def _claim_next(self) -> Optional[int]:
+        """
+        Atomically move the oldest runnable job to 'running'.
+        Stale running jobs (worker crashed mid-job) are picked up again until
+        they run out of attempts, then marked failed.
+        """
+        stale_cutoff = func.now() - timedelta(seconds=config.INGEST_STALE_JOB_SECONDS)
+        async with self.session_factory() as db:
+            abandoned = (await db.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.status == "running",
+                    IngestionJob.updated_at < stale_cutoff,
+                    IngestionJob.attempts >= config.INGEST_MAX_ATTEMPTS
+                )
+                .values(
+                    status="failed",
+                    error=f"Abandoned after {config.INGEST_MAX_ATTEMPTS} attempts: the worker stopped each time",
+                    finished_at=func.now()
+                )
+                .returning(IngestionJob.job_id, IngestionJob.file_path)
+                .execution_options(synchronize_session=False)
+            )).all()
+
+            result = await db.execute(
+                select(IngestionJob.job_id)
+                .where(
+                    or_(
+                        IngestionJob.status == "queued",
+                        and_(
+                            IngestionJob.status == "running",
+                            IngestionJob.updated_at < stale_cutoff
+                        )
+                    ),
+                    IngestionJob.attempts < config.INGEST_MAX_ATTEMPTS
+                )
+                .order_by(IngestionJob.job_id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job_id = result.scalar_one_or_none()
+            if job_id is not None:
+                await db.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.job_id == job_id)
+                    .values(
+                        status="running",
+                        attempts=IngestionJob.attempts + 1,
+                        pages_processed=0,
+                        started_at=func.now(),
+                        error=None
+                    )
+                )
+            await db.commit()
+
+        for abandoned_id, file_path in abandoned:
+            logger.warning(
+                "Ingestion job %s failed: abandoned after %d attempts", abandoned_id, config.INGEST_MAX_ATTEMPTS
+            )
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return job_id
+
+    async def _process(self, job_id: int) -> None:
+        data = self._take_staged(job_id)
+        async with self.session_factory() as db:
+            job = await db.get(IngestionJob, job_id)
+            profile_id = job.profile_id
+        if profile_id is None:
+            await self._ingest(job_id, data)
+            return
+
+        with Profile(profile_id) as profile:
+            await self._ingest(job_id, data)
+        try:
+            profile.save()
+        except OSError:
+            logger.exception("Could not save profile %s of ingestion job %s", profile_id, job_id)
+
+    async def _ingest(self, job_id: int, data: Optional[bytes]) -> None:
+        async with self.session_factory() as db:
+            job = await db.get(IngestionJob, job_id)
+            file_path, filename, file_digest = job.file_path, job.filename, job.file_digest
+
+            async def report_progress(pages_done: int, pages_total: int) -> None:
+                # Own session: the ingestion transaction on `db` must not be committed early
+                async with self.session_factory() as progress_db:
+                    await progress_db.execute(
+                        update(IngestionJob)
+                        .where(IngestionJob.job_id == job_id)
+                        .values(pages_processed=pages_done, pages_total=pages_total)
+                    )
+                    await progress_db.commit()
+
+            try:
+                # An identical file finished ingesting after this one was queued
+                existing_source_id = await find_source_by_digest(db, file_digest) if file_digest else None
+                if existing_source_id is not None:
+                    source_id, chunks_processed = existing_source_id, 0
+                else:
+                    pipeline = IngestionPipeline(
+                        DocumentProcessor(executor=self._executor),
+                        embed=get_stored_embeddings().embed
+                    )
+                    source, chunks_processed = await pipeline.ingest(
+                        db, data if data is not None else file_path, filename, progress=report_progress
+                    )
+                    source_id = source.source_id
+                    if file_digest:
+                        size = len(data) if data is not None else os.path.getsize(file_path)
+                        await record_source_file(db, file_digest, source_id, filename, size)
+
+                await db.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.job_id == job_id)
+                    .values(
+                        status="succeeded",
+                        source_id=source_id,
+                        chunks_processed=chunks_processed,
+                        finished_at=func.now()
+                    )
+                )
+                await db.commit()
+                # Questions of a new source are generated once it is safely stored
+                if config.QUESTIONS_AT_INGEST and existing_source_id is None:
+                    await self._generate_questions(db, source_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Ingestion job %s failed", job_id)
+                await db.rollback()
+                await db.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.job_id == job_id)
+                    .values(status="failed", error=str(e), finished_at=func.now())
+                )
+                await db.commit()
+
+            # The upload is only needed until the job reaches a final state
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    async def _generate_questions(self, db: AsyncSession, source_id: int) -> None:
+        # The source is usable without its questions: a failed generation is logged,
+        # and POST /questions/refresh catches up later
+        try:
+            with INGEST_STAGE_SECONDS.time("questions"):
+                await QuestionBankService(db).refresh_source(source_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Question generation for source %s failed", source_id)
+            await db.rollback()
+
+
+_worker_pool: Optional[IngestionWorkerPool] = None
+
+
+def get_ingestion_workers() -> IngestionWorkerPool:
+    """The process-wide IngestionWorkerPool (started and stopped with the app)."""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = IngestionWorkerPool()
+    return _worker_pool
+
+
+async def submit_upload(
+    db: AsyncSession,
+    filename: str,
+    file_path: str,
+    file_digest: str,
+    data: Optional[bytes] = None
+) -> Tuple[int, dict]:
+    """
+    Queue a saved upload for ingestion unless an identical file (same sha256) is
+    already in the knowledge base or waiting to be processed; the saved file is then
+    removed. `data`, the bytes of a small upload, is handed to this process's workers.
+    A new job queued by a profiled request is profiled too (its profile_id is in the body).
+    Returns (HTTP status code, response body): 200 "duplicate" with the existing
+    source_id, or 202 "queued" with the new or the already queued job_id.
+    """
+    try:
+        source_id = await find_source_by_digest(db, file_digest)
+        job = None if source_id is not None else await find_active_job_by_digest(db, file_digest)
+        if source_id is not None or job is not None:
+            os.unlink(file_path)
+        if source_id is not None:
+            return 200, {
+                "status": "duplicate",
+                "message": "Document is already in the knowledge base",
+                "source_id": source_id
+            }
+        if job is not None:
+            return 202, {
+                "status": "queued",
+                "message": "Document is already queued for processing",
+                "job_id": job.job_id
+            }
+        profile_id = new_profile_id() if current_profile.get() is not None else None
+        job = await IngestionJobService(db).enqueue(filename, file_path, file_digest, profile_id)
+    except Exception:
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+        raise
+
+    workers = get_ingestion_workers()
+    if data is not None:
+        workers.hand_over(job.job_id, data)
+    workers.notify()
+    body = {
+        "status": "queued",
+        "message": "Document queued for processing",
+        "job_id": job.job_id
+    }
+    if job.profile_id:
+        body["profile_id"] = job.profile_id
+    return 202, body
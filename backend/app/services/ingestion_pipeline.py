@@ -0,0 +1,215 @@
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..metrics import INGEST_STAGE_SECONDS
+from ..models import KnowledgeBaseSource
+from ..profiling import create_task
+from .document_processor import DocumentChunk, DocumentProcessor, ProgressCallback
+from .pdf_extraction import PdfSource
+from .embeddings import EmbedFunction
+from .source_intake import InformationSource, SourceIntakeService
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _StageFailure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def buffered(items: AsyncIterator[T], size: int) -> AsyncIterator[T]:
+    """
+    Run an async iterator in its own task, handing its items over through a queue of
+    at most `size` items. The producing stage runs ahead of the consumer, but never
+    by more than `size` items, so stages overlap while memory stays bounded.
+    Errors raised by the producer are re-raised in the consumer.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    async def produce():
+        try:
+            async for item in items:
+                await queue.put(item)
+            await queue.put(_DONE)
+        except Exception as e:
+            await queue.put(_StageFailure(e))
+        finally:
+            # Let upstream stages release their resources when the consumer stops early
+            await items.aclose()
+
+    producer = create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageFailure):
+                raise item.error
+            yield item
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+
+async def batched(items: AsyncIterator[T], size: int) -> AsyncIterator[List[T]]:
+    """Group an async iterator into lists of at most `size` items."""
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def source_from_chunk(chunk: DocumentChunk, filename: str) -> InformationSource:
+    """
+    Build the document-level InformationSource from the first chunk of an upload,
+    which carries the document metadata.
+    """
+    metadata = chunk.metadata
+    return InformationSource(
+        name=metadata.get('title', filename),
+        source=metadata.get('creator', 'PDF Upload'),
+        source_description=metadata.get('subject', ''),
+        source_type='pdf_document',
+        author=metadata.get('author', ''),
+        publisher=metadata.get('producer', ''),
+        publication_date=None,  # Could parse creation_date if needed
+        license=None,
+        language='en',  # Could use langdetect here
+        url='',  # Local upload
+        content_text=chunk.content,
+        content_type='document'
+    )
+
+
+def section_from_chunk(chunk: DocumentChunk, source: InformationSource) -> InformationSource:
+    """Build the InformationSource section for a chunk after the first one."""
+    return InformationSource(
+        name=f"Page {chunk.page_number} - Chunk {chunk.chunk_number}",
+        source=source.source,
+        source_description=f"Extracted from page {chunk.page_number}",
+        source_type=source.source_type,
+        author=source.author,
+        publisher=source.publisher,
+        publication_date=source.publication_date,
+        license=source.license,
+        language=source.language,
+        url=source.url,
+        content_text=chunk.content,
+        content_type='section'
+    )
+
+
+def build_information_source(chunks: List[DocumentChunk], filename: str) -> InformationSource:
+    """
+    Build the InformationSource for an uploaded document from its processed chunks.
+    The first chunk carries the document metadata and content, the rest become sections.
+    This materialises every section; IngestionPipeline streams them instead.
+    """
+    source = source_from_chunk(chunks[0], filename)
+    source.sections = [section_from_chunk(chunk, source) for chunk in chunks[1:]]
+    return source
+
+
+class IngestionPipeline:
+    """
+    Streams an uploaded document into the knowledge base:
+
+        extract pages -> clean + chunk -> build sections -> embed -> persist
+
+    Every stage is an async generator running in its own task, connected to the next
+    one by a queue of at most `buffer_size` items, and rows are persisted in batches.
+    Peak memory is therefore bounded by the buffer and batch sizes, not by the size
+    of the document.
+    """
+
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        embed: Optional[EmbedFunction] = None,
+        buffer_size: int = config.INGEST_STAGE_BUFFER,
+        embed_batch_size: int = config.INGEST_EMBED_BATCH_SIZE,
+        persist_batch_size: int = config.INGEST_PERSIST_BATCH_SIZE
+    ):
+        self.processor = processor
+        self.embed = embed
+        self.buffer_size = buffer_size
+        self.embed_batch_size = embed_batch_size
+        self.persist_batch_size = persist_batch_size
+
+    async def _embed_stage(self, items: AsyncIterator[InformationSource]) -> AsyncIterator[InformationSource]:
+        async for batch in batched(items, self.embed_batch_size):
+            with INGEST_STAGE_SECONDS.time("embed"):
+                vectors = await self.embed([item.content_text for item in batch])
+            for item, vector in zip(batch, vectors):
+                item.embedding = vector
+                yield item
+
+    async def _section_stage(
+        self,
+        chunks: AsyncIterator[DocumentChunk],
+        filename: str
+    ) -> AsyncIterator[InformationSource]:
+        source = None
+        async for chunk in chunks:
+            if source is None:
+                source = source_from_chunk(chunk, filename)
+                yield source
+            else:
+                yield section_from_chunk(chunk, source)
+
+    def sections(
+        self,
+        file_path: PdfSource,
+        filename: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> AsyncIterator[InformationSource]:
+        """
+        Stream the InformationSource items of a saved PDF (path or bytes): the document itself first,
+        followed by its sections, each embedded when an embed function is configured.
+        """
+        chunks = buffered(
+            self.processor.iter_chunks(file_path, 'pdf', progress=progress),
+            self.buffer_size
+        )
+        items = buffered(self._section_stage(chunks, filename), self.buffer_size)
+        if self.embed is not None:
+            items = buffered(self._embed_stage(items), self.buffer_size)
+        return items
+
+    async def ingest(
+        self,
+        db: AsyncSession,
+        file_path: PdfSource,
+        filename: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> Tuple[KnowledgeBaseSource, int]:
+        """
+        Run the whole pipeline for a saved PDF and persist it in one transaction.
+        Returns a tuple of (created KnowledgeBaseSource, number of content rows written)
+        """
+        items = self.sections(file_path, filename, progress)
+        try:
+            try:
+                source = await items.__anext__()
+            except StopAsyncIteration:
+                raise ValueError("Could not extract content from PDF")
+
+            return await SourceIntakeService(db).process_source_stream(
+                source, items, batch_size=self.persist_batch_size
+            )
+        finally:
+            # Stop the stages (and the extraction) now if writing failed, rather than
+            # leaving them parked on full queues until the generator is collected
+            await items.aclose()
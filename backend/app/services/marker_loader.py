@@ -0,0 +1,206 @@
+import html
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..cache import get_cache
+from ..database import replicas
+from ..metrics import INGEST_STAGE_SECONDS
+from ..models import KnowledgeBaseContent, KnowledgeBaseSource
+from .bulk_writer import ContentBulkWriter, supports_copy
+from .embeddings import EmbedFunction, content_hash
+from .vector_index import get_vector_index
+
+# What is a "block" in marker? The smallest structural unit of the PDF: a section
+# header, a paragraph of text, a list, an image, a page footer. Pages and list groups
+# are containers; headers, text and list items are stored as content
+TITLE_LENGTH = 100
+
+# Tags open with a letter, "/", "!" or "?"; a bare "<" (as in "a < b") is text, as it
+# is for html.parser. Comments go first since they may contain ">"
+HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+HTML_TAG = re.compile(r"<[A-Za-z/!?][^>]*>")
+
+
+def html_to_text(markup: str) -> str:
+    """
+    Text of a marker block's HTML: the tags dropped and character references
+    decoded, as BeautifulSoup(markup, "html.parser").get_text() returns it for the
+    markup marker emits, at a fraction of the cost of building a tree per block.
+    """
+    if "<" in markup:
+        markup = HTML_TAG.sub("", HTML_COMMENT.sub("", markup))
+    return html.unescape(markup) if "&" in markup else markup
+
+
+@dataclass
+class MarkerBlock:
+    """A content block of a marker document, flattened; parents precede their children."""
+    block_type: str
+    text: str
+    parent: Optional[int] = None  # index of the parent block in the flattened list
+
+    @property
+    def title(self) -> Optional[str]:
+        # Text is not labelled with its own opening words; headers and list items are
+        return None if self.block_type == "Text" else self.text[:TITLE_LENGTH]
+
+
+def flatten_blocks(document: dict) -> List[MarkerBlock]:
+    """
+    Flatten the block tree of a marker JSON document, in document order.
+
+    Pages are walked through. A SectionHeader hangs under the block its container
+    hangs under and becomes the parent of its children. Text and ListItem blocks
+    (also inside a ListGroup) hang under the latest SectionHeader seen anywhere
+    before them, or under their container's parent when there was none yet.
+    Other block types (figures, tables, page headers) are skipped.
+
+    The walk keeps its own stack of child iterators, so deeply nested books do not
+    hit the recursion limit.
+    """
+    blocks: List[MarkerBlock] = []
+    latest_section: Optional[int] = None
+    stack = [(iter(document.get("children") or ()), None)]
+
+    while stack:
+        children, parent = stack[-1]
+        block = next(children, None)
+        if block is None:
+            stack.pop()
+            continue
+
+        block_type = block.get("block_type")
+        if block_type == "Page":
+            stack.append((iter(block.get("children") or ()), parent))
+        elif block_type == "SectionHeader":
+            blocks.append(MarkerBlock(block_type, html_to_text(block.get("html") or ""), parent))
+            latest_section = len(blocks) - 1
+            stack.append((iter(block.get("children") or ()), latest_section))
+        elif block_type in {"Text", "ListItem"}:
+            owner = latest_section if latest_section is not None else parent
+            blocks.append(MarkerBlock(block_type, html_to_text(block.get("html") or ""), owner))
+        elif block_type == "ListGroup":
+            owner = latest_section if latest_section is not None else parent
+            stack.append((iter(block.get("children") or ()), owner))
+    return blocks
+
+
+class MarkerDocumentLoader:
+    """
+    Saves a marker JSON document as a knowledge_base_source and one
+    knowledge_base_content row per content block, keeping the block hierarchy.
+
+    The tree is flattened once (see flatten_blocks), content ids are allocated from
+    the sequence in a single query so parent ids and paths are set client-side, and
+    the rows are written in batches (COPY when available, else ORM flushes) in one
+    transaction, committed at the end: a failed load leaves nothing behind.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        embed: Optional[EmbedFunction] = None,
+        batch_size: int = config.BULK_COPY_BATCH_SIZE,
+        embed_batch_size: int = config.INGEST_EMBED_BATCH_SIZE
+    ):
+        self.db = db
+        # When set, every block is embedded before it is written
+        self.embed = embed
+        self.batch_size = batch_size  # rows embedded and written per round
+        self.embed_batch_size = embed_batch_size
+
+    async def load(self, document: dict, source_metadata: dict) -> Tuple[KnowledgeBaseSource, int]:
+        """
+        Load a marker document. source_metadata provides title, author, language and licence.
+        Returns a tuple of (created KnowledgeBaseSource, number of content rows written)
+        """
+        blocks = flatten_blocks(document)
+        writer = ContentBulkWriter(self.db) if supports_copy(self.db) else None
+        index = get_vector_index()
+
+        source = KnowledgeBaseSource(
+            name=source_metadata.get("title", "Untitled"),
+            author=source_metadata.get("author", "Unknown"),
+            language=source_metadata.get("language", "en"),
+            license=source_metadata.get("license", "unknown"),
+            source_type="textbook"
+        )
+        self.db.add(source)
+        await self.db.flush()  # Get the source_id
+
+        contents = self._content_models(source.source_id, blocks, link_parents=writer is None)
+        if writer is not None:
+            await self._assign_ids(writer, blocks, contents)
+        # Written rows are only kept when the in-memory index tracks this source
+        indexed = [] if index.tracks(source.source_id) else None
+
+        written = 0
+        for start in range(0, len(contents), self.batch_size):
+            batch = contents[start:start + self.batch_size]
+            if self.embed:
+                await self._embed(batch)
+            with INGEST_STAGE_SECONDS.time("persist"):
+                if writer is not None:
+                    written += await writer.write(batch)
+                else:
+                    self.db.add_all(batch)
+                    await self.db.flush()
+                    written += len(batch)
+            if indexed is not None:
+                indexed.extend(batch)
+
+        await self.db.commit()
+        replicas.note_write()
+        await get_cache().invalidate_source(source.source_id)
+        if indexed:
+            index.add_contents(indexed)
+        return source, written
+
+    def _content_models(
+        self,
+        source_id: int,
+        blocks: List[MarkerBlock],
+        link_parents: bool
+    ) -> List[KnowledgeBaseContent]:
+        contents = []
+        for block in blocks:
+            content = KnowledgeBaseContent(
+                source_id=source_id,
+                title=block.title,
+                content=block.text,
+                content_type=block.block_type,
+                content_hash=content_hash(block.text) if block.text else None
+            )
+            if link_parents and block.parent is not None:
+                # Without pre-allocated ids the unit of work inserts parents first
+                content.parent = contents[block.parent]
+            contents.append(content)
+        return contents
+
+    async def _assign_ids(
+        self,
+        writer: ContentBulkWriter,
+        blocks: List[MarkerBlock],
+        contents: List[KnowledgeBaseContent]
+    ) -> None:
+        """Set content ids, parent ids and paths of the whole tree before anything is written."""
+        ids = await writer.allocate_ids(len(contents))
+        for block, content, content_id in zip(blocks, contents, ids):
+            content.content_id = content_id
+            if block.parent is None:
+                content.path = f"{content_id}/"
+            else:
+                content.parent_content_id = ids[block.parent]
+                content.path = f"{contents[block.parent].path}{content_id}/"
+
+    async def _embed(self, contents: List[KnowledgeBaseContent]) -> None:
+        for start in range(0, len(contents), self.embed_batch_size):
+            batch = contents[start:start + self.embed_batch_size]
+            with INGEST_STAGE_SECONDS.time("embed"):
+                vectors = await self.embed([content.content or "" for content in batch])
+            for content, vector in zip(batch, vectors):
+                content.embedding = vector
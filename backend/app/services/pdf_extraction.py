@@ -0,0 +1,100 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from collections import deque
+from concurrent.futures import Executor
+import os
+import fitz  # PyMuPDF
+
+from .. import config
+from ..profiling import run_in_executor
+
+# PyMuPDF work that runs inside executor workers.
+# The extraction functions are plain top-level functions that take the document (a file
+# path, or the bytes of a small upload), so they can be pickled into a ProcessPoolExecutor;
+# each worker opens the document itself. extract_pages drives them from the event loop.
+
+# A saved PDF's path, or the PDF itself for uploads small enough to keep in memory.
+# Bytes are pickled into every process-pool task, so they are only worth it for small files.
+PdfSource = Union[str, bytes]
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """Open a PDF from its path, or straight from memory (no temp file) when given bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def read_pdf_info(source: PdfSource) -> Tuple[int, Dict]:
+    """
+    Read the page count and the non-empty document metadata of a PDF.
+    Args: path to the PDF, or its bytes
+    Returns: (page_count, metadata dict with keys like title, author, subject, creator, producer)
+    """
+    with open_pdf(source) as doc:
+        metadata = {key: value for key, value in (doc.metadata or {}).items() if value}
+        return doc.page_count, metadata
+
+def extract_page_range(source: PdfSource, start: int, end: int) -> List[str]:
+    """
+    Extract the text of pages [start, end) of a PDF.
+    Args: path to the PDF (or its bytes), first page (0-based), page after the last one
+    Returns: one string per page, in page order
+    """
+    with open_pdf(source) as doc:
+        return [doc[page_num].get_text() for page_num in range(start, end)]
+
+def _executor_workers(executor: Optional[Executor]) -> int:
+    """Best-effort worker count of an executor (None is the loop's default thread pool)."""
+    return getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+async def extract_pages(
+    source: PdfSource,
+    page_count: int,
+    executor: Optional[Executor] = None,
+    shard_size: int = config.EXTRACT_SHARD_PAGES,
+    max_in_flight: Optional[int] = None
+) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Extract the text of every page of a PDF in parallel, yielding (page_number, text) in page order.
+
+    The page range is split into shards of shard_size pages, and each shard is a task in
+    the executor that opens the document itself. At most max_in_flight shards are
+    submitted at a time (default: EXTRACT_SHARDS_PER_WORKER per executor worker), so
+    memory stays bounded however slowly the consumer drains the results. A new shard is
+    submitted as soon as the oldest one completes, before its pages are yielded, which
+    keeps the workers busy while the consumer works.
+    Args:
+        source: path to the PDF, or its bytes
+        page_count: number of pages (from read_pdf_info)
+        executor: a ProcessPoolExecutor for real parallelism; None uses the loop's default thread pool
+        shard_size: pages per executor task
+        max_in_flight: maximum number of submitted, unconsumed shards
+    """
+    if max_in_flight is None:
+        max_in_flight = _executor_workers(executor) * config.EXTRACT_SHARDS_PER_WORKER
+
+    shard_starts = iter(range(0, page_count, shard_size))
+    pending = deque()
+
+    def submit(start: int) -> None:
+        end = min(start + shard_size, page_count)
+        pending.append((start, run_in_executor(executor, extract_page_range, source, start, end)))
+
+    for start in shard_starts:
+        submit(start)
+        if len(pending) >= max_in_flight:
+            break
+
+    try:
+        while pending:
+            start, future = pending.popleft()
+            pages = await future
+
+            next_start = next(shard_starts, None)
+            if next_start is not None:
+                submit(next_start)
+
+            for offset, text in enumerate(pages):
+                yield start + offset, text
+    finally:
+        # The consumer stopped early (error or cancellation): drop the queued shards
+        for _, future in pending:
+            future.cancel()
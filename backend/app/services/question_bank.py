@@ -0,0 +1,322 @@
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, func, insert, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..cache import RequestCoalescer, get_cache
+from ..database import AsyncSessionLocal, replicas
+from ..models import ContentTag, KnowledgeBaseContent, Question, QuestionSet, Tag
+
+SENTENCE_PATTERN = re.compile(r"[^.!?]+[.!?]")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z-]{4,}")
+BLANK = "_____"
+
+
+@dataclass
+class GeneratedQuestion:
+    question: str
+    answer: Optional[str]
+    question_type: str  # 'cloze', 'short_answer', ...
+
+
+class QuestionGenerator:
+    """
+    Makes practice questions from the text of a section. Subclasses implement
+    generate(); `name` identifies the generator and its settings, so that a change
+    regenerates the questions made with the old ones.
+    """
+
+    name: str = ""
+
+    async def generate(self, title: Optional[str], text: str) -> List[GeneratedQuestion]:
+        raise NotImplementedError
+
+
+class TemplateQuestionGenerator(QuestionGenerator):
+    """
+    Deterministic offline generator: cloze questions, the longest word of sentences
+    spread over the text blanked out, and a short-answer question on the title.
+    Good enough for tests and local development without an LLM.
+    """
+
+    def __init__(self, per_section: int = config.QUESTIONS_PER_SECTION):
+        self.per_section = per_section
+        self.name = f"template-v1:{per_section}"
+
+    async def generate(self, title: Optional[str], text: str) -> List[GeneratedQuestion]:
+        questions = []
+        if title:
+            questions.append(GeneratedQuestion(f"Explain {title} in your own words.", None, "short_answer"))
+
+        sentences = [
+            sentence.strip() for sentence in SENTENCE_PATTERN.findall(text)
+            if len(sentence.split()) >= 6 and WORD_PATTERN.search(sentence)
+        ]
+        wanted = self.per_section - len(questions)
+        if sentences and wanted > 0:
+            stride = max(len(sentences) // wanted, 1)
+            for sentence in sentences[::stride][:wanted]:
+                answer = max(WORD_PATTERN.findall(sentence), key=len)
+                cloze = re.sub(rf"\b{re.escape(answer)}\b", BLANK, sentence, count=1)
+                questions.append(GeneratedQuestion(f"Fill in the blank: {cloze}", answer, "cloze"))
+        return questions[:self.per_section]
+
+
+class OpenAIQuestionGenerator(QuestionGenerator):
+    """Questions written by an OpenAI chat model, returned as JSON."""
+
+    def __init__(self, model: str = config.QUESTION_MODEL, per_section: int = config.QUESTIONS_PER_SECTION):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI()
+        self.model = model
+        self.per_section = per_section
+        self.name = f"openai:{model}:{per_section}"
+
+    async def generate(self, title: Optional[str], text: str) -> List[GeneratedQuestion]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            response_format={"type": "json_object"},
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        f"Write up to {self.per_section} practice questions a student could answer from "
+                        'the section below. Reply with JSON: {"questions": [{"question": ..., '
+                        '"answer": ..., "type": "short_answer" | "cloze" | "multiple_choice"}]}'
+                    ),
+                },
+                {"role": "user", "content": f"{title or ''}\n\n{text}"},
+            ],
+        )
+        items = json.loads(response.choices[0].message.content).get("questions", [])
+        return [
+            GeneratedQuestion(item["question"], item.get("answer"), item.get("type", "short_answer"))
+            for item in items[:self.per_section]
+            if item.get("question")
+        ]
+
+
+GENERATORS = {
+    "template": TemplateQuestionGenerator,
+    "openai": OpenAIQuestionGenerator,
+}
+
+_generator: Optional[QuestionGenerator] = None
+
+
+def get_question_generator() -> QuestionGenerator:
+    """The process-wide QUESTION_GENERATOR generator."""
+    global _generator
+    if _generator is None:
+        _generator = GENERATORS[config.QUESTION_GENERATOR]()
+    return _generator
+
+
+def build_stale_sections_query(source_id: int, generator: str, after: int, limit: int, force: bool = False):
+    """
+    Content of a source with text whose questions are missing, were made from other
+    text (content_hash) or by another generator; with force, all of it. In content_id
+    order from after `after`, `limit` rows.
+    """
+    query = (
+        select(
+            KnowledgeBaseContent.content_id,
+            KnowledgeBaseContent.title,
+            KnowledgeBaseContent.content,
+            KnowledgeBaseContent.content_hash,
+        )
+        .outerjoin(QuestionSet, QuestionSet.content_id == KnowledgeBaseContent.content_id)
+        .where(KnowledgeBaseContent.source_id == source_id)
+        .where(KnowledgeBaseContent.content_id > after)
+        .where(KnowledgeBaseContent.content.isnot(None))
+        .where(KnowledgeBaseContent.content != "")
+    )
+    if not force:
+        query = query.where(or_(
+            QuestionSet.content_id.is_(None),
+            QuestionSet.generator != generator,
+            QuestionSet.content_hash.is_distinct_from(KnowledgeBaseContent.content_hash),
+        ))
+    return query.order_by(KnowledgeBaseContent.content_id).limit(limit)
+
+
+def build_questions_query(
+    limit: int,
+    source_id: Optional[int] = None,
+    content_id: Optional[int] = None,
+    tag: Optional[str] = None,
+    after: Optional[int] = None
+):
+    """
+    A page of questions in question_id order, after question `after`, served from the
+    (source_id, question_id) or (content_id, question_id) index.
+    """
+    query = (
+        select(
+            Question.question_id,
+            Question.content_id,
+            Question.source_id,
+            KnowledgeBaseContent.title.label("section_title"),
+            Question.question,
+            Question.answer,
+            Question.question_type,
+        )
+        .join(KnowledgeBaseContent, KnowledgeBaseContent.content_id == Question.content_id)
+    )
+    if source_id is not None:
+        query = query.where(Question.source_id == source_id)
+    if content_id is not None:
+        query = query.where(Question.content_id == content_id)
+    if tag is not None:
+        query = query.where(
+            exists()
+            .where(ContentTag.content_id == Question.content_id)
+            .where(ContentTag.tag_id == Tag.tag_id)
+            .where(Tag.name == tag)
+        )
+    if after is not None:
+        query = query.where(Question.question_id > after)
+    return query.order_by(Question.question_id).limit(limit)
+
+
+class QuestionBankService:
+    def __init__(self, db: AsyncSession, generator: Optional[QuestionGenerator] = None):
+        self.db = db
+        self._generator = generator
+
+    @property
+    def generator(self) -> QuestionGenerator:
+        # Only refreshes need one; serving questions must not set up an LLM client
+        if self._generator is None:
+            self._generator = get_question_generator()
+        return self._generator
+
+    async def refresh_source(self, source_id: int, force: bool = False) -> Dict[str, int]:
+        """
+        Generate the questions of the sections of a source that changed since theirs
+        were made (or have none), replacing the old ones; with force, of every section.
+        Sections are generated QUESTION_GENERATION_CONCURRENCY at a time and written
+        QUESTION_REFRESH_BATCH per transaction, so an interrupted refresh keeps what it
+        finished. Returns the counts of sections and questions generated.
+        """
+        slots = asyncio.Semaphore(config.QUESTION_GENERATION_CONCURRENCY)
+
+        async def generate(row) -> List[GeneratedQuestion]:
+            async with slots:
+                return await self.generator.generate(row.title, row.content)
+
+        sections = questions = 0
+        after = 0
+        while True:
+            rows = (await self.db.execute(build_stale_sections_query(
+                source_id, self.generator.name, after, config.QUESTION_REFRESH_BATCH, force
+            ))).all()
+            if not rows:
+                break
+            generated = await asyncio.gather(*(generate(row) for row in rows))
+
+            content_ids = [row.content_id for row in rows]
+            await self.db.execute(delete(Question).where(Question.content_id.in_(content_ids)))
+            values = [
+                {
+                    "content_id": row.content_id,
+                    "source_id": source_id,
+                    "question": item.question,
+                    "answer": item.answer,
+                    "question_type": item.question_type,
+                }
+                for row, items in zip(rows, generated)
+                for item in items
+            ]
+            if values:
+                await self.db.execute(insert(Question), values)
+            upsert = pg_insert(QuestionSet).values([
+                {
+                    "content_id": row.content_id,
+                    "content_hash": row.content_hash,
+                    "generator": self.generator.name,
+                    "question_count": len(items),
+                }
+                for row, items in zip(rows, generated)
+            ])
+            await self.db.execute(upsert.on_conflict_do_update(
+                index_elements=[QuestionSet.content_id],
+                set_={
+                    "content_hash": upsert.excluded.content_hash,
+                    "generator": upsert.excluded.generator,
+                    "question_count": upsert.excluded.question_count,
+                    "generated_at": func.now(),
+                }
+            ))
+            await self.db.commit()
+            replicas.note_write()
+
+            sections += len(rows)
+            questions += len(values)
+            after = content_ids[-1]
+        if sections:
+            await get_cache().invalidate_source(source_id)
+        return {"sections": sections, "questions": questions}
+
+    async def list_questions(
+        self,
+        limit: int = config.QUESTIONS_DEFAULT_LIMIT,
+        source_id: Optional[int] = None,
+        content_id: Optional[int] = None,
+        tag: Optional[str] = None,
+        after: Optional[int] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """A page of questions and the cursor of the next page (None on the last)."""
+        result = await self.db.execute(build_questions_query(limit + 1, source_id, content_id, tag, after))
+        questions = [dict(row._mapping) for row in result]
+        next_cursor = None
+        if len(questions) > limit:
+            questions = questions[:limit]
+            next_cursor = str(questions[-1]["question_id"])
+        return questions, next_cursor
+
+
+_coalescer = RequestCoalescer()
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+async def serve_questions(
+    limit: int = config.QUESTIONS_DEFAULT_LIMIT,
+    source_id: Optional[int] = None,
+    content_id: Optional[int] = None,
+    tag: Optional[str] = None,
+    cursor: Optional[str] = None,
+    session_factory: Callable = AsyncSessionLocal,
+    coalescer: RequestCoalescer = _coalescer
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    A page of the question bank for /questions. A class opening the same chapter sends
+    many identical requests at once; those in flight together share one query.
+    Raises ValueError for a limit out of range or an invalid cursor.
+    """
+    if not 1 <= limit <= config.QUESTIONS_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {config.QUESTIONS_MAX_LIMIT}")
+    after = parse_cursor(cursor)
+
+    async def load():
+        async with session_factory() as db:
+            return await QuestionBankService(db).list_questions(
+                limit, source_id, content_id, tag, after
+            )
+
+    return await coalescer.run((limit, source_id, content_id, tag, after), load)
@@ -0,0 +1,392 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..database import IngestSessionLocal
+from ..models import UploadPart, UploadSession
+from .document_processor import UPLOAD_DIR
+from .ingestion_jobs import IngestionJobService, submit_upload
+
+logger = logging.getLogger(__name__)
+
+# One directory of part files per open session
+PARTS_DIR = os.path.join(UPLOAD_DIR, "multipart")
+
+
+class UploadNotFound(Exception):
+    """Raised for an unknown (or garbage-collected) upload session."""
+
+
+class UploadClosed(Exception):
+    """Raised when parts are sent to a session that was already completed."""
+
+
+class ChecksumMismatch(ValueError):
+    """Raised when received bytes do not hash to the checksum the client sent."""
+
+
+def count_parts(size_bytes: int, part_size: int) -> int:
+    """
+    Number of parts of a file of size_bytes split into part_size parts.
+    Raises ValueError when the sizes are outside the configured limits.
+    """
+    if size_bytes <= 0:
+        raise ValueError("size_bytes must be positive")
+    if not config.UPLOAD_MIN_PART_SIZE <= part_size <= config.UPLOAD_MAX_PART_SIZE:
+        raise ValueError(
+            f"part_size must be between {config.UPLOAD_MIN_PART_SIZE} and {config.UPLOAD_MAX_PART_SIZE} bytes"
+        )
+    part_count = -(-size_bytes // part_size)
+    if part_count > config.UPLOAD_MAX_PARTS:
+        raise ValueError(f"A file of {size_bytes} bytes needs more than {config.UPLOAD_MAX_PARTS} parts; use larger parts")
+    return part_count
+
+
+def expected_part_size(session: UploadSession, part_number: int) -> int:
+    """Every part has part_size bytes, except the last one which holds the remainder."""
+    if not 1 <= part_number <= session.part_count:
+        raise ValueError(f"part_number must be between 1 and {session.part_count}")
+    if part_number < session.part_count:
+        return session.part_size
+    return session.size_bytes - session.part_size * (session.part_count - 1)
+
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(PARTS_DIR, upload_id)
+
+
+def part_path(upload_id: str, part_number: int) -> str:
+    return os.path.join(session_dir(upload_id), f"{part_number:05d}.part")
+
+
+def _write_block(out_file, digest, block: bytes) -> None:
+    # hashlib releases the GIL on large buffers, so parts sent in parallel hash in parallel
+    digest.update(block)
+    out_file.write(block)
+
+
+async def write_part(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    expected_size: int,
+    expected_sha256: Optional[str] = None
+) -> str:
+    """
+    Stream a part's body into path, hashing it on the way. Chunks are gathered into
+    UPLOAD_COPY_BUFFER_BYTES blocks and written (and hashed) on the default executor.
+    The part is written to a temporary name and only renamed into place once its size
+    and checksum are verified, so a part file on disk is always complete.
+    Raises ValueError on a size mismatch, ChecksumMismatch on a checksum mismatch.
+    Returns the hex sha256 of the part.
+    """
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    received = 0
+    block = bytearray()
+    try:
+        with open(temp_path, "wb") as out_file:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > expected_size:
+                    raise ValueError(f"Part is larger than the expected {expected_size} bytes")
+                block += chunk
+                if len(block) >= config.UPLOAD_COPY_BUFFER_BYTES:
+                    await loop.run_in_executor(None, _write_block, out_file, digest, bytes(block))
+                    block.clear()
+            if block:
+                await loop.run_in_executor(None, _write_block, out_file, digest, bytes(block))
+
+        if received != expected_size:
+            raise ValueError(f"Part has {received} bytes, expected {expected_size}")
+        checksum = digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != checksum:
+            raise ChecksumMismatch(f"Part checksum mismatch: received data hashes to {checksum}")
+        os.replace(temp_path, path)
+        return checksum
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def assemble_parts(part_paths: Sequence[str], file_path: str, digest) -> None:
+    """Concatenate the part files into file_path in one sequential pass, hashing the whole file."""
+    buffer = bytearray(config.UPLOAD_COPY_BUFFER_BYTES)
+    view = memoryview(buffer)
+    with open(file_path, "wb") as out_file:
+        for path in part_paths:
+            with open(path, "rb") as part:
+                while read := part.readinto(buffer):
+                    digest.update(view[:read])
+                    out_file.write(view[:read])
+
+
+def upload_status(session: UploadSession, parts: List[UploadPart]) -> dict:
+    """Describe an upload session for the API, including which parts are still missing."""
+    received = {part.part_number for part in parts}
+    return {
+        "upload_id": session.upload_id,
+        "status": session.status,
+        "filename": session.filename,
+        "size_bytes": session.size_bytes,
+        "part_size": session.part_size,
+        "part_count": session.part_count,
+        "parts": [
+            {"part_number": part.part_number, "size_bytes": part.size_bytes, "sha256": part.sha256}
+            for part in sorted(parts, key=lambda part: part.part_number)
+        ],
+        "missing_parts": [number for number in range(1, session.part_count + 1) if number not in received],
+        "bytes_received": sum(part.size_bytes for part in parts),
+        "job_id": session.job_id,
+        "source_id": session.source_id,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at,
+    }
+
+
+class ResumableUploadService:
+    """
+    Resumable multi-part uploads: init -> PUT numbered parts (in any order, in
+    parallel, re-sent as often as needed) -> complete.
+
+    Session and part state lives in the database, so any API process can receive any
+    part; the part files live under UPLOAD_DIR, which the ingestion workers already
+    need to share. Completion assembles the parts into one file and queues it exactly
+    like a single-request /upload.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create(
+        self,
+        filename: str,
+        size_bytes: int,
+        part_size: Optional[int] = None,
+        sha256: Optional[str] = None
+    ) -> UploadSession:
+        part_size = part_size or config.UPLOAD_PART_SIZE
+        part_count = count_parts(size_bytes, part_size)
+        await IngestionJobService(self.db).ensure_capacity()
+
+        session = UploadSession(
+            upload_id=str(uuid.uuid4()),
+            filename=filename,
+            size_bytes=size_bytes,
+            part_size=part_size,
+            part_count=part_count,
+            file_digest=sha256.lower() if sha256 else None,
+            status="open"
+        )
+        os.makedirs(session_dir(session.upload_id), exist_ok=True)
+        self.db.add(session)
+        await self.db.commit()
+        await self.db.refresh(session)
+        return session
+
+    async def get(self, upload_id: str, for_update: bool = False) -> UploadSession:
+        query = select(UploadSession).where(UploadSession.upload_id == upload_id)
+        if for_update:
+            query = query.with_for_update()
+        result = await self.db.execute(query)
+        session = result.scalar_one_or_none()
+        if session is None:
+            raise UploadNotFound(f"Upload {upload_id} not found")
+        return session
+
+    async def parts(self, upload_id: str) -> List[UploadPart]:
+        result = await self.db.execute(
+            select(UploadPart).where(UploadPart.upload_id == upload_id).order_by(UploadPart.part_number)
+        )
+        return list(result.scalars())
+
+    async def status(self, upload_id: str) -> dict:
+        session = await self.get(upload_id)
+        return upload_status(session, await self.parts(upload_id))
+
+    async def put_part(
+        self,
+        upload_id: str,
+        part_number: int,
+        chunks: AsyncIterator[bytes],
+        sha256: Optional[str] = None
+    ) -> dict:
+        """
+        Receive one part. Sending a part again replaces it, so a client resumes by
+        re-sending whatever GET /uploads/{id} lists as missing.
+        """
+        session = await self.get(upload_id)
+        if session.status != "open":
+            raise UploadClosed(f"Upload {upload_id} is already {session.status}")
+        size = expected_part_size(session, part_number)
+        # No transaction is held open while the body streams in
+        await self.db.rollback()
+
+        checksum = await write_part(chunks, part_path(upload_id, part_number), size, sha256)
+
+        await self.db.execute(
+            insert(UploadPart)
+            .values(upload_id=upload_id, part_number=part_number, size_bytes=size, sha256=checksum)
+            .on_conflict_do_update(
+                index_elements=[UploadPart.upload_id, UploadPart.part_number],
+                set_={"size_bytes": size, "sha256": checksum, "created_at": func.now()}
+            )
+        )
+        # Keeps an upload that is still receiving parts away from the garbage collector
+        await self.db.execute(
+            update(UploadSession).where(UploadSession.upload_id == upload_id).values(updated_at=func.now())
+        )
+        await self.db.commit()
+        return {"part_number": part_number, "size_bytes": size, "sha256": checksum}
+
+    async def complete(
+        self,
+        upload_id: str,
+        part_checksums: Optional[Sequence[Tuple[int, str]]] = None
+    ) -> Tuple[int, dict]:
+        """
+        Assemble the parts and queue the file for ingestion.
+        part_checksums, (part_number, sha256) pairs the client computed, are checked
+        against the received parts. Completing twice returns the first result, so a
+        client whose connection dropped during completion can simply retry.
+        Returns (HTTP status code, response body) as submit_upload does.
+        Raises ValueError while parts are missing, ChecksumMismatch when a checksum
+        (of a part, or of the whole file given at init) does not match.
+        """
+        session = await self.get(upload_id, for_update=True)
+        if session.status == "completed":
+            source_id, job_id = session.source_id, session.job_id
+            await self.db.rollback()
+            if source_id is not None:
+                return 200, {"status": "duplicate", "message": "Document is already in the knowledge base",
+                             "source_id": source_id}
+            return 202, {"status": "queued", "message": "Document queued for processing", "job_id": job_id}
+
+        parts = {part.part_number: part for part in await self.parts(upload_id)}
+        missing = [number for number in range(1, session.part_count + 1) if number not in parts]
+        if missing:
+            raise ValueError(f"{len(missing)} parts are missing, starting with part {missing[0]}")
+        for part_number, checksum in part_checksums or []:
+            part = parts.get(part_number)
+            if part is None or part.sha256 != checksum.lower():
+                raise ChecksumMismatch(f"Part {part_number} does not match its checksum; send it again")
+
+        await IngestionJobService(self.db).ensure_capacity()
+
+        ext = os.path.splitext(session.filename)[1] or ".pdf"
+        file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
+        digest = hashlib.sha256()
+        part_paths = [part_path(upload_id, number) for number in range(1, session.part_count + 1)]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, assemble_parts, part_paths, file_path, digest)
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        file_digest = digest.hexdigest()
+        if session.file_digest and session.file_digest != file_digest:
+            os.remove(file_path)
+            raise ChecksumMismatch(f"The assembled file hashes to {file_digest}, not {session.file_digest}")
+
+        filename = session.filename
+        status_code, body = await submit_upload(self.db, filename, file_path, file_digest)
+
+        # submit_upload committed; a concurrent complete in between finds the queued
+        # job by digest, so it cannot queue the file twice
+        await self.db.execute(
+            update(UploadSession)
+            .where(UploadSession.upload_id == upload_id)
+            .values(status="completed", job_id=body.get("job_id"), source_id=body.get("source_id"))
+        )
+        await self.db.commit()
+        shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+        return status_code, body
+
+    async def abort(self, upload_id: str) -> None:
+        session = await self.get(upload_id)
+        await self.db.delete(session)
+        await self.db.commit()
+        shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+
+def remove_orphan_part_dirs(known_ids: Sequence[str], older_than: float) -> int:
+    """
+    Remove session directories with no session row (deleted, or created by a request
+    that failed before committing) that were not modified since `older_than` (epoch).
+    """
+    if not os.path.isdir(PARTS_DIR):
+        return 0
+    known = set(known_ids)
+    removed = 0
+    for entry in os.scandir(PARTS_DIR):
+        if entry.is_dir() and entry.name not in known and entry.stat().st_mtime < older_than:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+async def collect_abandoned_uploads(
+    db: AsyncSession,
+    ttl_seconds: int = config.UPLOAD_SESSION_TTL_SECONDS
+) -> int:
+    """
+    Delete upload sessions not touched for ttl_seconds, with their parts, and sweep
+    part directories left without a session. Returns the number of sessions deleted.
+    """
+    cutoff = func.now() - timedelta(seconds=ttl_seconds)
+    result = await db.execute(
+        delete(UploadSession).where(UploadSession.updated_at < cutoff).returning(UploadSession.upload_id)
+    )
+    expired = list(result.scalars())
+    await db.commit()
+    for upload_id in expired:
+        shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+    result = await db.execute(select(UploadSession.upload_id).where(UploadSession.status == "open"))
+    open_ids = list(result.scalars())
+    await db.rollback()
+    await asyncio.get_running_loop().run_in_executor(
+        None, remove_orphan_part_dirs, open_ids, time.time() - ttl_seconds
+    )
+    return len(expired)
+
+
+class UploadSessionCollector:
+    """Periodically garbage-collects abandoned upload sessions (see collect_abandoned_uploads)."""
+
+    def __init__(self, session_factory=IngestSessionLocal, interval: float = config.UPLOAD_GC_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="upload-session-collector")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    removed = await collect_abandoned_uploads(db)
+                if removed:
+                    logger.info("Removed %s abandoned upload sessions", removed)
+            except Exception:
+                logger.exception("Collecting abandoned upload sessions failed")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,229 @@
+import codecs
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from .embeddings import EmbedFunction
+from .source_intake import InformationSource, SourceIntakeService
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\r\n"
+
+
+class MalformedBatch(ValueError):
+    """Raised when a JSON array body cannot be read past some point."""
+
+
+@dataclass
+class BatchItemResult:
+    index: int  # 0-based position of the item in the body
+    source_id: Optional[int] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        if self.error is not None:
+            return {"index": self.index, "status": "failed", "error": self.error}
+        return {"index": self.index, "status": "created", "source_id": self.source_id}
+
+
+async def _decoded(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Multi-byte characters may be split across chunks
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+async def _next_text(texts: AsyncIterator[str]) -> Optional[str]:
+    try:
+        return await texts.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def read_json_items(
+    chunks: AsyncIterator[bytes],
+    max_item_bytes: int = config.SOURCE_BATCH_MAX_ITEM_BYTES
+) -> AsyncIterator[Tuple[Any, Optional[str]]]:
+    """
+    The items of a request body, as it arrives: either a JSON array or NDJSON (one
+    JSON value per line), told apart by the first character. Only the item being
+    read is buffered, up to max_item_bytes (counted in characters).
+
+    Yields (item, None), or (None, error) for an NDJSON line that is not JSON or is
+    too long; the lines after it are still read. A JSON array has no such recovery
+    point, so a malformed one raises MalformedBatch after the items before the fault.
+    """
+    texts = _decoded(chunks)
+    buffer = ""
+    while not buffer:
+        text = await _next_text(texts)
+        if text is None:
+            return
+        buffer = text.lstrip(_WHITESPACE)
+    if buffer.startswith("["):
+        async for item in _array_items(buffer[1:], texts, max_item_bytes):
+            yield item, None
+    else:
+        async for item in _ndjson_items(buffer, texts, max_item_bytes):
+            yield item
+
+
+def _parse_line(line: str) -> Tuple[Any, Optional[str]]:
+    try:
+        return json.loads(line), None
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+async def _ndjson_items(buffer: str, texts: AsyncIterator[str], max_item_bytes: int):
+    too_long = f"Item longer than {max_item_bytes} bytes"
+    skipping = False  # inside a line already reported as too long
+    text = buffer
+    buffer = ""
+    while text is not None:
+        # Only the new text is searched for line ends
+        *lines, rest = text.split("\n")
+        if lines:
+            lines[0] = buffer + lines[0]
+            buffer = ""
+        for line in lines:
+            if skipping:
+                skipping = False
+            elif len(line) > max_item_bytes:
+                yield None, too_long
+            elif line.strip():
+                yield _parse_line(line)
+        if not skipping:
+            buffer += rest
+            if len(buffer) > max_item_bytes:
+                yield None, too_long
+                buffer, skipping = "", True
+        text = await _next_text(texts)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+async def _array_items(buffer: str, texts: AsyncIterator[str], max_item_bytes: int):
+    decoder = json.JSONDecoder()
+    consumed = 1  # characters before the buffer, for error positions
+    expect_item = True  # else a ',' or the closing ']'
+    first = True
+    exhausted = False
+
+    while True:
+        stripped = buffer.lstrip(_WHITESPACE)
+        consumed += len(buffer) - len(stripped)
+        buffer = stripped
+        wanted = 1  # characters to have before looking again
+
+        if buffer and not expect_item:
+            if buffer[0] == "]":
+                return
+            if buffer[0] != ",":
+                raise MalformedBatch(f"Expected ',' or ']' at character {consumed}")
+            buffer, consumed, expect_item = buffer[1:], consumed + 1, True
+            continue
+        if buffer and expect_item:
+            if first and buffer[0] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                if exhausted:
+                    raise MalformedBatch(f"Invalid JSON at character {consumed + e.pos}: {e.msg}")
+                end = None
+            # A value that ends with the buffer (a number) may go on in the next chunk
+            if end is not None and (end < len(buffer) or exhausted):
+                yield item
+                buffer, consumed, expect_item, first = buffer[end:], consumed + end, False, False
+                continue
+            if len(buffer) > max_item_bytes:
+                raise MalformedBatch(f"Item at character {consumed} longer than {max_item_bytes} bytes")
+            # Decode a long item again only once twice as much of it has arrived
+            wanted = 2 * len(buffer)
+
+        if exhausted:
+            raise MalformedBatch("Unexpected end of the JSON array")
+        while len(buffer) < wanted:
+            text = await _next_text(texts)
+            if text is None:
+                exhausted = True
+                break
+            buffer += text
+
+
+class SourceBatchImporter:
+    """
+    Creates sources from a stream of items, SOURCE_BATCH_SIZE per transaction
+    (SourceIntakeService.process_sources). Items that fail validation are reported
+    and skipped; when saving a batch fails, it is rolled back and its sources are
+    saved one at a time, so only the sources at fault are reported as failed.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        parse: Callable[[Any], InformationSource],
+        embed: Optional[EmbedFunction] = None,
+        batch_size: int = config.SOURCE_BATCH_SIZE
+    ):
+        self.db = db
+        self.parse = parse  # raises ValueError for an invalid item
+        self.intake = SourceIntakeService(db, embed=embed)
+        self.batch_size = batch_size
+
+    async def run(self, items: AsyncIterator[Tuple[Any, Optional[str]]]) -> List[BatchItemResult]:
+        """
+        Import the (item, error) pairs of read_json_items. Returns a result per item
+        in order, including one for the point where a malformed body stopped.
+        """
+        results: List[BatchItemResult] = []
+        batch: List[Tuple[BatchItemResult, InformationSource]] = []
+        try:
+            async for item, error in items:
+                result = BatchItemResult(len(results), error=error)
+                results.append(result)
+                if error is not None:
+                    continue
+                try:
+                    batch.append((result, self.parse(item)))
+                except (ValueError, TypeError) as e:
+                    result.error = str(e)
+                    continue
+                if len(batch) >= self.batch_size:
+                    await self._save(batch)
+                    batch = []
+        except MalformedBatch as e:
+            results.append(BatchItemResult(len(results), error=f"{e}; the rest of the body was not read"))
+        await self._save(batch)
+        return results
+
+    async def _save(self, batch: List[Tuple[BatchItemResult, InformationSource]]) -> None:
+        if not batch:
+            return
+        try:
+            created = await self.intake.process_sources([source for _, source in batch])
+        except Exception:
+            await self.db.rollback()
+            logger.warning("Saving a batch of %d sources failed, retrying one at a time", len(batch), exc_info=True)
+        else:
+            for (result, _), source_model in zip(batch, created):
+                result.source_id = source_model.source_id
+            return
+
+        for result, source in batch:
+            try:
+                result.source_id = (await self.intake.process_source(source)).source_id
+            except Exception as e:
+                await self.db.rollback()
+                result.error = str(e)
@@ -1,9 +1,31 @@
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 from datetime import date
+from sqlalchemy import insert, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .. import config
+from ..cache import ALL_SOURCES_TAG, get_cache
+from ..database import replicas
+from ..metrics import INGEST_STAGE_SECONDS
 from ..models import KnowledgeBaseSource, KnowledgeBaseContent
+from .bulk_writer import ContentBulkWriter, supports_copy
+from .embeddings import EmbedFunction, content_hash
+from .vector_index import get_vector_index
+
+# knowledge_base_sources columns written by process_sources
+SOURCE_COLUMNS = (
+    "source_id",
+    "name",
+    "description",
+    "source_type",
+    "author",
+    "publisher",
+    "publication_date",
+    "license",
+    "language",
+    "url",
+)
 
 @dataclass
 class InformationSource:
@@ -20,13 +42,11 @@ class InformationSource:
     content_text: str
     content_type: str  # e.g., 'chapter', 'section', 'article'
     sections: Optional[List['InformationSource']] = None
+    embedding: Optional[List[float]] = None  # filled in by the embedding service during intake
 
-    def to_db_models(self) -> tuple[KnowledgeBaseSource, List[KnowledgeBaseContent]]:
-        """
-        Convert the InformationSource to database models.
-        Returns a tuple of (source_model, list of content_models)
-        """
-        source = KnowledgeBaseSource(
+    def to_source_model(self) -> KnowledgeBaseSource:
+        """Convert the source-level fields to a KnowledgeBaseSource."""
+        return KnowledgeBaseSource(
             name=self.name,
             description=self.source_description,
             source_type=self.source_type,
@@ -37,40 +57,57 @@ class InformationSource:
             language=self.language,
             url=self.url
         )
-        
-        contents = []
-        # Create main content
-        main_content = KnowledgeBaseContent(
+
+    def to_content_model(self) -> KnowledgeBaseContent:
+        """Convert the content fields (not the nested sections) to a KnowledgeBaseContent."""
+        return KnowledgeBaseContent(
             title=self.name,
             content=self.content_text,
-            content_type=self.content_type
+            content_type=self.content_type,
+            content_hash=content_hash(self.content_text) if self.content_text else None,
+            embedding=self.embedding
         )
+
+    def to_db_models(self) -> tuple[KnowledgeBaseSource, List[KnowledgeBaseContent]]:
+        """
+        Convert the InformationSource to database models.
+        Returns a tuple of (source_model, list of content_models)
+        """
+        source = self.to_source_model()
+        
+        contents = []
+        # Create main content
+        main_content = self.to_content_model()
         contents.append(main_content)
         
-        # Process nested sections if they exist
+        # Process nested sections if they exist, as children of the main content
         if self.sections:
             for section in self.sections:
-                section_content = KnowledgeBaseContent(
-                    title=section.name,
-                    content=section.content_text,
-                    content_type=section.content_type
-                )
+                section_content = section.to_content_model()
+                section_content.parent = main_content
                 contents.append(section_content)
         
         return source, contents
 
 class SourceIntakeService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, embed: Optional[EmbedFunction] = None):
         self.db = db
+        # When set, process_source embeds any content that arrives without an embedding
+        self.embed = embed
     
     async def process_source(self, source: InformationSource) -> KnowledgeBaseSource:
         """
         Process an information source and save it to the database.
+        Large sources are written with a single bulk COPY (see ContentBulkWriter),
+        small ones through the ORM.
         Returns the created KnowledgeBaseSource instance.
         """
         # Convert to DB models
         source_model, content_models = source.to_db_models()
         
+        if self.embed:
+            await self._embed_missing(content_models)
+        
         # Save source
         self.db.add(source_model)
         await self.db.flush()  # Get the source_id
@@ -78,7 +115,135 @@ class SourceIntakeService:
         # Link and save contents
         for content in content_models:
             content.source_id = source_model.source_id
-            self.db.add(content)
         
+        with INGEST_STAGE_SECONDS.time("persist"):
+            if len(content_models) >= config.BULK_COPY_MIN_ROWS and supports_copy(self.db):
+                await ContentBulkWriter(self.db).write(content_models)
+            else:
+                self.db.add_all(content_models)
+            await self.db.commit()
+        replicas.note_write()
+        # Cached reads of the source, and across sources, are out of date
+        await get_cache().invalidate_source(source_model.source_id)
+        # Only committed rows may reach the in-memory index
+        get_vector_index().add_contents(content_models)
+        return source_model
+
+    async def process_sources(self, sources: List[InformationSource]) -> List[KnowledgeBaseSource]:
+        """
+        Save many sources in one transaction: their content is embedded in one call,
+        the sources are written with a single multi-row INSERT (ids pre-allocated
+        from the sequence) and their content with one COPY, or through the ORM when
+        COPY is unavailable. Nothing is saved if any of them fails.
+        Returns the created KnowledgeBaseSource instances, in order (not attached to
+        the session).
+        """
+        if not sources:
+            return []
+        models = [source.to_db_models() for source in sources]
+        content_models = [content for _, contents in models for content in contents]
+
+        if self.embed:
+            await self._embed_missing(content_models)
+
+        with INGEST_STAGE_SECONDS.time("persist"):
+            source_ids = await self.db.execute(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence('knowledge_base_sources', 'source_id')) "
+                    "FROM generate_series(1, :count)"
+                ),
+                {"count": len(models)}
+            )
+            for (source_model, contents), (source_id,) in zip(models, source_ids.all()):
+                source_model.source_id = source_id
+                for content in contents:
+                    content.source_id = source_id
+            await self.db.execute(insert(KnowledgeBaseSource).values([
+                {column: getattr(source_model, column) for column in SOURCE_COLUMNS}
+                for source_model, _ in models
+            ]))
+
+            if supports_copy(self.db):
+                await ContentBulkWriter(self.db).write(content_models)
+            else:
+                self.db.add_all(content_models)
+            await self.db.commit()
+        replicas.note_write()
+        await get_cache().invalidate_tags(
+            [f"source:{source_model.source_id}" for source_model, _ in models] + [ALL_SOURCES_TAG]
+        )
+        get_vector_index().add_contents(content_models)
+        return [source_model for source_model, _ in models]
+
+    async def process_source_stream(
+        self,
+        source: InformationSource,
+        sections: AsyncIterator[InformationSource],
+        batch_size: int = 100
+    ) -> tuple[KnowledgeBaseSource, int]:
+        """
+        Save a source whose sections arrive as a stream, in a single transaction.
+        Sections are written every batch_size rows (with COPY when available, else
+        flushed through the ORM and dropped from the session), so memory use does
+        not grow with the number of sections.
+        Returns a tuple of (created KnowledgeBaseSource, number of content rows written)
+        """
+        writer = ContentBulkWriter(self.db) if supports_copy(self.db) else None
+        index = get_vector_index()
+
+        source_model = source.to_source_model()
+        self.db.add(source_model)
+        await self.db.flush()  # Get the source_id
+
+        # Written rows are only kept when the in-memory index tracks this source
+        indexed = [] if index.tracks(source_model.source_id) else None
+
+        main_content = source.to_content_model()
+        main_content.source_id = source_model.source_id
+        written = await self._write_batch([main_content], writer, indexed)
+
+        batch = []
+        async for section in sections:
+            content = section.to_content_model()
+            content.source_id = source_model.source_id
+            content.parent_content_id = main_content.content_id
+            batch.append(content)
+            if len(batch) >= batch_size:
+                written += await self._write_batch(batch, writer, indexed)
+                batch = []
+        written += await self._write_batch(batch, writer, indexed)
+
         await self.db.commit()
-        return source_model 
\ No newline at end of file
+        replicas.note_write()
+        await get_cache().invalidate_source(source_model.source_id)
+        if indexed:
+            index.add_contents(indexed)
+        return source_model, written
+
+    async def _embed_missing(self, contents: List[KnowledgeBaseContent]) -> None:
+        missing = [content for content in contents if content.embedding is None]
+        if missing:
+            with INGEST_STAGE_SECONDS.time("embed"):
+                vectors = await self.embed([content.content or "" for content in missing])
+            for content, vector in zip(missing, vectors):
+                content.embedding = vector
+
+    async def _write_batch(
+        self,
+        contents: List[KnowledgeBaseContent],
+        writer: Optional[ContentBulkWriter],
+        indexed: Optional[List[KnowledgeBaseContent]] = None
+    ) -> int:
+        with INGEST_STAGE_SECONDS.time("persist"):
+            if writer is not None:
+                written = await writer.write(contents)
+            else:
+                self.db.add_all(contents)
+                await self.db.flush()
+                for content in contents:
+                    self.db.expunge(content)
+                written = len(contents)
+
+        if indexed is not None:
+            indexed.extend(contents)
+        return written
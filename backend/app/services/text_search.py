@@ -0,0 +1,163 @@
+import base64
+import json
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..models import KnowledgeBaseContent, KnowledgeBaseSource, RegConfig
+
+# ts_headline options: up to two fragments of 10-30 words around the matches
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MinWords=10, MaxWords=30"
+
+# ts_rank_cd normalisation 32 scales the rank into [0, 1): rank / (rank + 1)
+RANK_NORMALIZATION = 32
+
+
+@dataclass
+class TextSearchHit:
+    content_id: int
+    source_id: int
+    parent_content_id: Optional[int]
+    title: Optional[str]
+    content_type: Optional[str]
+    rank: float
+    snippet: Optional[str]  # matching fragments of the content, terms wrapped in <mark>
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def encode_cursor(rank: float, content_id: int) -> str:
+    """Opaque cursor for the page after the hit with this rank and content_id."""
+    return base64.urlsafe_b64encode(json.dumps([rank, content_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, content_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rank), int(content_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def search_config(language: Optional[str], source_id: Optional[int]):
+    """
+    The text search configuration a query is parsed with: that of `language`, else
+    of the source's language when searching one source, else of
+    TEXT_SEARCH_DEFAULT_LANGUAGE. Content rows are parsed with their own source's.
+    """
+    if language is None and source_id is not None:
+        language_expression = func.coalesce(
+            select(KnowledgeBaseSource.language)
+            .where(KnowledgeBaseSource.source_id == source_id)
+            .scalar_subquery(),
+            config.TEXT_SEARCH_DEFAULT_LANGUAGE
+        )
+    else:
+        language_expression = literal(language or config.TEXT_SEARCH_DEFAULT_LANGUAGE)
+    return func.knowledge_base_text_config(language_expression, type_=RegConfig)
+
+
+def build_ranked_matches(
+    q: str,
+    limit: int,
+    source_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    language: Optional[str] = None,
+    after: Optional[Tuple[float, int]] = None
+):
+    """
+    Content matching a web-search style query (quoted phrases, OR, -word), best ranked
+    first: the `limit` rows after `after`, the (rank, content_id) of the previous row.
+    Matches come from the GIN index on search_vector.
+    """
+    tsquery = func.websearch_to_tsquery(search_config(language, source_id), q)
+    rank = cast(
+        func.ts_rank_cd(KnowledgeBaseContent.search_vector, tsquery, RANK_NORMALIZATION), Float
+    ).label("rank")
+
+    query = (
+        select(
+            KnowledgeBaseContent.content_id,
+            KnowledgeBaseContent.source_id,
+            KnowledgeBaseContent.parent_content_id,
+            KnowledgeBaseContent.title,
+            KnowledgeBaseContent.content_type,
+            rank
+        )
+        .where(KnowledgeBaseContent.search_vector.op("@@")(tsquery))
+    )
+    if source_id is not None:
+        query = query.where(KnowledgeBaseContent.source_id == source_id)
+    if content_type is not None:
+        query = query.where(KnowledgeBaseContent.content_type == content_type)
+    if after is not None:
+        query = query.where(tuple_(rank, KnowledgeBaseContent.content_id) < tuple_(*after))
+    return query.order_by(rank.desc(), KnowledgeBaseContent.content_id.desc()).limit(limit)
+
+
+def build_text_search_query(
+    q: str,
+    limit: int,
+    source_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    language: Optional[str] = None,
+    after: Optional[Tuple[float, int]] = None
+):
+    """
+    A page of build_ranked_matches with highlighted snippets.
+
+    Pages are keyset-paginated on (rank, content_id): `after` is the last hit of the
+    previous page, so a deep page costs the same as the first instead of ranking and
+    discarding OFFSET rows. Snippets (ts_headline re-parses the text) are only made
+    for the rows of the page.
+    """
+    page = build_ranked_matches(q, limit, source_id, content_type, language, after).subquery("page")
+    text_config = search_config(language, source_id)
+    snippet = func.ts_headline(
+        text_config, KnowledgeBaseContent.content, func.websearch_to_tsquery(text_config, q), HEADLINE_OPTIONS
+    ).label("snippet")
+    return (
+        select(*page.c, snippet)
+        .join(KnowledgeBaseContent, KnowledgeBaseContent.content_id == page.c.content_id)
+        .order_by(page.c.rank.desc(), page.c.content_id.desc())
+    )
+
+
+class TextSearchService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def search(
+        self,
+        q: str,
+        limit: int = config.TEXT_SEARCH_DEFAULT_LIMIT,
+        source_id: Optional[int] = None,
+        content_type: Optional[str] = None,
+        language: Optional[str] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[TextSearchHit], Optional[str]]:
+        """
+        Full-text search over knowledge base content.
+        Returns (hits, cursor of the next page or None on the last page).
+        Raises ValueError for an empty query, a limit out of range or an invalid cursor.
+        """
+        if not q or not q.strip():
+            raise ValueError("q must not be empty")
+        if not 1 <= limit <= config.TEXT_SEARCH_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {config.TEXT_SEARCH_MAX_LIMIT}")
+        after = decode_cursor(cursor) if cursor else None
+
+        # One row more than asked tells whether there is a next page
+        result = await self.db.execute(
+            build_text_search_query(q, limit + 1, source_id, content_type, language, after)
+        )
+        hits = [TextSearchHit(**row._mapping) for row in result]
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            next_cursor = encode_cursor(hits[-1].rank, hits[-1].content_id)
+        return hits, next_cursor
@@ -0,0 +1,453 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..database import AsyncSessionLocal
+from ..models import KnowledgeBaseContent, KnowledgeBaseSource
+from .vector_snapshot import open_configured_snapshot, rows_missing_from
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ("float32", "float16", "int8")
+LOAD_BATCH = 10000
+
+# Version of a source whose rows were never read from the database (only add()ed)
+_UNREAD = object()
+
+
+def bytes_per_vector(dtype: str, dimension: int = config.EMBEDDING_DIMENSION) -> int:
+    """Memory per indexed vector: the row, its content id, its content type code and (int8) its scale."""
+    itemsize = np.dtype(dtype).itemsize
+    return dimension * itemsize + 8 + 4 + (4 if dtype == "int8" else 0)
+
+
+async def source_version(db: AsyncSession, source_id: int):
+    """
+    The source's updated_at (None for a missing source). Content is only written in
+    the transaction that creates its source, so a change of content changes it too.
+    """
+    result = await db.execute(
+        select(KnowledgeBaseSource.updated_at).where(KnowledgeBaseSource.source_id == source_id)
+    )
+    return result.scalar_one_or_none()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _Segment:
+    """
+    Vectors of one source in a single contiguous matrix, L2-normalised so that
+    cosine similarity is a dot product. Rows are appended into spare capacity (which
+    doubles when full), so readers holding the arrays and `size` of an earlier
+    moment are never affected by later appends. A frozen segment wraps read-only
+    arrays, such as a memory-mapped snapshot, and cannot be appended to.
+    """
+
+    def __init__(self, dimension: int, dtype: str, capacity: int = 1024):
+        self.dimension = dimension
+        self.dtype = dtype
+        self.size = 0
+        self.frozen = False
+        self.vectors = np.empty((capacity, dimension), dtype=dtype)
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.types = np.empty(capacity, dtype=np.int32)
+
+    @classmethod
+    def wrap(cls, ids: np.ndarray, vectors: np.ndarray, types: np.ndarray) -> "_Segment":
+        """A frozen segment over existing normalised float32/float16 rows (not copied)."""
+        segment = cls.__new__(cls)
+        segment.dimension = vectors.shape[1]
+        segment.dtype = vectors.dtype.name
+        segment.size = len(ids)
+        segment.frozen = True
+        segment.vectors = vectors
+        segment.scales = None
+        segment.ids = ids
+        segment.types = types
+        return segment
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.vectors, self.ids, self.types] + ([self.scales] if self.dtype == "int8" else [])
+        return sum(array[:self.size].nbytes for array in arrays)
+
+    @property
+    def mapped(self) -> bool:
+        return isinstance(self.vectors, np.memmap)
+
+    def _reserve(self, count: int) -> None:
+        capacity = len(self.ids)
+        if self.size + count <= capacity:
+            return
+        capacity = max(capacity * 2, self.size + count)
+        for name in ("vectors", "scales", "ids", "types"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            if name == "scales":
+                new[self.size:] = 1.0
+            setattr(self, name, new)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, types: np.ndarray) -> None:
+        count = len(ids)
+        if count == 0:
+            return
+        if self.frozen:
+            raise ValueError("cannot append to a frozen segment")
+        self._reserve(count)
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        rows = slice(self.size, self.size + count)
+
+        if self.dtype == "int8":
+            # Symmetric per-row quantisation: row ~= scale * int8 row
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales[rows] = scales
+        else:
+            self.vectors[rows] = vectors
+        self.ids[rows] = ids
+        self.types[rows] = types
+        # Publish the rows only once they are fully written
+        self.size += count
+
+    def scores(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Cosine similarity of every row to the (normalised) query, with ids and type codes."""
+        size, vectors, ids, types = self.size, self.vectors, self.ids, self.types
+        if self.dtype == "float32":
+            return vectors[:size] @ query, ids[:size], types[:size]
+
+        # einsum casts float16/int8 rows to float32 in small internal buffers instead
+        # of materialising a float32 copy of the whole matrix
+        scores = np.einsum("ij,j->i", vectors[:size], query)
+        if self.dtype == "int8":
+            scores *= self.scales[:size]
+        return scores, ids[:size], types[:size]
+
+
+class InMemoryVectorIndex:
+    """
+    Exact nearest-neighbour search over the embeddings of selected ("hot") sources,
+    held in process memory so those queries need no round trip to pgvector.
+
+    Each source is a contiguous matrix of float32, float16 (half the memory) or
+    int8 with a per-row scale (a quarter of the memory, small recall loss), preceded
+    by read-only slices of a memory-mapped snapshot when it was loaded from one.
+    Queries are a matrix-vector product per part plus argpartition for the top k.
+    Sources are loaded with load_source(); SourceIntakeService calls add() after each
+    commit, so tracked sources get the content written by this process. With
+    track_new_sources, every source created after startup is tracked as well.
+
+    Each process holds its own index, and content is also written by the other API
+    processes (ingestion jobs, batches). So a source is only served from memory once
+    in_sync() finds its version (see source_version) unchanged since its rows were
+    read; otherwise the search goes to pgvector while the rows the index lacks are
+    read in the background. Loading a source, with load_source() or
+    POST /search/memory/{id}, loads it in the calling process only.
+    """
+
+    def __init__(
+        self,
+        dimension: int = config.EMBEDDING_DIMENSION,
+        dtype: str = config.VECTOR_INDEX_DTYPE,
+        track_new_sources: bool = False,
+        session_factory: Callable = AsyncSessionLocal
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+        self.dimension = dimension
+        self.dtype = dtype
+        self.track_new_sources = track_new_sources
+        self.session_factory = session_factory
+        # Per source: frozen snapshot parts, then the growable segment new rows go to
+        self._segments: Dict[int, List[_Segment]] = {}
+        # Rows added while a source is being loaded, applied when the load finishes
+        self._loading: Dict[int, List[tuple]] = {}
+        # Per source: its version when its rows were last read from the database
+        self._versions: Dict[int, object] = {}
+        self._catch_ups: Dict[int, asyncio.Task] = {}
+        self._type_codes: Dict[Optional[str], int] = {}
+
+    def has_source(self, source_id: Optional[int]) -> bool:
+        return source_id in self._segments
+
+    def tracks(self, source_id: Optional[int]) -> bool:
+        """Whether new content of source_id should be passed to add()."""
+        return source_id in self._segments or source_id in self._loading or self.track_new_sources
+
+    @property
+    def sources(self) -> List[int]:
+        return sorted(self._segments)
+
+    def _type_code(self, content_type: Optional[str]) -> int:
+        return self._type_codes.setdefault(content_type, len(self._type_codes))
+
+    def _type_codes_for(self, content_types: Iterable[Optional[str]]) -> np.ndarray:
+        return np.array([self._type_code(content_type) for content_type in content_types], dtype=np.int32)
+
+    def add(
+        self,
+        source_id: int,
+        content_ids: Sequence[int],
+        vectors: Sequence[Sequence[float]],
+        content_types: Sequence[Optional[str]]
+    ) -> int:
+        """
+        Index new content of a tracked source (ignored for other sources).
+        Returns the number of vectors added.
+        """
+        if len(content_ids) == 0 or not self.tracks(source_id):
+            return 0
+        if source_id in self._loading:
+            self._loading[source_id].append((content_ids, vectors, content_types))
+            return len(content_ids)
+
+        if source_id not in self._segments:
+            self._segments[source_id] = [_Segment(self.dimension, self.dtype)]
+        self._segments[source_id][-1].append(
+            np.asarray(content_ids, dtype=np.int64),
+            np.asarray(vectors, dtype=np.float32).reshape(len(content_ids), self.dimension),
+            self._type_codes_for(content_types)
+        )
+        return len(content_ids)
+
+    def add_contents(self, contents: Iterable[KnowledgeBaseContent]) -> int:
+        """Index written KnowledgeBaseContent models (with ids) of tracked sources."""
+        by_source: Dict[int, List[KnowledgeBaseContent]] = {}
+        for content in contents:
+            if content.embedding is not None and self.tracks(content.source_id):
+                by_source.setdefault(content.source_id, []).append(content)
+
+        return sum(
+            self.add(
+                source_id,
+                [content.content_id for content in group],
+                [content.embedding for content in group],
+                [content.content_type for content in group]
+            )
+            for source_id, group in by_source.items()
+        )
+
+    async def in_sync(self, db: AsyncSession, source_id: Optional[int]) -> bool:
+        """
+        Whether searches of source_id can be answered from memory: the source is
+        loaded and nothing was committed for it since its rows were read. When
+        something was, the missing rows are read in the background and False is
+        returned until they are.
+        """
+        if source_id not in self._segments:
+            return False
+        if await source_version(db, source_id) == self._versions.get(source_id, _UNREAD):
+            return True
+        if source_id not in self._catch_ups and source_id not in self._loading:
+            self._catch_ups[source_id] = asyncio.create_task(
+                self._catch_up(source_id), name=f"vector-index-catch-up-{source_id}"
+            )
+        return False
+
+    async def _catch_up(self, source_id: int) -> None:
+        segments = self._segments.get(source_id)
+        try:
+            if segments is None:
+                return
+            async with self.session_factory() as db:
+                # Read before the rows: a change committed meanwhile shows as a newer version
+                version = await source_version(db, source_id)
+                known = np.concatenate([segment.ids[:segment.size] for segment in segments])
+                async for rows in rows_missing_from(db, known, [source_id], LOAD_BATCH):
+                    if self._segments.get(source_id) is not segments:
+                        return  # reloaded or unloaded meanwhile
+                    self._append_rows(segments[-1], rows)
+            if self._segments.get(source_id) is segments:
+                self._versions[source_id] = version
+        except Exception:
+            logger.exception("Catching up source %d in the in-memory index failed", source_id)
+        finally:
+            self._catch_ups.pop(source_id, None)
+
+    def _append_rows(self, segment: _Segment, rows) -> None:
+        # add() may have indexed some of them while they were read
+        ids = np.array([row.content_id for row in rows], dtype=np.int64)
+        new = ~np.isin(ids, segment.ids[:segment.size])
+        if new.any():
+            segment.append(
+                ids[new],
+                np.stack([np.asarray(row.embedding, dtype=np.float32) for row in rows])[new],
+                self._type_codes_for(row.content_type for row in rows)[new]
+            )
+
+    async def load_source(self, db: AsyncSession, source_id: int, snapshot=None) -> int:
+        """
+        (Re)load every embedding of a source.
+        With a VectorSnapshot exported for the source, its rows in it are used in
+        place (memory mapped, shared with other processes) and only the content the
+        snapshot lacks is read from the database.
+        Queries keep using the previous copy, if any, until the load completes.
+        Returns the number of vectors loaded.
+        """
+        self._loading.setdefault(source_id, [])
+        try:
+            version = await source_version(db, source_id)
+            parts = []
+            if snapshot is not None and snapshot.covers(source_id):
+                parts = [
+                    _Segment.wrap(np.asarray(ids), vectors, self._type_codes_for(type_names)[codes])
+                    for ids, vectors, codes, type_names in snapshot.source_parts(source_id)
+                ]
+
+            tail = _Segment(self.dimension, self.dtype)
+            if parts:
+                # Whatever the snapshot lacks, whichever its ids (see vector_snapshot)
+                batches = rows_missing_from(db, snapshot.content_ids(source_id), [source_id], LOAD_BATCH)
+            else:
+                result = await db.stream(
+                    select(
+                        KnowledgeBaseContent.content_id,
+                        KnowledgeBaseContent.content_type,
+                        KnowledgeBaseContent.embedding
+                    )
+                    .where(KnowledgeBaseContent.source_id == source_id)
+                    .where(KnowledgeBaseContent.embedding.isnot(None))
+                    .order_by(KnowledgeBaseContent.content_id)
+                )
+                batches = result.partitions(LOAD_BATCH)
+            async for rows in batches:
+                tail.append(
+                    np.array([row.content_id for row in rows], dtype=np.int64),
+                    np.stack([np.asarray(row.embedding, dtype=np.float32) for row in rows]),
+                    self._type_codes_for(row.content_type for row in rows)
+                )
+        except BaseException:
+            self._loading.pop(source_id, None)
+            raise
+
+        # Content committed after the database snapshot was taken arrived through add()
+        segments = parts + [tail]
+        loaded = np.concatenate([segment.ids[:segment.size] for segment in segments])
+        for content_ids, vectors, content_types in self._loading.pop(source_id):
+            ids = np.asarray(content_ids, dtype=np.int64)
+            new = ~np.isin(ids, loaded)
+            tail.append(
+                ids[new],
+                np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)[new],
+                self._type_codes_for(content_types)[new]
+            )
+
+        self._segments[source_id] = segments
+        self._versions[source_id] = version
+        size = sum(segment.size for segment in segments)
+        logger.info(
+            "Loaded %d vectors of source %d into the in-memory index (%d from the snapshot)",
+            size, source_id, size - tail.size
+        )
+        return size
+
+    def unload(self, source_id: int) -> bool:
+        self._loading.pop(source_id, None)
+        self._versions.pop(source_id, None)
+        return self._segments.pop(source_id, None) is not None
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        k: int,
+        source_id: int,
+        content_type: Optional[str] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Exact top-k content of a loaded source by cosine distance.
+        Returns (content_id, distance) pairs ordered from nearest to farthest.
+        """
+        segments = self._segments[source_id]
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        parts = [segment.scores(query) for segment in segments]
+        if len(parts) == 1:
+            scores, ids, types = parts[0]
+        else:
+            scores, ids, types = (np.concatenate(arrays) for arrays in zip(*parts))
+        if content_type is not None:
+            code = self._type_codes.get(content_type)
+            if code is None:
+                return []
+            selected = np.flatnonzero(types == code)
+            scores, ids = scores[selected], ids[selected]
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[row]), float(1.0 - scores[row])) for row in top]
+
+    def stats(self) -> dict:
+        # Mapped bytes live in the page cache, shared by every process mapping the snapshot
+        sources = {
+            source_id: {
+                "vectors": sum(segment.size for segment in segments),
+                "bytes": sum(segment.nbytes for segment in segments if not segment.mapped),
+                "mapped_bytes": sum(segment.nbytes for segment in segments if segment.mapped),
+            }
+            for source_id, segments in self._segments.items()
+        }
+        return {
+            "dtype": self.dtype,
+            "dimension": self.dimension,
+            "track_new_sources": self.track_new_sources,
+            "vectors": sum(source["vectors"] for source in sources.values()),
+            "bytes": sum(source["bytes"] for source in sources.values()),
+            "mapped_bytes": sum(source["mapped_bytes"] for source in sources.values()),
+            "bytes_per_million_vectors": bytes_per_vector(self.dtype, self.dimension) * 1_000_000,
+            "sources": sources,
+        }
+
+
+_index: Optional[InMemoryVectorIndex] = None
+
+
+def get_vector_index() -> InMemoryVectorIndex:
+    """The process-wide in-memory index, configured by VECTOR_INDEX_*."""
+    global _index
+    if _index is None:
+        _index = InMemoryVectorIndex(track_new_sources=config.VECTOR_INDEX_SOURCES == "all")
+    return _index
+
+
+def configured_source_ids() -> List[int]:
+    """Source ids listed in VECTOR_INDEX_SOURCES (empty for "" or "all")."""
+    if config.VECTOR_INDEX_SOURCES in ("", "all"):
+        return []
+    return [int(source_id) for source_id in config.VECTOR_INDEX_SOURCES.split(",") if source_id.strip()]
+
+
+async def load_configured_sources(db: AsyncSession) -> int:
+    """
+    Load the VECTOR_INDEX_SOURCES sources (every source for "all"), from the
+    VECTOR_SNAPSHOT_DIR snapshot when there is one. Returns vectors loaded.
+    """
+    index = get_vector_index()
+    source_ids = configured_source_ids()
+    if config.VECTOR_INDEX_SOURCES == "all":
+        result = await db.execute(select(KnowledgeBaseSource.source_id))
+        source_ids = list(result.scalars())
+    if not source_ids:
+        return 0
+
+    snapshot = open_configured_snapshot()
+    loaded = 0
+    for source_id in source_ids:
+        loaded += await index.load_source(db, source_id, snapshot)
+    return loaded
@@ -0,0 +1,235 @@
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import exists, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .. import config
+from ..models import ContentTag, KnowledgeBaseContent, Tag
+from .vector_index import InMemoryVectorIndex, get_vector_index
+
+INDEX_METHODS = ("hnsw", "ivfflat")
+INDEX_NAME_PREFIX = "idx_knowledge_base_content_embedding_"
+
+HIT_COLUMNS = (
+    KnowledgeBaseContent.content_id,
+    KnowledgeBaseContent.source_id,
+    KnowledgeBaseContent.parent_content_id,
+    KnowledgeBaseContent.title,
+    KnowledgeBaseContent.content,
+    KnowledgeBaseContent.content_type,
+)
+
+
+@dataclass
+class SearchHit:
+    content_id: int
+    source_id: int
+    parent_content_id: Optional[int]
+    title: Optional[str]
+    content: Optional[str]
+    content_type: Optional[str]
+    distance: float  # cosine distance, 0 is identical
+
+    @property
+    def score(self) -> float:
+        return 1.0 - self.distance
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "score": self.score}
+
+
+def _positive_int(name: str, value: Optional[int], maximum: int) -> Optional[int]:
+    # Values are interpolated into SET statements, which take no bind parameters
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= maximum:
+        raise ValueError(f"{name} must be an integer between 1 and {maximum}")
+    return value
+
+
+def build_search_query(
+    query_vector: Sequence[float],
+    k: int,
+    source_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    tags: Optional[List[str]] = None
+):
+    """
+    Top-k nearest neighbours by cosine distance, ordered so that the HNSW/IVFFlat
+    index on embedding (vector_cosine_ops) can serve the ORDER BY ... LIMIT.
+    Filters are applied to the index scan; tags match content having any of them.
+    """
+    distance = KnowledgeBaseContent.embedding.cosine_distance(query_vector).label("distance")
+    query = select(*HIT_COLUMNS, distance).where(KnowledgeBaseContent.embedding.isnot(None))
+
+    if source_id is not None:
+        query = query.where(KnowledgeBaseContent.source_id == source_id)
+    if content_type is not None:
+        query = query.where(KnowledgeBaseContent.content_type == content_type)
+    if tags:
+        query = query.where(
+            exists()
+            .where(ContentTag.content_id == KnowledgeBaseContent.content_id)
+            .where(ContentTag.tag_id == Tag.tag_id)
+            .where(Tag.name.in_(tags))
+        )
+
+    return query.order_by(distance).limit(k)
+
+
+class VectorSearchService:
+    def __init__(self, db: AsyncSession, memory_index: Optional[InMemoryVectorIndex] = None):
+        self.db = db
+        self.memory_index = memory_index if memory_index is not None else get_vector_index()
+
+    async def search(
+        self,
+        query_vector: Sequence[float],
+        k: int = config.VECTOR_SEARCH_DEFAULT_K,
+        source_id: Optional[int] = None,
+        content_type: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[SearchHit]:
+        """
+        Top-k content nearest to query_vector.
+        Args:
+            query_vector: embedding of the query (EMBEDDING_DIMENSION floats)
+            k: number of results, at most VECTOR_SEARCH_MAX_K
+            source_id, content_type, tags: optional filters
+            ef_search: HNSW candidate list size for this query (recall vs latency;
+                raise it for selective filters, which discard candidates after the scan)
+            probes: IVFFlat lists scanned for this query
+        Searches within a source held (and in sync) by the in-memory index, without
+        tags, are exact and skip pgvector; only the k hits are then fetched by primary key.
+        Returns: hits ordered from nearest to farthest
+        """
+        _positive_int("k", k, config.VECTOR_SEARCH_MAX_K)
+        ef_search = _positive_int("ef_search", ef_search, 1000)
+        probes = _positive_int("probes", probes, 10000)
+
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        if query_vector.shape != (config.EMBEDDING_DIMENSION,):
+            raise ValueError(f"query vector must have {config.EMBEDDING_DIMENSION} dimensions")
+
+        if not tags and await self.memory_index.in_sync(self.db, source_id):
+            return await self._search_memory(query_vector, k, source_id, content_type)
+
+        # SET LOCAL only lasts until the end of the current transaction; marked read-only
+        # so that a routing session sends it to the replica that runs the search
+        if ef_search is not None:
+            await self.db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"), bind_arguments={"read_only": True})
+        if probes is not None:
+            await self.db.execute(text(f"SET LOCAL ivfflat.probes = {probes}"), bind_arguments={"read_only": True})
+
+        result = await self.db.execute(
+            build_search_query(query_vector, k, source_id, content_type, tags)
+        )
+        return [SearchHit(**row._mapping) for row in result]
+
+    async def _search_memory(
+        self,
+        query_vector: np.ndarray,
+        k: int,
+        source_id: int,
+        content_type: Optional[str]
+    ) -> List[SearchHit]:
+        nearest = self.memory_index.search(query_vector, k, source_id, content_type)
+        if not nearest:
+            return []
+        result = await self.db.execute(
+            select(*HIT_COLUMNS).where(KnowledgeBaseContent.content_id.in_([content_id for content_id, _ in nearest]))
+        )
+        rows = {row.content_id: row for row in result}
+        # Content deleted since it was indexed is skipped
+        return [
+            SearchHit(**rows[content_id]._mapping, distance=distance)
+            for content_id, distance in nearest
+            if content_id in rows
+        ]
+
+
+class VectorIndexManager:
+    """
+    Creates, lists and drops the approximate nearest-neighbour indexes on
+    knowledge_base_content.embedding. Indexes are built CONCURRENTLY, so ingestion and
+    search keep running during a (possibly long) rebuild; that requires an autocommit
+    connection rather than a session. A rebuild holds its connection for as long as it
+    runs, so pass the ingest engine rather than the serving one.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def list_indexes(self) -> List[dict]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE tablename = 'knowledge_base_content' "
+                "AND (indexdef ILIKE '%USING hnsw%' OR indexdef ILIKE '%USING ivfflat%') "
+                "ORDER BY indexname"
+            ))
+            return [
+                {
+                    "name": row.indexname,
+                    "method": "hnsw" if "using hnsw" in row.indexdef.lower() else "ivfflat",
+                    "definition": row.indexdef,
+                }
+                for row in result
+            ]
+
+    async def create_index(
+        self,
+        method: str = "hnsw",
+        m: int = config.HNSW_M,
+        ef_construction: int = config.HNSW_EF_CONSTRUCTION,
+        lists: int = config.IVFFLAT_LISTS
+    ) -> dict:
+        """
+        (Re)build the index for `method` with the given parameters.
+        IVFFlat clusters the rows present at build time, so build it after loading
+        data (a good starting point is lists = rows / 1000) and rebuild as data grows.
+        The new index is built under a temporary name and swapped in once ready, so
+        searches keep the old one until then. Returns the index description.
+        """
+        if method not in INDEX_METHODS:
+            raise ValueError(f"method must be one of {', '.join(INDEX_METHODS)}")
+        if method == "hnsw":
+            options = (
+                f"m = {_positive_int('m', m, 100)}, "
+                f"ef_construction = {_positive_int('ef_construction', ef_construction, 1000)}"
+            )
+        else:
+            options = f"lists = {_positive_int('lists', lists, 32768)}"
+
+        name = INDEX_NAME_PREFIX + method
+        building = name + "_new"
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            # A build that failed leaves an invalid index behind
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {building}"))
+            try:
+                await conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY {building} ON knowledge_base_content "
+                    f"USING {method} (embedding vector_cosine_ops) WITH ({options})"
+                ))
+            except Exception:
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {building}"))
+                raise
+
+        # The swap locks the table, but only for as long as a drop and a rename take
+        async with self.engine.begin() as conn:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            await conn.execute(text(f"ALTER INDEX {building} RENAME TO {name}"))
+
+        return next(index for index in await self.list_indexes() if index["name"] == name)
+
+    async def drop_index(self, name: str) -> None:
+        if name not in {index["name"] for index in await self.list_indexes()}:
+            raise ValueError(f"Unknown vector index: {name}")
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
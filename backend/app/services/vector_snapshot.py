@@ -0,0 +1,444 @@
+"""
+On-disk embedding snapshots, memory-mapped by every worker on a host.
+
+A snapshot is a directory holding a manifest.json and one or more segment files.
+Each segment is written once and never modified:
+
+    header     64 bytes, little-endian (see HEADER)
+    vectors    count x dimension float32 or float16, L2-normalised, 64-byte aligned
+    content_id count int64
+    source_id  count int64
+    type_code  count int32, indexes into the content type table
+    types      UTF-8 JSON list of the content type names (null for None)
+
+Rows are ordered by (source_id, content_id), so a source's rows are one contiguous,
+zero-copy slice of the mapped file. `export` writes a full snapshot, `append` adds a
+segment with the content the snapshot does not hold, and `compact` merges all
+segments into one. Workers open the files read-only with
+np.memmap, so they share the same page-cache pages instead of each holding a copy.
+What is missing is found by comparing the content ids in the database with those in
+the segments, not by an id watermark: ids are allocated from the sequence when a
+bulk load starts, so a long ingest transaction can commit rows with lower ids than
+content already exported. Appends only add content; an export (or the search-time
+primary-key fetch, which skips missing rows) takes care of deleted content. Run one snapshot command
+at a time per directory.
+"""
+import json
+import os
+import struct
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..models import KnowledgeBaseContent
+
+MAGIC = b"DJVSNAP\0"
+VERSION = 1
+# magic, version, dtype code, dimension, types table length, count, max content_id, created_at
+HEADER = struct.Struct("<8sIIIIQQd")
+HEADER_SIZE = 64
+DTYPE_CODES = {"float32": 1, "float16": 2}
+MANIFEST = "manifest.json"
+EXPORT_BATCH = 10000
+
+ROW_COLUMNS = (
+    KnowledgeBaseContent.content_id,
+    KnowledgeBaseContent.source_id,
+    KnowledgeBaseContent.content_type,
+    KnowledgeBaseContent.embedding,
+)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SegmentWriter:
+    """
+    Streams rows into a new segment file. Vectors go straight to disk as they
+    arrive; ids and type codes (20 bytes per row) are kept until close(), which
+    writes them after the vectors, fills in the header and renames the file into
+    place, so a segment is either complete or absent.
+    """
+
+    def __init__(self, path: Path, dimension: int = config.EMBEDDING_DIMENSION, dtype: str = "float32"):
+        if dtype not in DTYPE_CODES:
+            raise SnapshotError(f"dtype must be one of {', '.join(DTYPE_CODES)}")
+        self.path = Path(path)
+        self.dimension = dimension
+        self.dtype = dtype
+        self.count = 0
+        self._tmp_path = self.path.with_suffix(".tmp")
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * HEADER_SIZE)
+        self._content_ids: List[np.ndarray] = []
+        self._source_ids: List[np.ndarray] = []
+        self._type_codes: List[np.ndarray] = []
+        self._types: dict = {}
+        self._last = (-1, -1)
+
+    def write(
+        self,
+        content_ids: Sequence[int],
+        source_ids: Sequence[int],
+        content_types: Sequence[Optional[str]],
+        vectors: np.ndarray
+    ) -> None:
+        """Append rows, which must continue the (source_id, content_id) order."""
+        content_ids = np.asarray(content_ids, dtype=np.int64)
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        if len(content_ids) == 0:
+            return
+        keys = list(zip(source_ids.tolist(), content_ids.tolist()))
+        if keys[0] <= self._last or any(a >= b for a, b in zip(keys, keys[1:])):
+            raise SnapshotError("rows must be written in increasing (source_id, content_id) order")
+        self._last = keys[-1]
+
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(content_ids), self.dimension))
+        self._file.write(vectors.astype(self.dtype).tobytes())
+        self._content_ids.append(content_ids)
+        self._source_ids.append(source_ids)
+        self._type_codes.append(np.array(
+            [self._types.setdefault(content_type, len(self._types)) for content_type in content_types],
+            dtype=np.int32
+        ))
+        self.count += len(content_ids)
+
+    def close(self) -> Path:
+        content_ids = np.concatenate(self._content_ids) if self._content_ids else np.empty(0, np.int64)
+        types = json.dumps(list(self._types)).encode("utf-8")
+        for arrays, dtype in (
+            (self._content_ids, np.int64), (self._source_ids, np.int64), (self._type_codes, np.int32)
+        ):
+            self._file.write(np.concatenate(arrays).astype(dtype).tobytes() if arrays else b"")
+        self._file.write(types)
+
+        self._file.seek(0)
+        self._file.write(HEADER.pack(
+            MAGIC, VERSION, DTYPE_CODES[self.dtype], self.dimension, len(types), self.count,
+            int(content_ids.max()) if self.count else 0, time.time()
+        ))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+class Segment:
+    """A segment file opened read-only through np.memmap."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise SnapshotError(f"{self.path} is not a snapshot segment")
+        magic, version, dtype_code, dimension, types_length, count, max_content_id, created_at = \
+            HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path} is not a snapshot segment")
+        if version != VERSION:
+            raise SnapshotError(f"{self.path} has unsupported snapshot version {version}")
+
+        self.dtype = next(name for name, code in DTYPE_CODES.items() if code == dtype_code)
+        self.dimension = dimension
+        self.count = count
+        self.max_content_id = max_content_id
+        self.created_at = created_at
+
+        offset = HEADER_SIZE
+        vector_bytes = count * dimension * np.dtype(self.dtype).itemsize
+        self.vectors = self._map(self.dtype, offset, (count, dimension))
+        offset += vector_bytes
+        self.content_ids = self._map(np.int64, offset, (count,))
+        offset += count * 8
+        self.source_ids = self._map(np.int64, offset, (count,))
+        offset += count * 8
+        self.type_codes = self._map(np.int32, offset, (count,))
+        offset += count * 4
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            self.types: List[Optional[str]] = json.loads(f.read(types_length).decode("utf-8"))
+
+    def _map(self, dtype, offset: int, shape: tuple) -> np.ndarray:
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    @property
+    def nbytes(self) -> int:
+        return self.path.stat().st_size
+
+    def source_rows(self, source_id: int) -> slice:
+        """Rows of a source: a contiguous range, since rows are sorted by source_id."""
+        start = int(np.searchsorted(self.source_ids, source_id, side="left"))
+        end = int(np.searchsorted(self.source_ids, source_id, side="right"))
+        return slice(start, end)
+
+
+class VectorSnapshot:
+    """The segments listed in a snapshot directory's manifest, oldest first."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        manifest = read_manifest(self.directory)
+        if manifest is None:
+            raise SnapshotError(f"No snapshot in {self.directory}")
+        self.manifest = manifest
+        self.segments = [Segment(self.directory / name) for name in manifest["segments"]]
+
+    @property
+    def max_content_id(self) -> int:
+        """Highest content id in the snapshot (not a watermark: see the module docstring)."""
+        return max((segment.max_content_id for segment in self.segments), default=0)
+
+    def covers(self, source_id: int) -> bool:
+        """Whether the snapshot was exported for source_id (it may still hold none of its rows)."""
+        source_ids = self.manifest["source_ids"]
+        return source_ids is None or source_id in source_ids
+
+    def content_ids(self, source_id: Optional[int] = None) -> np.ndarray:
+        """The sorted content ids in the snapshot, of one source or of all."""
+        if source_id is None:
+            parts = [segment.content_ids for segment in self.segments]
+        else:
+            parts = [segment.content_ids[segment.source_rows(source_id)] for segment in self.segments]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    @property
+    def count(self) -> int:
+        return sum(segment.count for segment in self.segments)
+
+    def source_parts(self, source_id: int) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray, List[Optional[str]]]]:
+        """
+        A source's rows as (content_ids, vectors, type codes, type names) per segment,
+        where type codes index the segment's type names. All arrays are views of the
+        mapped files, not copies.
+        """
+        parts = []
+        for segment in self.segments:
+            rows = segment.source_rows(source_id)
+            if rows.stop > rows.start:
+                parts.append((segment.content_ids[rows], segment.vectors[rows], segment.type_codes[rows], segment.types))
+        return parts
+
+    def info(self) -> dict:
+        return {
+            "directory": str(self.directory),
+            "dtype": self.manifest["dtype"],
+            "dimension": self.manifest["dimension"],
+            "source_ids": self.manifest["source_ids"],
+            "vectors": self.count,
+            "max_content_id": self.max_content_id,
+            "segments": [
+                {"name": segment.path.name, "vectors": segment.count, "bytes": segment.nbytes}
+                for segment in self.segments
+            ],
+        }
+
+
+def read_manifest(directory: Path) -> Optional[dict]:
+    path = Path(directory) / MANIFEST
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _write_manifest(directory: Path, manifest: dict) -> None:
+    # Readers see either the old or the new manifest, never a partial one
+    tmp_path = Path(directory) / (MANIFEST + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, Path(directory) / MANIFEST)
+
+
+def _new_segment_path(directory: Path) -> Path:
+    return Path(directory) / f"segment-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.vecs"
+
+
+def _remove_unlisted(directory: Path, manifest: dict) -> None:
+    # Workers that still map a removed file keep their pages until they reopen
+    for path in Path(directory).glob("segment-*.vecs"):
+        if path.name not in manifest["segments"]:
+            path.unlink(missing_ok=True)
+
+
+def _embedded_content(*columns):
+    return select(*columns).where(KnowledgeBaseContent.embedding.isnot(None))
+
+
+async def rows_missing_from(
+    db: AsyncSession,
+    known_ids: np.ndarray,
+    source_ids: Optional[Iterable[int]] = None,
+    batch_size: int = EXPORT_BATCH
+) -> AsyncIterator[list]:
+    """
+    Batches of the embedded content of `source_ids` (all sources if None) whose
+    content_id is not in `known_ids`, as rows of (content_id, source_id,
+    content_type, embedding) in (source_id, content_id) order. Only the ids are
+    read for the rest.
+    """
+    id_query = _embedded_content(KnowledgeBaseContent.content_id).order_by(
+        KnowledgeBaseContent.source_id, KnowledgeBaseContent.content_id
+    )
+    if source_ids is not None:
+        id_query = id_query.where(KnowledgeBaseContent.source_id.in_(list(source_ids)))
+    parts = []
+    result = await db.stream(id_query)
+    async for rows in result.partitions(batch_size):
+        ids = np.array([row.content_id for row in rows], dtype=np.int64)
+        parts.append(ids[~np.isin(ids, known_ids)])
+    missing = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # Slices of the (source_id, content_id) order, fetched by primary key
+    for start in range(0, len(missing), batch_size):
+        result = await db.execute(
+            _embedded_content(*ROW_COLUMNS)
+            .where(KnowledgeBaseContent.content_id.in_(missing[start:start + batch_size].tolist()))
+            .order_by(KnowledgeBaseContent.source_id, KnowledgeBaseContent.content_id)
+        )
+        rows = result.all()
+        if rows:
+            yield rows
+
+
+def _write(writer: SegmentWriter, rows) -> None:
+    writer.write(
+        [row.content_id for row in rows],
+        [row.source_id for row in rows],
+        [row.content_type for row in rows],
+        np.stack([np.asarray(row.embedding, dtype=np.float32) for row in rows])
+    )
+
+
+async def export_snapshot(
+    db: AsyncSession,
+    directory: Path,
+    dtype: str = "float32",
+    source_ids: Optional[List[int]] = None
+) -> dict:
+    """
+    Write a full snapshot of the embeddings of `source_ids` (all sources if None),
+    replacing whatever the directory held. Returns the snapshot info.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    writer = SegmentWriter(_new_segment_path(directory), config.EMBEDDING_DIMENSION, dtype)
+    query = _embedded_content(*ROW_COLUMNS).order_by(KnowledgeBaseContent.source_id, KnowledgeBaseContent.content_id)
+    if source_ids is not None:
+        query = query.where(KnowledgeBaseContent.source_id.in_(list(source_ids)))
+    try:
+        result = await db.stream(query)
+        async for rows in result.partitions(EXPORT_BATCH):
+            _write(writer, rows)
+    except BaseException:
+        writer.abort()
+        raise
+    path = writer.close()
+
+    manifest = {
+        "version": VERSION,
+        "dtype": dtype,
+        "dimension": config.EMBEDDING_DIMENSION,
+        "source_ids": sorted(source_ids) if source_ids is not None else None,
+        "segments": [path.name],
+    }
+    _write_manifest(directory, manifest)
+    _remove_unlisted(directory, manifest)
+    return VectorSnapshot(directory).info()
+
+
+async def append_snapshot(db: AsyncSession, directory: Path) -> dict:
+    """
+    Add a segment with the content of the snapshot's sources that none of its
+    segments holds (nothing is added when there is none). Returns the snapshot info.
+    """
+    snapshot = VectorSnapshot(directory)
+    manifest = snapshot.manifest
+    writer = SegmentWriter(_new_segment_path(directory), manifest["dimension"], manifest["dtype"])
+    try:
+        async for rows in rows_missing_from(db, snapshot.content_ids(), manifest["source_ids"]):
+            _write(writer, rows)
+    except BaseException:
+        writer.abort()
+        raise
+    if writer.count == 0:
+        writer.abort()
+        return snapshot.info()
+
+    path = writer.close()
+    _write_manifest(directory, {**manifest, "segments": manifest["segments"] + [path.name]})
+    return VectorSnapshot(directory).info()
+
+
+def compact_snapshot(directory: Path, batch_size: int = EXPORT_BATCH) -> dict:
+    """
+    Merge all segments into one, keeping the newest row of each content_id.
+    Needs no database; memory use is the ids plus one batch of vectors.
+    Returns the snapshot info.
+    """
+    snapshot = VectorSnapshot(directory)
+    manifest = snapshot.manifest
+    if len(snapshot.segments) <= 1:
+        return snapshot.info()
+
+    content_ids = np.concatenate([segment.content_ids for segment in snapshot.segments])
+    source_ids = np.concatenate([segment.source_ids for segment in snapshot.segments])
+    segment_of_row = np.concatenate([
+        np.full(segment.count, number, dtype=np.int32) for number, segment in enumerate(snapshot.segments)
+    ])
+    row_in_segment = np.concatenate([np.arange(segment.count) for segment in snapshot.segments])
+
+    # Later segments win: keep the last occurrence of every content_id
+    reversed_ids = content_ids[::-1]
+    _, first_in_reversed = np.unique(reversed_ids, return_index=True)
+    keep = len(content_ids) - 1 - first_in_reversed
+    keep = keep[np.lexsort((content_ids[keep], source_ids[keep]))]
+
+    writer = SegmentWriter(_new_segment_path(directory), manifest["dimension"], manifest["dtype"])
+    try:
+        for start in range(0, len(keep), batch_size):
+            rows = keep[start:start + batch_size]
+            vectors = np.empty((len(rows), manifest["dimension"]), dtype=np.float32)
+            types = [None] * len(rows)
+            for number, segment in enumerate(snapshot.segments):
+                mine = np.flatnonzero(segment_of_row[rows] == number)
+                if len(mine):
+                    local = row_in_segment[rows[mine]]
+                    vectors[mine] = segment.vectors[local]
+                    for position, code in zip(mine, segment.type_codes[local]):
+                        types[position] = segment.types[code]
+            writer.write(content_ids[rows], source_ids[rows], types, vectors)
+    except BaseException:
+        writer.abort()
+        raise
+    path = writer.close()
+
+    compacted = {**manifest, "segments": [path.name]}
+    _write_manifest(directory, compacted)
+    _remove_unlisted(directory, compacted)
+    return VectorSnapshot(directory).info()
+
+
+def open_configured_snapshot() -> Optional[VectorSnapshot]:
+    """The snapshot in VECTOR_SNAPSHOT_DIR, or None when unset or not exported yet."""
+    if not config.VECTOR_SNAPSHOT_DIR or read_manifest(Path(config.VECTOR_SNAPSHOT_DIR)) is None:
+        return None
+    return VectorSnapshot(Path(config.VECTOR_SNAPSHOT_DIR))
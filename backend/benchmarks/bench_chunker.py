@@ -0,0 +1,78 @@
+"""
+TextChunker throughput and the size distribution of the chunks it produces.
+
+Chunks a synthetic textbook (headings every few pages, paragraphs of varying
+length) or the pages of a real PDF, and reports MB/s of text and the chunk-size
+percentiles, next to the fixed 5-page windows DocumentProcessor used to emit.
+
+    cd backend
+    python -m benchmarks.bench_chunker --pages 2000
+    python -m benchmarks.bench_chunker --pdf path/to/textbook.pdf --max 800 --overlap 80
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.services.chunking import chunk_pages
+from app.services.document_processor import DocumentProcessor
+from app.services.pdf_extraction import extract_page_range, read_pdf_info
+from benchmarks.synthetic import paragraph, sentence
+
+
+def synthetic_pages(pages: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        blocks = []
+        if page % 4 == 0:
+            blocks.append(f"Chapter {page // 4 + 1}: {sentence(rng, 2, 4)[:-1]}")
+        for _ in range(rng.randint(3, 8)):
+            blocks.append(paragraph(rng, rng.randint(1, 12)))
+        result.append((page, "\n\n".join(blocks)))
+    return result
+
+
+def pdf_pages(path: str) -> list:
+    page_count, _ = read_pdf_info(path)
+    cleaner = DocumentProcessor()
+    return list(enumerate(cleaner._clean_text(text) for text in extract_page_range(path, 0, page_count)))
+
+
+def report(name: str, sizes: list) -> None:
+    p = np.percentile(sizes, [0, 10, 50, 90, 100]).astype(int)
+    print(f"{name:<12} {len(sizes):>8,} chunks   min {p[0]:>6}  p10 {p[1]:>6}  p50 {p[2]:>6}  p90 {p[3]:>6}  max {p[4]:>6}")
+
+
+def main(args):
+    pages = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages)
+    megabytes = sum(len(text.encode()) for _, text in pages) / 1e6
+    print(f"{len(pages):,} pages, {megabytes:.1f} MB of text")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        chunks = chunk_pages(pages, args.min, args.max, args.overlap)
+        best = min(best, time.perf_counter() - started)
+    print(f"chunker: {megabytes / best:.1f} MB/s ({best * 1000:.0f} ms)")
+
+    sizes = [len(chunk.text) for chunk in chunks]
+    within = sum(args.min <= size <= args.max for size in sizes) / len(sizes)
+    report("chunker", sizes)
+    print(f"{within:.1%} of chunks within [{args.min}, {args.max}], "
+          f"{sum(chunk.overlap > 0 for chunk in chunks):,} start with an overlap")
+
+    windows = ["".join(text for _, text in pages[start:start + 5]) for start in range(0, len(pages), 5)]
+    report("5-page", [len(window) for window in windows])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--pdf", help="chunk the pages of this PDF instead of synthetic text")
+    parser.add_argument("--min", type=int, default=200)
+    parser.add_argument("--max", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
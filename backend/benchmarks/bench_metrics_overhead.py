@@ -0,0 +1,122 @@
+"""
+Overhead of the /metrics instrumentation on a hot endpoint.
+
+Drives a FastAPI app straight through ASGI (no server or HTTP client, so nothing
+hides the cost) and reports:
+
+    endpoint     GET /sources/{source_id}/summary, a path-parameter route returning
+                 a small JSON body like the read endpoints, with and without
+                 MetricsMiddleware (end to end; run-to-run noise is a few percent);
+                 --work-us adds simulated handler work
+    middleware   the middleware's own cost per request, measured around an ASGI app
+                 that does nothing, as a share of the bare endpoint time
+    queries      observe_query, what every database statement costs the event hooks
+
+    cd backend
+    python -m benchmarks.bench_metrics_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.metrics import MetricsMiddleware, observe_query
+
+
+def make_app(work_us: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sources/{source_id}/summary")
+    async def summary(source_id: int):
+        if work_us:
+            deadline = time.perf_counter() + work_us / 1e6
+            while time.perf_counter() < deadline:
+                pass
+        return {"source_id": source_id, "name": "Biology 2e", "contents": 1843}
+
+    return app
+
+
+class RoutedNoop:
+    """An ASGI app that only does what the router and a response leave in the scope."""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.endpoint = app.routes[-1].endpoint
+
+    async def __call__(self, scope, receive, send):
+        scope["app"] = self.app
+        scope["endpoint"] = self.endpoint
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def drive(app, requests: int) -> float:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message["type"])
+
+    started = time.perf_counter()
+    for number in range(requests):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/sources/{number % 500}/summary",
+            "raw_path": f"/sources/{number % 500}/summary".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"localhost")],
+            "server": ("localhost", 8000),
+            "client": ("127.0.0.1", 50000),
+        }
+        await app(scope, receive, send)
+    elapsed = time.perf_counter() - started
+    assert sent.count("http.response.start") == requests
+    return elapsed / requests
+
+
+async def main(args):
+    bare = make_app(args.work_us)
+    instrumented = MetricsMiddleware(make_app(args.work_us))
+    await drive(bare, 1000)
+    await drive(instrumented, 1000)
+
+    # Interleaved rounds, best of each, so drift affects both sides alike
+    bare_best = instrumented_best = float("inf")
+    for _ in range(args.rounds):
+        bare_best = min(bare_best, await drive(bare, args.requests // args.rounds))
+        instrumented_best = min(instrumented_best, await drive(instrumented, args.requests // args.rounds))
+
+    print(f"endpoint    bare {bare_best * 1e6:8.1f} us   instrumented {instrumented_best * 1e6:8.1f} us   "
+          f"difference {(instrumented_best - bare_best) / bare_best:+.2%}")
+
+    noop = RoutedNoop(bare)
+    metered_noop = MetricsMiddleware(noop)
+    noop_best = metered_best = float("inf")
+    for _ in range(args.rounds):
+        noop_best = min(noop_best, await drive(noop, args.requests // args.rounds))
+        metered_best = min(metered_best, await drive(metered_noop, args.requests // args.rounds))
+    cost = metered_best - noop_best
+    print(f"middleware  {cost * 1e6:.2f} us per request = {cost / bare_best:.2%} of the bare endpoint")
+
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        observe_query("serving", 0.0004)
+    per_query = (time.perf_counter() - started) / args.requests
+    print(f"queries     observe_query {per_query * 1e6:.2f} us per statement")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--work-us", type=float, default=0, help="simulated handler work per request")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Peak memory of materialised vs streaming ingestion as documents grow.
+
+Runs both ingestion paths over synthetic PDFs of increasing size, up to (but not
+including) the database write, and reports the peak Python heap of each with
+tracemalloc. The materialised path is process_file + build_information_source +
+to_db_models; the streaming path is IngestionPipeline.sections with rows converted
+and dropped in persist-sized batches, as SourceIntakeService.process_source_stream does.
+The streaming peak should plateau once the document outgrows the buffers, while the materialised one grows with the page count.
+
+    cd backend
+    python -m benchmarks.bench_pipeline_memory --pages 400 1600 3200
+"""
+import argparse
+import asyncio
+import os
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy.orm import configure_mappers
+
+from app import config
+from app.services.document_processor import DocumentProcessor
+from app.services.ingestion_pipeline import IngestionPipeline, build_information_source
+from benchmarks.synthetic import textbook_pdf
+
+
+async def embed(texts):
+    # Stand-in for the embedding stage: 768 floats per section
+    return [[0.0] * 768 for _ in texts]
+
+
+async def materialised(path: str, executor) -> int:
+    chunks = await DocumentProcessor(executor).process_file(path, 'pdf')
+    source = build_information_source(chunks, "bench.pdf")
+    vectors = await embed([source.content_text] + [section.content_text for section in source.sections])
+    for section, vector in zip([source] + source.sections, vectors):
+        section.embedding = vector
+    _, contents = source.to_db_models()
+    return len(contents)
+
+
+async def streaming(path: str, executor) -> int:
+    pipeline = IngestionPipeline(DocumentProcessor(executor), embed=embed)
+    written = 0
+    batch = []
+    async for item in pipeline.sections(path, "bench.pdf"):
+        batch.append(item.to_content_model())
+        if len(batch) >= config.INGEST_PERSIST_BATCH_SIZE:
+            written += len(batch)
+            batch = []
+    return written + len(batch)
+
+
+def peak_mib(run, path: str, executor) -> float:
+    tracemalloc.start()
+    asyncio.run(run(path, executor))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[400, 1600, 3200])
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    # One-off mapper setup would otherwise be charged to the first measurement
+    configure_mappers()
+
+    print(f"stage buffer={config.INGEST_STAGE_BUFFER}, persist batch={config.INGEST_PERSIST_BATCH_SIZE}")
+    print(f"{'pages':>6} {'materialised MiB':>17} {'streaming MiB':>14}")
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for pages in args.pages:
+            path = textbook_pdf(pages)
+            try:
+                full = peak_mib(materialised, path, executor)
+                streamed = peak_mib(streaming, path, executor)
+            finally:
+                os.remove(path)
+            print(f"{pages:>6} {full:>17.1f} {streamed:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Upload-to-first-chunk latency: copying the upload in 64KB async writes vs stage_upload.
+
+For each size (default 1, 50 and 500 MB) a synthetic PDF (a short textbook padded
+with an incompressible embedded file, like the scans in a real one) is spooled the
+way Starlette receives an upload, then timed from the spooled file to the first
+DocumentChunk of the ingestion pipeline:
+
+    aiofiles   what save_upload_file did before: 64KB aiofiles writes, the worker
+               then opens the saved copy by path
+    staged     stage_upload: one executor call copies and hashes the spooled file;
+               uploads up to --memory-max-mb are also handed to PyMuPDF as bytes
+
+Both hash the upload (sha256) as /upload does. No database is needed.
+
+    cd backend
+    python -m benchmarks.bench_upload_latency --sizes-mb 1 50 500
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiofiles
+import fitz  # PyMuPDF
+from starlette.datastructures import UploadFile
+
+from app.services.document_processor import DocumentProcessor, stage_upload
+from benchmarks.synthetic import textbook_pdf
+
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette's multipart spooling threshold
+OLD_CHUNK_SIZE = 64 * 1024
+
+
+def padded_pdf(size: int, pages: int) -> str:
+    """A textbook_pdf grown to about `size` bytes with an embedded random attachment."""
+    path = textbook_pdf(pages)
+    padding = size - os.path.getsize(path)
+    if padding > 0:
+        padded = path + ".padded.pdf"
+        with fitz.open(path) as doc:
+            doc.embfile_add("scan.bin", os.urandom(padding))
+            doc.save(padded)
+        os.replace(padded, path)
+    return path
+
+
+def spooled_upload(path: str) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with open(path, "rb") as pdf:
+        shutil.copyfileobj(pdf, spooled)
+    spooled.seek(0)
+    return UploadFile(spooled, size=os.path.getsize(path), filename="book.pdf")
+
+
+async def aiofiles_copy(upload: UploadFile, directory: str) -> str:
+    digest = hashlib.sha256()
+    file_path = os.path.join(directory, "upload.pdf")
+    async with aiofiles.open(file_path, "wb") as out_file:
+        while chunk := await upload.read(OLD_CHUNK_SIZE):
+            digest.update(chunk)
+            await out_file.write(chunk)
+    return file_path
+
+
+async def first_chunk(processor: DocumentProcessor, document) -> None:
+    chunks = processor.iter_chunks(document, "pdf")
+    try:
+        await chunks.__anext__()
+    finally:
+        await chunks.aclose()
+
+
+async def time_mode(mode: str, path: str, processor: DocumentProcessor, memory_max_bytes: int) -> tuple:
+    upload = spooled_upload(path)
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        staged = None
+        if mode == "aiofiles":
+            document = await aiofiles_copy(upload, directory)
+        else:
+            staged = await stage_upload(upload, hashlib.sha256(), memory_max_bytes)
+            document = staged.document
+        saved = time.perf_counter() - started
+        await first_chunk(processor, document)
+        total = time.perf_counter() - started
+        if staged is not None:
+            # stage_upload writes to UPLOAD_DIR, not the temporary directory
+            os.remove(staged.path)
+    await upload.close()
+    return saved, total
+
+
+async def main(args):
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers else None
+    processor = DocumentProcessor(executor=executor)
+    memory_max_bytes = int(args.memory_max_mb * 1024 * 1024)
+    # Warm up: spawn the workers and import PyMuPDF in each
+    warmup = textbook_pdf(args.pages)
+    await first_chunk(processor, warmup)
+    os.remove(warmup)
+
+    try:
+        for size_mb in args.sizes_mb:
+            path = padded_pdf(int(size_mb * 1024 * 1024), args.pages)
+            try:
+                for mode in ("aiofiles", "staged"):
+                    best = min(
+                        [await time_mode(mode, path, processor, memory_max_bytes) for _ in range(args.repeat)],
+                        key=lambda timing: timing[1]
+                    )
+                    in_memory = mode == "staged" and os.path.getsize(path) <= memory_max_bytes
+                    print(
+                        f"{size_mb:>6.0f} MB  {mode:<9} save {best[0] * 1000:8.1f} ms  "
+                        f"first chunk {best[1] * 1000:8.1f} ms{'  (in memory)' if in_memory else ''}"
+                    )
+            finally:
+                os.remove(path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--memory-max-mb", type=float, default=1)
+    parser.add_argument("--workers", type=int, default=2, help="extraction processes (0: the loop's thread pool)")
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
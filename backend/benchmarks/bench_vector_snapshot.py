@@ -0,0 +1,119 @@
+"""
+Worker startup from a memory-mapped embedding snapshot.
+
+Writes a synthetic snapshot (default 1,000,000 x 768 float32 rows of one source) to
+a temporary directory, then measures in a fresh process what a worker pays to
+start serving from it: opening the snapshot and loading the source into
+InMemoryVectorIndex, the first and the p50 query, and how much of the process's
+resident memory is file-backed (shared page cache) versus private (anonymous).
+No database is needed; the post-snapshot catch-up query is skipped.
+
+    cd backend
+    python -m benchmarks.bench_vector_snapshot --rows 1000000 --dtype float16
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.vector_index import InMemoryVectorIndex
+from app.services.vector_snapshot import MANIFEST, SegmentWriter, VectorSnapshot
+
+DIMENSION = 768
+SOURCE_ID = 1
+WRITE_CHUNK = 20000
+
+
+class NoNewContent:
+    """Stands in for the session: nothing was written after the snapshot."""
+
+    async def stream(self, query):
+        return self
+
+    async def execute(self, query):
+        return self
+
+    def scalar_one_or_none(self):
+        return None
+
+    async def partitions(self, size):
+        return
+        yield
+
+
+def memory_kib() -> dict:
+    status = Path("/proc/self/status").read_text().splitlines()
+    fields = dict(line.split(":", 1) for line in status)
+    return {name: int(fields[name].split()[0]) for name in ("RssAnon", "RssFile")}
+
+
+def write(directory: Path, rows: int, dtype: str):
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    writer = SegmentWriter(directory / "segment-bench.vecs", DIMENSION, dtype)
+    for start in range(0, rows, WRITE_CHUNK):
+        count = min(WRITE_CHUNK, rows - start)
+        writer.write(
+            np.arange(start + 1, start + count + 1),
+            np.full(count, SOURCE_ID),
+            ["section"] * count,
+            rng.standard_normal((count, DIMENSION)).astype(np.float32)
+        )
+    writer.close()
+    (directory / MANIFEST).write_text(json.dumps({
+        "version": 1, "dtype": dtype, "dimension": DIMENSION, "source_ids": None,
+        "segments": ["segment-bench.vecs"],
+    }))
+    elapsed = time.perf_counter() - started
+    print(f"wrote {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+
+async def start_worker(directory: Path, queries: int):
+    before = memory_kib()
+    started = time.perf_counter()
+    snapshot = VectorSnapshot(directory)
+    index = InMemoryVectorIndex(dimension=DIMENSION)
+    await index.load_source(NoNewContent(), SOURCE_ID, snapshot)
+    loaded = time.perf_counter() - started
+
+    query_vectors = np.random.default_rng(1).standard_normal((queries, DIMENSION)).astype(np.float32)
+    latencies = []
+    for query in query_vectors:
+        started = time.perf_counter()
+        index.search(query, 10, SOURCE_ID)
+        latencies.append(time.perf_counter() - started)
+    after = memory_kib()
+
+    print(f"open + load source: {loaded * 1000:.1f} ms")
+    print(f"first query: {latencies[0] * 1000:.1f} ms, p50: {np.percentile(latencies, 50) * 1000:.1f} ms")
+    print(
+        f"resident after queries: {(after['RssFile'] - before['RssFile']) / 1024:.0f} MiB file-backed (shared), "
+        f"{(after['RssAnon'] - before['RssAnon']) / 1024:.0f} MiB private"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(start_worker(Path(args.worker), args.queries))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            write(Path(directory), args.rows, args.dtype)
+            # A fresh process, as a newly started uvicorn worker would be
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_vector_snapshot", "--worker", directory,
+                 "--queries", str(args.queries)],
+                check=True
+            )
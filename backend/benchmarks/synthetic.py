@@ -0,0 +1,86 @@
+"""
+Synthetic inputs shared by the benchmarks.
+
+Everything is generated deterministically from a seed so runs are comparable.
+"""
+import random
+import tempfile
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+WORDS = (
+    "cell membrane protein energy mitochondria nucleus enzyme reaction acid base "
+    "molecule atom bond electron gene chromosome evolution species population "
+    "ecosystem photosynthesis respiration glucose oxygen carbon water temperature "
+    "pressure volume force mass velocity acceleration momentum function limit "
+    "derivative integral equation variable theorem proof"
+).split()
+
+
+def sentence(rng: random.Random, min_words: int = 8, max_words: int = 20) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+def textbook_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> str:
+    """
+    Write a textbook-like PDF (a heading every few pages, dense body text) to a temp file.
+    Returns the file path; the caller removes it.
+    """
+    rng = random.Random(seed)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_pdf:
+        path = tmp_pdf.name
+
+    c = canvas.Canvas(path, pagesize=letter)
+    for page in range(pages):
+        text = c.beginText(50, 750)
+        text.setFont("Helvetica", 9)
+        if page % 4 == 0:
+            text.textLine(f"Chapter {page // 4 + 1}: {sentence(rng, 2, 4)}")
+            text.textLine("")
+        for _ in range(lines_per_page):
+            text.textLine(sentence(rng, 10, 16))
+        c.drawText(text)
+        c.showPage()
+    c.save()
+    return path
+
+
+def marker_document(blocks: int, blocks_per_page: int = 25, seed: int = 0) -> dict:
+    """
+    A marker JSON document of about `blocks` content blocks: pages holding section
+    headers (every 20 blocks) with paragraphs, lists and figures, in marker's HTML.
+    """
+    rng = random.Random(seed)
+    pages = []
+    page = None
+    section = None
+    for number in range(blocks):
+        if number % blocks_per_page == 0:
+            page = {"block_type": "Page", "html": "", "children": []}
+            pages.append(page)
+        if number % 20 == 0:
+            section = {
+                "block_type": "SectionHeader",
+                "html": f"<h2>{number // 20 + 1}. {sentence(rng, 2, 4)[:-1]}</h2>",
+                "children": []
+            }
+            page["children"].append(section)
+        elif number % 10 == 5:
+            items = [
+                {"block_type": "ListItem", "html": f"<li>{sentence(rng, 4, 10)}</li>", "children": None}
+                for _ in range(3)
+            ]
+            section["children"].append({"block_type": "ListGroup", "html": "", "children": items})
+            page["children"].append({"block_type": "Figure", "html": "<img src='figure.png'/>", "children": None})
+        else:
+            text = paragraph(rng, rng.randint(1, 4)).replace(" energy ", " <i>energy</i> ")
+            section["children"].append(
+                {"block_type": "Text", "html": f"<p>{text} &amp; more &#8212; <b>see</b> x &lt; y</p>", "children": None}
+            )
+    return {"block_type": "Document", "children": pages}
@@ -0,0 +1,25 @@
+"""Stand-ins for the parts of an asyncpg-backed AsyncSession that bulk loads use."""
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar_one(self):
+        return self.rows[0][0]
+
+class FakeDriverConnection:
+    def __init__(self):
+        self.copies = []
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copies.append((table, list(records), columns))
+
+class FakeConnection:
+    def __init__(self, driver_connection):
+        self.driver_connection = driver_connection
+
+    async def get_raw_connection(self):
+        return self
@@ -21,10 +21,16 @@ def test_upload_endpoint(test_client, test_db):
         files={"file": (test_file.name, test_file, "application/pdf")}
     )
     
-    assert response.status_code == 200
+    assert response.status_code == 202
     result = response.json()
-    assert result["status"] == "success"
+    assert result["status"] == "queued"
     assert "message" in result
+    assert "job_id" in result
+
+    # The job is immediately visible on the jobs endpoint
+    response = test_client.get(f"/jobs/{result['job_id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] in ["queued", "running", "succeeded", "failed"]
 
 def test_chat_endpoint(test_client, test_db):
     """Test the chat endpoint."""
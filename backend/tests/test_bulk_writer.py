@@ -0,0 +1,67 @@
+import pytest
+
+from app.models import KnowledgeBaseContent
+from app.services.bulk_writer import CONTENT_COLUMNS, ContentBulkWriter
+from fakes import FakeConnection, FakeDriverConnection, FakeResult
+
+class FakeSession:
+    """Just enough of AsyncSession for ContentBulkWriter, without a database."""
+
+    def __init__(self, next_id=100):
+        self.next_id = next_id
+        self.driver_connection = FakeDriverConnection()
+
+    async def execute(self, statement, params=None):
+        if "nextval" in str(statement):
+            ids = list(range(self.next_id, self.next_id + params["count"]))
+            self.next_id += params["count"]
+            return FakeResult([(content_id,) for content_id in ids])
+        return FakeResult([("2024-01-01 00:00:00",)])
+
+    async def connection(self):
+        return FakeConnection(self.driver_connection)
+
+@pytest.mark.asyncio
+async def test_write_allocates_ids_and_links_parents():
+    db = FakeSession(next_id=100)
+    chapter = KnowledgeBaseContent(source_id=1, title="Chapter 1", content="...", content_type="chapter")
+    sections = [
+        KnowledgeBaseContent(source_id=1, title=f"1.{n}", content="...", content_type="section", embedding=[0.5] * 3)
+        for n in range(1, 4)
+    ]
+    for section in sections:
+        section.parent = chapter
+
+    written = await ContentBulkWriter(db).write([chapter] + sections)
+
+    assert written == 4
+    assert [content.content_id for content in [chapter] + sections] == [100, 101, 102, 103]
+
+    (table, records, columns), = db.driver_connection.copies
+    assert table == "knowledge_base_content"
+    assert columns == CONTENT_COLUMNS
+    rows = [dict(zip(columns, record)) for record in records]
+    assert rows[0]["parent_content_id"] is None
+    assert all(row["parent_content_id"] == 100 for row in rows[1:])
+    assert [row["path"] for row in rows] == ["100/", "100/101/", "100/102/", "100/103/"]
+    assert rows[1]["embedding"] == [0.5] * 3
+    assert all(row["created_at"] == row["updated_at"] for row in rows)
+
+@pytest.mark.asyncio
+async def test_write_keeps_existing_ids_and_batches():
+    db = FakeSession(next_id=500)
+    contents = [
+        KnowledgeBaseContent(source_id=1, parent_content_id=7, title=str(n), content="x", content_type="section")
+        for n in range(5)
+    ]
+    contents[0].content_id = 42
+
+    await ContentBulkWriter(db, batch_size=2).write(contents)
+
+    assert [content.content_id for content in contents] == [42, 500, 501, 502, 503]
+    assert [len(records) for _, records, _ in db.driver_connection.copies] == [2, 2, 1]
+    assert all(
+        record[2] == 7 and record[3] is None  # the trigger looks up the parent's path
+        for _, records, _ in db.driver_connection.copies
+        for record in records
+    )
@@ -0,0 +1,178 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import cache as cache_module
+from app.cache import TAG_SCRIPT, Cache, CacheMetrics, LocalCache, RedisCacheBackend, _Entry, cached, source_tags
+from app.metrics import REGISTRY, observe_cache
+
+def entry(value, size=10, tags=(), ttl=60):
+    return _Entry(value, 1000 + ttl, 1000 + ttl + 30, tags, size)
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = Cache(ttl=60, stale_ttl=30, max_entries=100, max_bytes=10000, enabled=True)
+    monkeypatch.setattr(cache_module, "_cache", cache)
+    return cache
+
+class FakePipeline:
+    def __init__(self):
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def set(self, *args, **kwargs):
+        self.commands.append(("set", args, kwargs))
+
+    def eval(self, *args):
+        self.commands.append(("eval", args, {}))
+
+    async def execute(self):
+        return []
+
+@pytest.mark.asyncio
+async def test_redis_tag_sets_expire_with_their_entries(monkeypatch):
+    monkeypatch.setattr(cache_module.time, "time", lambda: 1000.0)
+    pipe = FakePipeline()
+    backend = RedisCacheBackend.__new__(RedisCacheBackend)
+    backend.prefix = "cache:"
+    backend.client = type("Client", (), {"pipeline": lambda self, transaction: pipe})()
+
+    await backend.set("k", entry(1, tags=("source:1", "source:*")), "1")
+
+    (_, _, set_options), (_, script_args, _) = pipe.commands
+    assert set_options == {"ex": 91}
+    # The tag sets last at least as long as the entry
+    assert script_args == (TAG_SCRIPT, 2, "cache:tag:source:1", "cache:tag:source:*", "k", 91)
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_entries=2, max_bytes=100, metrics=CacheMetrics())
+    local.set("a", entry(1))
+    local.set("b", entry(2))
+    local.get("a", 1000)
+    local.set("c", entry(3))
+    assert local.get("b", 1000) is None
+    assert local.get("a", 1000).value == 1
+    local.set("big", entry(4, size=95))
+    assert len(local) == 1 and local.bytes == 95
+    assert local.metrics.evictions == 3
+
+def test_local_cache_expires_past_the_stale_deadline():
+    local = LocalCache(max_entries=10, max_bytes=100, metrics=CacheMetrics())
+    local.set("a", entry(1))
+    assert local.get("a", 1080).value == 1  # stale, still served
+    assert local.get("a", 1091) is None
+    assert local.metrics.expirations == 1
+
+def test_invalidation_by_tag_and_generation_guard():
+    local = LocalCache(max_entries=10, max_bytes=1000, metrics=CacheMetrics())
+    local.set("tree", entry(1, tags=("source:3",)))
+    local.set("other", entry(2, tags=("source:4",)))
+    generations = local.generations(("source:3",))
+    assert local.invalidate_tags(["source:3"]) == 1
+    assert local.get("tree", 1000) is None and local.get("other", 1000).value == 2
+    # A call that started before the invalidation does not store what it read
+    assert not local.set("tree", entry(1, tags=("source:3",)), generations)
+
+def test_source_tags():
+    assert source_tags({"source_id": 3}) == ["source:3"]
+    assert source_tags({"source_id": None}) == ["source:*"]
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_make_one_call(fresh_cache):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"rows": [1, 2]}
+
+    results = await asyncio.gather(*(fresh_cache.get_or_call("key", load) for _ in range(20)))
+    assert all(result == {"rows": [1, 2]} for result in results)
+    assert len(calls) == 1
+    assert await fresh_cache.get_or_call("key", load) == {"rows": [1, 2]}
+    stats = fresh_cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 19, 1)
+
+@pytest.mark.asyncio
+async def test_stale_entries_are_served_while_refreshed(fresh_cache):
+    fresh_cache.ttl = 0.0
+    values = iter(["old", "new"])
+
+    async def load():
+        return next(values)
+
+    assert await fresh_cache.get_or_call("key", load) == "old"
+    assert await fresh_cache.get_or_call("key", load) == "old"  # stale: served, refresh started
+    await asyncio.sleep(0)
+    await asyncio.gather(*fresh_cache._refreshes)
+    assert fresh_cache.local.get("key", 0).value == "new"
+    assert fresh_cache.metrics.stale_hits == 1
+
+@pytest.mark.asyncio
+async def test_invalidate_source_drops_cross_source_entries(fresh_cache):
+    async def load():
+        return "value"
+
+    await fresh_cache.get_or_call("one", load, ("source:3",))
+    await fresh_cache.get_or_call("all", load, ("source:*",))
+    await fresh_cache.get_or_call("other", load, ("source:4",))
+    assert await fresh_cache.invalidate_source(3) == 2
+    assert len(fresh_cache.local) == 1
+
+@pytest.mark.asyncio
+async def test_cached_function_refreshes_with_its_own_session(fresh_cache):
+    sessions = []
+
+    @asynccontextmanager
+    async def background_session():
+        yield "background session"
+
+    @cached("test.tree", tags=source_tags, session_factory=background_session)
+    async def tree(source_id: int, depth: int = 1, db=None):
+        sessions.append(db)
+        return {"source_id": source_id, "depth": depth}
+
+    assert await tree(3, db="request session") == {"source_id": 3, "depth": 1}
+    assert await tree(3, db="another request session") == {"source_id": 3, "depth": 1}
+    assert await tree(3, depth=2, db="request session") == {"source_id": 3, "depth": 2}
+    # Misses run with the request's session
+    assert sessions == ["request session", "request session"]
+
+    fresh_cache.ttl = 0.0
+    await tree(4, db="request session")
+    await tree(4, db="request session")  # stale: served, refreshed after the request
+    await asyncio.sleep(0)
+    await asyncio.gather(*fresh_cache._refreshes)
+    assert sessions[2:] == ["request session", "background session"]
+
+def test_cached_route_keeps_its_signature(fresh_cache):
+    app = FastAPI()
+    calls = []
+
+    def get_db():
+        yield "request session"
+
+    @app.get("/sources/{source_id}/tree")
+    @cached("test.route", tags=source_tags)
+    async def tree(source_id: int, max_depth: int = 2, db=Depends(get_db)):
+        calls.append(source_id)
+        return {"source_id": source_id, "max_depth": max_depth}
+
+    client = TestClient(app)
+    for _ in range(3):
+        assert client.get("/sources/7/tree?max_depth=1").json() == {"source_id": 7, "max_depth": 1}
+    assert calls == [7]
+    assert client.get("/sources/7/tree?max_depth=x").status_code == 422
+
+def test_cache_metrics_are_exported(fresh_cache):
+    fresh_cache.metrics.hits = 5
+    observe_cache(fresh_cache.stats())
+    assert 'cache_events{event="hits"} 5' in REGISTRY.render()
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from app.services.chunking import TextChunker, chunk_pages, is_heading, split_long
+
+WORDS = "cell membrane protein energy nucleus enzyme reaction molecule gene species".split()
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def textbook_pages(pages=30, seed=0):
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        lines = [f"Chapter {page // 5 + 1}: Cells"] if page % 5 == 0 else []
+        for _ in range(4):
+            lines.append("\n".join(sentence(rng, rng.randint(4, 30)) for _ in range(rng.randint(1, 6))))
+            lines.append("")
+        result.append((page, "\n".join(lines)))
+    return result
+
+def test_is_heading():
+    assert is_heading("Chapter 3: Thermodynamics")
+    assert is_heading("4.2 Cell Structure")
+    assert is_heading("12. Genetics")
+    assert is_heading("APPENDIX")
+    assert not is_heading("3 cells were counted in the sample.")
+    assert not is_heading("Cells are the basic unit of life.")
+    assert not is_heading("")
+
+def test_split_long_cuts_at_whitespace():
+    assert split_long("aaa bbb ccc", 7) == ["aaa bbb", "ccc"]
+    assert split_long("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+
+def test_chunks_respect_bounds():
+    chunks = chunk_pages(textbook_pages(), min_chunk_size=200, max_chunk_size=1000, overlap=50)
+
+    assert len(chunks) > 10
+    assert all(len(chunk.text) <= 1000 for chunk in chunks)
+    # Only the last chunk may be short (when it could not be merged)
+    assert all(len(chunk.text) - chunk.overlap >= 200 for chunk in chunks[:-1])
+
+def test_chunks_cover_the_text_in_order():
+    pages = textbook_pages(10)
+    chunks = chunk_pages(pages, min_chunk_size=100, max_chunk_size=400, overlap=0)
+
+    words = [word for _, text in pages for word in text.split()]
+    assert [word for chunk in chunks for word in chunk.text.split()] == words
+
+def test_overlap_repeats_the_end_of_the_previous_chunk():
+    chunks = chunk_pages(textbook_pages(10), min_chunk_size=100, max_chunk_size=400, overlap=40)
+
+    overlapping = [(previous, chunk) for previous, chunk in zip(chunks, chunks[1:]) if chunk.overlap]
+    assert overlapping
+    for previous, chunk in overlapping:
+        assert 0 < chunk.overlap <= 40
+        assert previous.text.endswith(chunk.text[:chunk.overlap])
+
+def test_headings_start_chunks_and_record_page_spans():
+    chunks = chunk_pages(textbook_pages(), min_chunk_size=200, max_chunk_size=1000, overlap=50)
+
+    chapter_starts = [chunk for chunk in chunks if chunk.text.startswith("Chapter")]
+    assert [chunk.page_start for chunk in chapter_starts] == [0, 5, 10, 15, 20, 25]
+    assert all(chunk.overlap == 0 for chunk in chapter_starts)
+    assert all(chunk.heading == "Chapter 2: Cells" for chunk in chunks if 5 < chunk.page_start < 10)
+    assert all(chunk.page_start <= chunk.page_end for chunk in chunks)
+    assert [chunk.page_start for chunk in chunks] == sorted(chunk.page_start for chunk in chunks)
+
+def test_short_last_chunk_is_merged():
+    first = "\n\n".join(["a" * 150 + ".", "b" * 150 + "."])
+    last = "Chapter 2: The End\nFin."
+    chunks = chunk_pages([(0, first), (1, last)], min_chunk_size=100, max_chunk_size=400, overlap=0)
+
+    assert len(chunks) == 1
+    assert chunks[0].text.endswith("\n\nChapter 2: The End\n\nFin.")
+    assert (chunks[0].page_start, chunks[0].page_end) == (0, 1)
+
+    # Merging would break max_chunk_size: the short chunk stays
+    chunks = chunk_pages([(0, first), (1, last)], min_chunk_size=100, max_chunk_size=310, overlap=0)
+    assert [chunk.heading for chunk in chunks] == [None, "Chapter 2: The End"]
+
+def test_long_sentences_are_cut():
+    text = " ".join(["word"] * 500)
+    chunks = chunk_pages([(0, text), (1, text)], min_chunk_size=100, max_chunk_size=300, overlap=20)
+
+    assert all(len(chunk.text) <= 300 for chunk in chunks)
+    assert chunks[-1].page_end == 1
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        TextChunker(min_chunk_size=500, max_chunk_size=100)
+    with pytest.raises(ValueError):
+        TextChunker(min_chunk_size=100, max_chunk_size=1000, overlap=100)
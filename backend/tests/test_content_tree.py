@@ -0,0 +1,72 @@
+from collections import namedtuple
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.content_tree import assemble_tree, build_tree_query, path_ids
+
+Row = namedtuple("Row", "content_id parent_content_id title content_type depth")
+
+def compile_query(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def textbook_rows(chapters=20, sections=50, paragraphs=19):
+    """A ~20k-node hierarchy: chapters > sections > paragraphs."""
+    rows = []
+    next_id = 1
+    for chapter in range(chapters):
+        chapter_id = next_id
+        next_id += 1
+        rows.append(Row(chapter_id, None, f"Chapter {chapter + 1}", "chapter", 0))
+        for section in range(sections):
+            section_id = next_id
+            next_id += 1
+            rows.append(Row(section_id, chapter_id, f"{chapter + 1}.{section + 1}", "section", 1))
+            for _ in range(paragraphs):
+                rows.append(Row(next_id, section_id, None, "paragraph", 2))
+                next_id += 1
+    return rows
+
+def test_assemble_tree_links_every_node():
+    rows = textbook_rows()
+    assert len(rows) == 20020
+
+    roots = assemble_tree(reversed(rows))  # children before their parents
+
+    assert len(roots) == 20
+    assert all(len(root.children) == 50 for root in roots)
+    assert sum(len(section.children) for root in roots for section in root.children) == 19000
+
+def test_assemble_subtree_treats_unknown_parents_as_roots():
+    roots = assemble_tree([Row(5, 1, "1.1", "section", 0), Row(6, 5, None, "paragraph", 1)])
+    assert [root.content_id for root in roots] == [5]
+    assert roots[0].children[0].content_id == 6
+
+def test_to_dict_handles_deep_trees():
+    rows = [Row(1, None, "root", "chapter", 0)] + [Row(n, n - 1, None, "section", n - 1) for n in range(2, 5001)]
+    (root,) = assemble_tree(rows)
+
+    data = root.to_dict()
+
+    depth = 0
+    while data["children"]:
+        data = data["children"][0]
+        depth += 1
+    assert depth == 4999
+    assert "content" not in data
+
+def test_tree_query_is_one_recursive_cte():
+    sql = compile_query(build_tree_query(source_id=3, max_depth=2))
+    assert sql.startswith("WITH RECURSIVE tree")
+    assert "parent_content_id IS NULL" in sql
+    assert "tree.depth <" in sql
+    assert "knowledge_base_content.content," not in sql
+
+def test_subtree_query_starts_from_root_id():
+    sql = compile_query(build_tree_query(root_id=10, include_content=True))
+    assert "knowledge_base_content.content_id = " in sql
+    assert "parent_content_id IS NULL" not in sql
+    assert "knowledge_base_content.content AS content" in sql
+
+def test_path_ids():
+    assert path_ids("12/40/41/") == [12, 40, 41]
+    assert path_ids(None) == []
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from app import config
+from app.database import (
+    POOL_WAIT_BUCKETS, PoolMetrics, engine, ingest_engine, metered_pool_class, pool_metrics
+)
+
+class FakeDBAPIConnection:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_pool_metrics_histogram_is_cumulative():
+    metrics = PoolMetrics()
+    for seconds in (0.0001, 0.003, 0.003, 0.2, 100):
+        metrics.observe_wait(seconds)
+
+    histogram = metrics.histogram()
+
+    assert metrics.checkouts == 5
+    assert list(histogram) == [str(bound) for bound in POOL_WAIT_BUCKETS] + ["+Inf"]
+    assert histogram["0.001"] == 1
+    assert histogram["0.005"] == 3
+    assert histogram["0.25"] == 4
+    assert histogram["30.0"] == 4
+    assert histogram["+Inf"] == 5
+
+def test_metered_pool_counts_checkouts_and_timeouts():
+    pool_class = metered_pool_class("test", base=QueuePool)
+    pool = pool_class(FakeDBAPIConnection, pool_size=1, max_overflow=0, timeout=0.01)
+
+    held = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    held.close()
+    pool.connect().close()
+
+    assert pool.metrics.checkouts == 3
+    assert pool.metrics.timeouts == 1
+    assert pool.metrics.waiting == 0
+    assert pool.metrics.wait_seconds >= 0.01
+    # The metrics belong to the class, so a pool recreated on dispose keeps them
+    assert pool.recreate().metrics is pool.metrics
+
+def test_serving_and_ingest_engines_have_separate_pools():
+    assert engine.pool is not ingest_engine.pool
+    assert engine.pool.metrics is not ingest_engine.pool.metrics
+
+    snapshot = pool_metrics()
+
+    assert snapshot["serving"]["size"] == config.DB_POOL_SIZE
+    assert snapshot["ingest"]["size"] == config.INGEST_DB_POOL_SIZE
+    assert snapshot["ingest"]["max_overflow"] == config.INGEST_DB_MAX_OVERFLOW
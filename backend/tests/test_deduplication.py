@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.deduplication import StoredEmbeddings, record_source_file
+from app.services.document_processor import save_upload_file
+from app.services.embeddings import content_hash
+from app.services.source_intake import InformationSource
+
+StoredRow = namedtuple("StoredRow", "content_hash embedding")
+
+class FakeUpload:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+
+class FakeLookupSession:
+    def __init__(self, stored):
+        self.stored = stored
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return [StoredRow(key, vector) for key, vector in self.stored.items()]
+
+@pytest.mark.asyncio
+async def test_save_upload_file_hashes_while_writing():
+    data = os.urandom(200 * 1024)
+    digest = hashlib.sha256()
+
+    file_path = await save_upload_file(FakeUpload("book.pdf", data), digest)
+    try:
+        with open(file_path, "rb") as saved:
+            assert saved.read() == data
+    finally:
+        os.remove(file_path)
+
+    assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+
+@pytest.mark.asyncio
+async def test_stored_embeddings_only_embeds_new_text():
+    unchanged = np.full(4, 0.5, dtype=np.float32)
+    session = FakeLookupSession({content_hash("Unchanged page"): unchanged})
+    sent = []
+
+    async def embed(texts):
+        sent.extend(texts)
+        return [np.full(4, float(len(text)), dtype=np.float32) for text in texts]
+
+    stored = StoredEmbeddings(embed, session_factory=lambda: session)
+    vectors = await stored.embed(["New page", "Unchanged  page", "Another new page"])
+
+    assert sent == ["New page", "Another new page"]
+    assert vectors[0][0] == 8.0
+    assert vectors[1] is not None and np.array_equal(vectors[1], unchanged)
+    assert vectors[2][0] == 16.0
+    assert stored.metrics.reused == 1
+    assert "DISTINCT ON" in str(session.statements[0].compile(dialect=postgresql.dialect()))
+
+@pytest.mark.asyncio
+async def test_stored_embeddings_falls_back_when_lookup_fails():
+    class BrokenSession(FakeLookupSession):
+        async def execute(self, statement, params=None):
+            raise ConnectionError("database unavailable")
+
+    async def embed(texts):
+        return [np.zeros(4, dtype=np.float32) for _ in texts]
+
+    stored = StoredEmbeddings(embed, session_factory=lambda: BrokenSession({}))
+    assert len(await stored.embed(["a", "b"])) == 2
+
+@pytest.mark.asyncio
+async def test_record_source_file_ignores_known_digests():
+    class RecordingSession:
+        async def execute(self, statement):
+            self.sql = str(statement.compile(dialect=postgresql.dialect()))
+
+    db = RecordingSession()
+    await record_source_file(db, "ab" * 32, 7, "book.pdf", 1024)
+
+    assert "INSERT INTO source_files" in db.sql
+    assert "ON CONFLICT (digest) DO NOTHING" in db.sql
+
+def test_content_models_carry_content_hash():
+    source = InformationSource(
+        name="Biology", source="OpenStax", source_description=None, source_type="textbook",
+        author=None, publisher=None, publication_date=None, license=None, language="en", url="",
+        content_text="Cells are the basic unit of life.", content_type="chapter"
+    )
+    assert source.to_content_model().content_hash == content_hash("Cells are the basic unit of life.")
@@ -6,7 +6,12 @@ from reportlab.lib.pagesizes import letter
 from fastapi.testclient import TestClient
 from io import BytesIO
 
-from app.services.document_processor import DocumentProcessor
+import hashlib
+import os
+from starlette.datastructures import UploadFile
+from tempfile import SpooledTemporaryFile
+
+from app.services.document_processor import DocumentProcessor, stage_upload
 from app.main import app
 
 def create_test_pdf():
@@ -39,10 +44,11 @@ def pdf_file():
     # Cleanup
     Path(file_path).unlink()
 
-def test_document_processor_pdf(pdf_file):
+@pytest.mark.asyncio
+async def test_document_processor_pdf(pdf_file):
     """Test that the document processor can handle PDFs."""
     processor = DocumentProcessor()
-    chunks = processor.process_pdf(pdf_file)
+    chunks = await processor.process_file(pdf_file, 'pdf')
     
     assert len(chunks) > 0
     assert any("Introduction to Biology" in chunk.content for chunk in chunks)
@@ -54,6 +60,44 @@ def test_document_processor_pdf(pdf_file):
     assert first_chunk.chunk_number == 0
     assert isinstance(first_chunk.metadata, dict)
 
+def spooled_upload(data, filename="book.pdf"):
+    """An UploadFile the way Starlette builds it: spooled to disk past 1MB."""
+    spooled = SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(spooled, size=len(data), filename=filename)
+
+@pytest.mark.asyncio
+async def test_stage_upload_keeps_small_files_in_memory(pdf_file):
+    data = Path(pdf_file).read_bytes()
+    digest = hashlib.sha256()
+
+    staged = await stage_upload(spooled_upload(data), digest, memory_max_bytes=len(data))
+    try:
+        assert staged.data == data and staged.document is staged.data
+        assert staged.size == len(data)
+        assert Path(staged.path).read_bytes() == data
+        chunks = await DocumentProcessor().process_file(staged.document, 'pdf')
+    finally:
+        os.remove(staged.path)
+
+    assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert any("Cell Structure" in chunk.content for chunk in chunks)
+
+@pytest.mark.asyncio
+async def test_stage_upload_copies_large_files_to_disk():
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    digest = hashlib.sha256()
+
+    staged = await stage_upload(spooled_upload(data), digest, memory_max_bytes=1024 * 1024)
+    try:
+        assert staged.data is None and staged.document == staged.path
+        assert Path(staged.path).read_bytes() == data
+    finally:
+        os.remove(staged.path)
+
+    assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+
 @pytest.mark.asyncio
 async def test_upload_endpoint():
     """Test the PDF upload endpoint."""
@@ -73,12 +117,11 @@ async def test_upload_endpoint():
     
     # Test upload
     response = client.post("/upload", files=files)
-    assert response.status_code == 200
+    assert response.status_code == 202
     
     data = response.json()
-    assert data["status"] == "success"
-    assert data["chunks_processed"] > 0
-    assert "source_id" in data
+    assert data["status"] == "queued"
+    assert "job_id" in data
 
 def test_invalid_file_upload():
     """Test uploading an invalid file type."""
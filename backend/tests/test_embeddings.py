@@ -0,0 +1,113 @@
+import asyncio
+import numpy as np
+import pytest
+
+from app.services.embeddings import EmbeddingBackend, EmbeddingService, HashEmbeddingBackend, content_hash
+
+class CountingBackend(EmbeddingBackend):
+    """Records every batch it is asked to embed."""
+
+    dimension = 4
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def embed(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("backend unavailable")
+        return [np.full(4, float(len(text))) for text in texts]
+
+def test_content_hash_ignores_whitespace():
+    assert content_hash("Licensed under  CC BY 4.0\n") == content_hash("Licensed under CC BY 4.0")
+    assert content_hash("Licensed under CC BY 4.0") != content_hash("Licensed under CC BY-SA 4.0")
+
+@pytest.mark.asyncio
+async def test_hash_backend_is_deterministic_and_normalised():
+    backend = HashEmbeddingBackend(dimension=768)
+    first, second, other = await backend.embed([
+        "The mitochondria is the powerhouse of the cell",
+        "The mitochondria is the powerhouse of the cell",
+        "Python is a programming language",
+    ])
+
+    assert first.shape == (768,)
+    assert np.allclose(first, second)
+    assert np.isclose(np.linalg.norm(first), 1.0)
+
+    query = backend.embed_one("What do mitochondria do in the cell?")
+    assert float(query @ first) > float(query @ other)
+
+@pytest.mark.asyncio
+async def test_cache_embeds_repeated_text_once():
+    backend = CountingBackend()
+    service = EmbeddingService(backend, batch_size=8, batch_wait_ms=1)
+
+    await service.embed(["licence", "chapter one"])
+    vectors = await service.embed(["licence", "licence  "])
+
+    assert backend.batches == [["licence", "chapter one"]]
+    assert all(np.allclose(vector, 7.0) for vector in vectors)
+    assert service.metrics.cache_hits == 2
+    assert service.metrics.snapshot()["cache_hit_rate"] == 0.5
+
+@pytest.mark.asyncio
+async def test_micro_batches_concurrent_callers():
+    backend = CountingBackend()
+    service = EmbeddingService(backend, batch_size=4, batch_wait_ms=50)
+
+    results = await asyncio.gather(
+        service.embed(["a", "bb"]),
+        service.embed(["ccc", "a"]),
+        service.embed(["dddd", "eeeee"]),
+    )
+
+    # Five distinct texts from three callers: one full batch, then the remainder
+    assert sorted(len(batch) for batch in backend.batches) == [1, 4]
+    assert [float(vector[0]) for vector in results[1]] == [3.0, 1.0]
+    assert service.metrics.snapshot()["mean_batch_size"] == 2.5
+
+@pytest.mark.asyncio
+async def test_backend_errors_reach_every_caller():
+    service = EmbeddingService(CountingBackend(fail=True), batch_size=8, batch_wait_ms=1)
+
+    with pytest.raises(RuntimeError, match="backend unavailable"):
+        await service.embed(["a", "b"])
+    assert service.metrics.errors == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_a_shared_text():
+    service = EmbeddingService(CountingBackend(), batch_size=8, batch_wait_ms=20)
+
+    cancelled = asyncio.ensure_future(service.embed(["shared"]))
+    waiting = asyncio.ensure_future(service.embed(["shared"]))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    [vector] = await waiting
+    assert np.allclose(vector, 6.0)
+    assert cancelled.cancelled()
+
+@pytest.mark.asyncio
+async def test_texts_in_a_batch_being_embedded_are_not_sent_again():
+    release = asyncio.Event()
+
+    class SlowBackend(CountingBackend):
+        async def embed(self, texts):
+            await release.wait()
+            return await super().embed(texts)
+
+    backend = SlowBackend()
+    service = EmbeddingService(backend, batch_size=1, batch_wait_ms=1)
+
+    first = asyncio.ensure_future(service.embed(["licence"]))
+    await asyncio.sleep(0.01)  # its batch is with the backend now
+    second = asyncio.ensure_future(service.embed(["licence", "chapter"]))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert np.allclose((await first)[0], 7.0)
+    assert [float(vector[0]) for vector in await second] == [7.0, 7.0]
+    assert sorted(backend.batches) == [["chapter"], ["licence"]]
+    assert not service._inflight
@@ -0,0 +1,152 @@
+import base64
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import config
+from app.services.export import (
+    ExportService,
+    arrow_export,
+    build_content_query,
+    check_export_format,
+    encode_embedding,
+    export_to_directory,
+    ndjson_export,
+    read_manifest,
+)
+
+STARTED = datetime(2024, 5, 1, 12, 0, 0)
+OLDEST_TRANSACTION = datetime(2024, 5, 1, 11, 40, 0)
+
+SOURCES = [
+    {
+        "source_id": 3, "name": "Biology", "description": None, "source_type": "textbook", "author": None,
+        "publisher": "OpenStax", "publication_date": date(2023, 1, 1), "license": "CC BY 4.0", "language": "en",
+        "url": "https://openstax.org/biology", "created_at": STARTED, "updated_at": STARTED,
+    },
+]
+
+CONTENT = [
+    {
+        "content_id": content_id, "source_id": 3, "parent_content_id": None if content_id == 1 else 1,
+        "path": "1/" if content_id == 1 else f"1/{content_id}/", "title": f"Section {content_id}",
+        "content": "Cells are the basic unit of life.", "content_type": "section", "content_hash": None,
+        "created_at": STARTED, "updated_at": STARTED,
+        "embedding": np.full(config.EMBEDDING_DIMENSION, 0.5, dtype=np.float32),
+    }
+    for content_id in range(1, 6)
+]
+
+
+class FakeRow:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+
+class FakeStream:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def partitions(self, size):
+        for start in range(0, len(self.rows), size):
+            yield [FakeRow(dict(row)) for row in self.rows[start:start + size]]
+
+
+class FakeExportSession:
+    """Answers the export's statements: the oldest open transaction, the transaction settings and the two streams."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, bind_arguments=None):
+        self.statements.append(str(statement))
+        return type("Result", (), {"scalar_one": lambda self: OLDEST_TRANSACTION})()
+
+    async def commit(self):
+        self.statements.append("COMMIT")
+
+    async def stream(self, query):
+        sql = str(query)
+        self.statements.append(sql)
+        if "FROM knowledge_base_sources" in sql:
+            return FakeStream(SOURCES)
+        columns = {column.name for column in query.selected_columns}
+        return FakeStream([{key: row[key] for key in row if key in columns} for row in CONTENT])
+
+
+def compiled(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+def test_content_query_filters_by_watermark_and_source():
+    sql = compiled(build_content_query([3], STARTED, embeddings=True))
+    assert "knowledge_base_content.updated_at >= %(updated_at_1)s" in sql
+    assert "knowledge_base_content.source_id IN" in sql
+    assert "knowledge_base_content.embedding" in sql
+    assert sql.endswith("ORDER BY knowledge_base_content.content_id")
+    assert "embedding" not in compiled(build_content_query())
+
+
+def test_embeddings_are_encoded_as_float16():
+    vector = np.array([0.25, -1.5, 3.0], dtype=np.float32)
+    assert np.array_equal(np.frombuffer(encode_embedding(vector), dtype="<f2"), vector)
+    assert encode_embedding(None) is None
+
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(ValueError, match="Unknown export format"):
+        check_export_format("csv")
+    check_export_format("ndjson")
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_streams_batches_and_ends_with_the_watermark(monkeypatch):
+    monkeypatch.setattr(config, "EXPORT_BATCH_SIZE", 2)
+    db = FakeExportSession()
+    export = ExportService(db, [3], since=datetime(2024, 4, 1), embeddings=True)
+    await export.begin()
+
+    chunks = [chunk async for chunk in ndjson_export(export)]
+    lines = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+
+    # The oldest open transaction is read before the export's snapshot is taken
+    assert "pg_stat_activity" in db.statements[0]
+    assert db.statements[1] == "COMMIT"
+    assert "REPEATABLE READ" in db.statements[2]
+    assert len(chunks) == 1 + 3 + 1  # sources, content in batches of 2, end
+    assert [line["type"] for line in lines] == ["source"] + ["content"] * 5 + ["end"]
+    assert lines[0]["publication_date"] == "2023-01-01"
+    vector = np.frombuffer(base64.b64decode(lines[1]["embedding"]), dtype="<f2")
+    assert vector.shape == (config.EMBEDDING_DIMENSION,) and vector[0] == 0.5
+    assert lines[-1] == {
+        "type": "end", "watermark": "2024-05-01T11:40:00", "since": "2024-04-01T00:00:00", "sources": 1, "content": 5
+    }
+
+
+@pytest.mark.asyncio
+async def test_arrow_export_writes_an_ipc_stream():
+    pa = pytest.importorskip("pyarrow")
+    export = ExportService(FakeExportSession(), embeddings=True)
+    await export.begin()
+    body = b"".join([chunk async for chunk in arrow_export(export, "content", {"source": "{}"})])
+
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.num_rows == 5
+    assert table.column("content_id").to_pylist() == [1, 2, 3, 4, 5]
+    assert table.schema.field("embedding").type == pa.binary(2 * config.EMBEDDING_DIMENSION)
+    assert table.schema.metadata[b"source"] == b"{}"
+    assert table.schema.metadata[b"watermark"].startswith(b"2024-05-01T")
+
+
+@pytest.mark.asyncio
+async def test_export_to_directory_writes_files_then_the_manifest(tmp_path):
+    manifest = await export_to_directory(FakeExportSession(), tmp_path, "ndjson", source_ids=[3])
+
+    assert read_manifest(tmp_path) == manifest
+    assert manifest["files"] == ["export.ndjson"] and manifest["content"] == 5
+    assert datetime.fromisoformat(manifest["watermark"]) < STARTED
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["export.json", "export.ndjson"]
+    assert read_manifest(tmp_path / "missing") is None
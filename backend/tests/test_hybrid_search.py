@@ -0,0 +1,124 @@
+import asyncio
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import config
+from app.services.hybrid_search import HybridSearchService, RetrievalHit, reciprocal_rank_fusion, with_context
+from app.services.text_search import build_ranked_matches
+from app.services.vector_index import InMemoryVectorIndex
+from app.services.vector_search import build_search_query
+
+def compile_query(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def hit(content_id):
+    return RetrievalHit(content_id, 1, None, f"Section {content_id}", "...", "section", None, None)
+
+class FakeLegs(HybridSearchService):
+    """Legs answering with fixed content ids after a delay, without a database."""
+
+    def __init__(self, vector, text, vector_delay=0.0, text_delay=0.0, embed_delay=0.0):
+        super().__init__(session_factory=None, embed=self._embed, memory_index=InMemoryVectorIndex())
+        self.results = {"vector": (vector, vector_delay), "text": (text, text_delay)}
+        self.embed_delay = embed_delay
+
+    async def _embed(self, query):
+        await asyncio.sleep(self.embed_delay)
+        return np.zeros(config.EMBEDDING_DIMENSION)
+
+    async def _leg(self, name):
+        content_ids, delay = self.results[name]
+        await asyncio.sleep(delay)
+        if isinstance(content_ids, Exception):
+            raise content_ids
+        return [hit(content_id) for content_id in content_ids]
+
+    async def _vector_leg(self, *args):
+        return await self._leg("vector")
+
+    async def _text_leg(self, *args):
+        return await self._leg("text")
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=60)
+    # 3 is found by both and beats the first hit of either alone
+    assert [content_id for content_id, _ in fused] == [3, 1, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+
+def test_candidates_come_with_their_parent_section():
+    for matches, score in ((build_search_query([0.0] * 768, 40), "distance"), (build_ranked_matches("cell", 40), "rank")):
+        sql = compile_query(with_context(matches, score, descending=score == "rank"))
+        assert "LEFT OUTER JOIN knowledge_base_content AS parent " in sql
+        assert "parent.content AS parent_content" in sql
+        assert sql.count("LIMIT") == 1
+
+@pytest.mark.asyncio
+async def test_retrieve_fuses_both_legs():
+    result = await FakeLegs(vector=[1, 2, 3], text=[3, 4]).retrieve("cell membrane", k=3)
+    assert [hit.content_id for hit in result.hits] == [3, 1, 2]
+    assert result.hits[0].ranks == {"vector": 3, "text": 1}
+    assert not result.partial
+
+@pytest.mark.asyncio
+async def test_retrieve_returns_partial_results_within_budget():
+    service = FakeLegs(vector=[1, 2], text=[3], text_delay=5)
+    result = await service.retrieve("cell membrane", k=3, budget_ms=50)
+    assert [hit.content_id for hit in result.hits] == [1, 2]
+    assert result.timed_out == ["text"]
+    assert result.partial
+    assert result.elapsed_ms < 1000
+
+@pytest.mark.asyncio
+async def test_cancelled_legs_are_cleaned_up_before_returning(caplog):
+    released = []
+
+    class SlowCleanup(FakeLegs):
+        async def _text_leg(self, *args):
+            try:
+                await asyncio.sleep(5)
+            finally:
+                # Closing the session: a round trip, then a broken connection
+                await asyncio.sleep(0.05)
+                released.append("text")
+                raise RuntimeError("connection lost while cancelling")
+
+    result = await SlowCleanup(vector=[1], text=[]).retrieve("cell membrane", budget_ms=20)
+
+    assert released == ["text"]
+    assert result.timed_out == ["text"]
+    assert result.cleanup_ms >= 40
+    assert "connection lost while cancelling" in caplog.text
+
+@pytest.mark.asyncio
+async def test_budget_starts_after_the_query_is_embedded():
+    result = await FakeLegs(vector=[1], text=[2], embed_delay=0.1).retrieve("cell membrane", budget_ms=50)
+    assert [hit.content_id for hit in result.hits] == [1, 2]
+    assert not result.partial
+
+@pytest.mark.asyncio
+async def test_failed_leg_returns_partial_results(caplog):
+    service = FakeLegs(vector=RuntimeError("connection reset"), text=[3])
+    result = await service.retrieve("cell membrane", k=3)
+    assert [hit.content_id for hit in result.hits] == [3]
+    assert result.failed == ["vector"] and result.timed_out == []
+    assert result.to_dict()["partial"]
+    assert "connection reset" in caplog.text
+
+    async def unavailable(query):
+        raise RuntimeError("embedding API unavailable")
+
+    service.embed = unavailable
+    result = await service.retrieve("cell membrane", k=3)
+    assert [hit.content_id for hit in result.hits] == [3]
+    assert result.failed == ["vector"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kwargs", [
+    {"query": " "}, {"query": "cell", "k": 0}, {"query": "cell", "budget_ms": 0},
+    {"query": "cell", "query_vector": [0.0, 1.0]},
+])
+async def test_retrieve_rejects_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        await FakeLegs(vector=[], text=[]).retrieve(**kwargs)
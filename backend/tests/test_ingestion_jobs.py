@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import tempfile
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+from app.models import IngestionJob
+from app.services.document_processor import DocumentChunk, DocumentProcessor
+from app import config
+from app.services.ingestion_jobs import IngestionWorkerPool, job_status
+from app.services.ingestion_pipeline import build_information_source
+
+def create_test_pdf(pages: int) -> str:
+    """Create a PDF with one line of text per page."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
+        c = canvas.Canvas(tmp_pdf.name, pagesize=letter)
+        for page in range(pages):
+            c.drawString(100, 750, f"Page {page + 1} of the test textbook")
+            c.showPage()
+        c.save()
+        return tmp_pdf.name
+
+def test_build_information_source():
+    chunks = [
+        DocumentChunk("Intro text", 1, 0, {"title": "Biology 2e", "author": "OpenStax"}),
+        DocumentChunk("Cells text", 6, 1, {"title": "Biology 2e", "author": "OpenStax"}),
+    ]
+
+    source = build_information_source(chunks, "biology.pdf")
+
+    assert source.name == "Biology 2e"
+    assert source.author == "OpenStax"
+    assert source.content_text == "Intro text"
+    assert len(source.sections) == 1
+    assert source.sections[0].name == "Page 6 - Chunk 1"
+    assert source.sections[0].content_type == "section"
+
+def test_build_information_source_falls_back_to_filename():
+    source = build_information_source([DocumentChunk("Text", 1, 0)], "notes.pdf")
+    assert source.name == "notes.pdf"
+    assert source.sections == []
+
+def test_job_status_reports_throughput():
+    started = datetime(2024, 1, 1, 12, 0, 0)
+    job = IngestionJob(
+        job_id=1,
+        filename="book.pdf",
+        file_path="/tmp/book.pdf",
+        status="running",
+        pages_total=1200,
+        pages_processed=300,
+        started_at=started,
+        updated_at=started + timedelta(seconds=10)
+    )
+
+    status = job_status(job)
+
+    assert status["status"] == "running"
+    assert status["pages_processed"] == 300
+    assert status["pages_per_second"] == 30.0
+
+def test_job_status_without_progress():
+    job = IngestionJob(job_id=2, filename="book.pdf", file_path="/tmp/book.pdf", status="queued")
+    assert job_status(job)["pages_per_second"] is None
+
+@pytest.mark.asyncio
+async def test_process_file_reports_progress():
+    pdf_path = create_test_pdf(12)
+    progress = []
+
+    async def record(done, total):
+        progress.append((done, total))
+
+    try:
+        processor = DocumentProcessor(min_chunk_size=50, max_chunk_size=100, overlap=0)
+        chunks = await processor.process_file(pdf_path, 'pdf', progress=record)
+    finally:
+        Path(pdf_path).unlink()
+
+    # 12 one-line pages, three to a chunk; progress every 5 pages
+    assert len(chunks) == 4
+    assert progress == [(5, 12), (10, 12), (12, 12)]
+    assert "Page 1 of the test textbook" in chunks[0].content
+    assert chunks[3].metadata["page_range"] == "9-11"
+    assert [chunk.page_number for chunk in chunks] == [1, 4, 7, 10]
+
+def test_hand_over_respects_memory_budget(monkeypatch):
+    monkeypatch.setattr(config, "UPLOAD_MEMORY_BUDGET_BYTES", 10)
+    pool = IngestionWorkerPool(workers=1)
+    # Without running workers nothing in this process would take the bytes
+    assert not pool.hand_over(1, b"12345")
+
+    monkeypatch.setattr(IngestionWorkerPool, "running", True)
+    assert pool.hand_over(1, b"12345")
+    assert pool.hand_over(2, b"67890")
+    assert not pool.hand_over(3, b"x")
+
+    assert pool._take_staged(1) == b"12345"
+    assert pool._take_staged(1) is None
+    assert pool.hand_over(3, b"x")
+
+class FakeClaimSession:
+    """Answers the claim's statements: one abandoned job, then job 7 to claim."""
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        sql = str(statement)
+        self.statements.append(sql)
+        rows = [(3, self.upload)] if "RETURNING" in sql else [(7,)]
+        return type("Result", (), {"all": lambda self: rows, "scalar_one_or_none": lambda self: rows[0][0]})()
+
+    async def commit(self):
+        self.committed = True
+
+@pytest.mark.asyncio
+async def test_claim_fails_stale_jobs_out_of_attempts(tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF")
+    db = FakeClaimSession(str(upload))
+    pool = IngestionWorkerPool(workers=1, session_factory=lambda: db)
+
+    assert await pool._claim_next() == 7
+    abandon, claim, start = db.statements
+    assert abandon.startswith("UPDATE ingestion_jobs SET status=") and "attempts >=" in abandon
+    assert "FOR UPDATE" in claim and "attempts <" in claim
+    assert start.startswith("UPDATE ingestion_jobs")
+    assert db.committed
+    assert not upload.exists()
+
+def test_get_unknown_job(test_client):
+    response = test_client.get("/jobs/999999")
+    assert response.status_code == 404
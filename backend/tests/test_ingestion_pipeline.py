@@ -0,0 +1,110 @@
+import asyncio
+from pathlib import Path
+import tempfile
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+from app.services.document_processor import DocumentProcessor
+from app.services.ingestion_pipeline import IngestionPipeline, batched, buffered
+
+async def count_up(limit, produced):
+    for number in range(limit):
+        produced.append(number)
+        yield number
+
+@pytest.fixture(scope="module")
+def pdf_file():
+    """An 11-page PDF with a title."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
+        c = canvas.Canvas(tmp_pdf.name, pagesize=letter)
+        c.setTitle("Streaming Biology")
+        for page in range(11):
+            c.drawString(100, 750, f"Streaming page {page}")
+            c.showPage()
+        c.save()
+    yield tmp_pdf.name
+    Path(tmp_pdf.name).unlink()
+
+@pytest.mark.asyncio
+async def test_buffered_preserves_order():
+    produced = []
+    items = [item async for item in buffered(count_up(50, produced), 4)]
+    assert items == list(range(50))
+
+@pytest.mark.asyncio
+async def test_buffered_bounds_read_ahead():
+    produced = []
+    stream = buffered(count_up(1000, produced), 4)
+    assert await stream.__anext__() == 0
+
+    # Give the producer every chance to run ahead
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+    # One item consumed, at most 4 queued and one waiting to be put
+    assert len(produced) <= 6
+    await stream.aclose()
+
+@pytest.mark.asyncio
+async def test_buffered_reraises_producer_errors():
+    async def failing():
+        yield 1
+        raise RuntimeError("extraction failed")
+
+    seen = []
+    with pytest.raises(RuntimeError, match="extraction failed"):
+        async for item in buffered(failing(), 2):
+            seen.append(item)
+    assert seen == [1]
+
+@pytest.mark.asyncio
+async def test_batched():
+    batches = [batch async for batch in batched(count_up(7, []), 3)]
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+@pytest.mark.asyncio
+async def test_pipeline_streams_source_then_embedded_sections(pdf_file):
+    batch_sizes = []
+
+    async def embed(texts):
+        batch_sizes.append(len(texts))
+        return [[float(len(text))] * 3 for text in texts]
+
+    processor = DocumentProcessor(min_chunk_size=30, max_chunk_size=60, overlap=0)
+    pipeline = IngestionPipeline(processor, embed=embed, buffer_size=2, embed_batch_size=2)
+    items = [item async for item in pipeline.sections(pdf_file, "upload.pdf")]
+
+    # 11 one-line pages, three to a chunk: the document and three sections
+    assert len(items) == 4
+    assert items[0].name == "Streaming Biology"
+    assert items[0].content_type == "document"
+    assert "Streaming page 0" in items[0].content_text
+    assert [item.content_type for item in items[1:]] == ["section", "section", "section"]
+    assert items[3].name == "Page 10 - Chunk 3"
+    assert all(item.embedding == [float(len(item.content_text))] * 3 for item in items)
+    assert batch_sizes == [2, 2]
+
+@pytest.mark.asyncio
+async def test_failed_write_stops_the_stages(monkeypatch):
+    closed = []
+
+    async def extract():
+        try:
+            for number in range(1000):
+                yield number
+        finally:
+            closed.append(True)
+
+    async def failing_write(self, source, sections, batch_size):
+        await sections.__anext__()
+        raise RuntimeError("COPY failed")
+
+    monkeypatch.setattr("app.services.ingestion_pipeline.SourceIntakeService.process_source_stream", failing_write)
+    pipeline = IngestionPipeline(DocumentProcessor(), buffer_size=2)
+    monkeypatch.setattr(pipeline, "sections", lambda *args: buffered(buffered(extract(), 2), 2))
+
+    with pytest.raises(RuntimeError, match="COPY failed"):
+        await pipeline.ingest(None, "upload.pdf", "upload.pdf")
+    # Closed before ingest returned, not whenever the generators are collected
+    assert closed == [True]
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from bs4 import BeautifulSoup
+
+from app.services.marker_loader import MarkerDocumentLoader, flatten_blocks, html_to_text
+from fakes import FakeConnection, FakeDriverConnection, FakeResult
+
+def block(block_type, html="", children=None):
+    return {"block_type": block_type, "html": html, "children": children}
+
+DOCUMENT = {
+    "children": [
+        block("Page", children=[
+            block("Text", "<p>Preface</p>"),
+            block("SectionHeader", "<h1>Chapter 1: Limits</h1>", children=[
+                block("Text", "<p>A limit is&nbsp;a value.</p>"),
+            ]),
+            block("Figure", "<img src='x.png'/>"),
+        ]),
+        block("Page", children=[
+            block("Text", "<p>More on limits</p>"),
+            block("ListGroup", children=[
+                block("ListItem", "<li>one</li>"),
+                block("ListItem", "<li>two</li>"),
+            ]),
+            block("SectionHeader", "<h2>1.1 Continuity</h2>"),
+            block("Text", "<p>Continuous functions</p>"),
+        ]),
+    ]
+}
+
+def test_flatten_blocks_keeps_the_hierarchy():
+    blocks = flatten_blocks(DOCUMENT)
+
+    assert [(b.block_type, b.text, b.parent) for b in blocks] == [
+        ("Text", "Preface", None),
+        ("SectionHeader", "Chapter 1: Limits", None),
+        ("Text", "A limit is\xa0a value.", 1),
+        ("Text", "More on limits", 1),
+        ("ListItem", "one", 1),
+        ("ListItem", "two", 1),
+        ("SectionHeader", "1.1 Continuity", None),
+        ("Text", "Continuous functions", 6),
+    ]
+    assert [b.title for b in blocks[:2]] == [None, "Chapter 1: Limits"]
+
+def test_flatten_blocks_handles_deep_nesting():
+    document = {"children": []}
+    node = document
+    for level in range(20000):
+        header = block("SectionHeader", f"<h1>Level {level}</h1>", children=[])
+        node["children"].append(header)
+        node = header
+
+    blocks = flatten_blocks(document)
+
+    assert len(blocks) == 20000
+    assert blocks[-1].parent == 19998
+
+@pytest.mark.parametrize("markup", [
+    "<p>Plain <b>bold</b> and <i>italic</i></p>",
+    "<p>x &lt; y &amp;&amp; y &gt; z, caf&eacute; &#8212; done</p>",
+    "<p>a < b but c<d</p>",
+    "<p>before<!-- a > comment -->after</p>",
+    "<math display='inline'>x^2</math> <br/>tail",
+    "no markup at all",
+])
+def test_html_to_text_matches_beautifulsoup(markup):
+    assert html_to_text(markup) == BeautifulSoup(markup, "html.parser").get_text()
+
+class FakeBind:
+    class dialect:
+        driver = "asyncpg"
+
+class FakeSession:
+    """Just enough of an asyncpg-backed AsyncSession for MarkerDocumentLoader."""
+
+    bind = FakeBind()
+
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+        self.id_queries = 0
+        self.driver_connection = FakeDriverConnection()
+
+    def add(self, model):
+        self.added.append(model)
+
+    async def flush(self):
+        for model in self.added:
+            model.source_id = 7
+
+    async def commit(self):
+        self.commits += 1
+
+    async def execute(self, statement, params=None):
+        if "nextval" in str(statement):
+            self.id_queries += 1
+            return FakeResult([(content_id,) for content_id in range(100, 100 + params["count"])])
+        return FakeResult([("2024-01-01 00:00:00",)])
+
+    async def connection(self):
+        return FakeConnection(self.driver_connection)
+
+@pytest.mark.asyncio
+async def test_load_writes_the_tree_in_one_transaction():
+    db = FakeSession()
+    embedded = []
+
+    async def embed(texts):
+        embedded.append(len(texts))
+        return [np.full(3, len(text), dtype=np.float32) for text in texts]
+
+    loader = MarkerDocumentLoader(db, embed=embed, batch_size=5, embed_batch_size=2)
+    source, written = await loader.load(DOCUMENT, {"title": "Calculus", "author": "Jane Doe"})
+
+    assert written == 8
+    assert (source.name, source.author, source.source_type) == ("Calculus", "Jane Doe", "textbook")
+    assert db.commits == 1 and db.id_queries == 1
+    assert embedded == [2, 2, 1, 2, 1]
+
+    rows = [
+        dict(zip(columns, record))
+        for _, records, columns in db.driver_connection.copies
+        for record in records
+    ]
+    assert [len(records) for _, records, _ in db.driver_connection.copies] == [5, 3]
+    assert [row["content_id"] for row in rows] == list(range(100, 108))
+    assert [row["parent_content_id"] for row in rows] == [None, None, 101, 101, 101, 101, None, 106]
+    assert [row["path"] for row in rows[:3]] == ["100/", "101/", "101/102/"]
+    assert rows[7]["path"] == "106/107/"
+    assert all(row["source_id"] == 7 for row in rows)
+    assert rows[1]["content_type"] == "SectionHeader" and rows[1]["title"] == "Chapter 1: Limits"
+    assert rows[0]["embedding"][0] == len("Preface")
@@ -0,0 +1,86 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.database import POOL_WAIT_BUCKETS, PoolMetrics
+from app.metrics import (
+    HTTP_REQUEST_DB_QUERIES, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, Histogram, MetricsMiddleware, Registry,
+    current_request, observe_pools, observe_query
+)
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("stage_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(seconds, "embed")
+    registry.counter("jobs_total", "Jobs.", ("status",)).inc("done", amount=2)
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP stage_seconds Stage time.", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="embed"} 4' in lines
+    assert 'stage_seconds_sum{stage="embed"} 4.05' in lines
+    assert 'jobs_total{status="done"} 2' in lines
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("requests_total", "Requests.", ("route",)).inc('/a"b\\c')
+
+    assert 'requests_total{route="/a\\"b\\\\c"} 1' in registry.render()
+
+def test_middleware_labels_by_route_template_and_counts_queries():
+    app = FastAPI()
+
+    @app.get("/sources/{source_id}/tree")
+    async def tree(source_id: int):
+        observe_query("serving", 0.002)
+        observe_query("serving", 0.001)
+        return {"source_id": source_id}
+
+    app.add_middleware(MetricsMiddleware)
+    route = "/sources/{source_id}/tree"
+    requests = HTTP_REQUEST_SECONDS.count("GET", route)
+    queries = HTTP_REQUEST_DB_QUERIES.total(route)
+
+    client = TestClient(app)
+    assert client.get("/sources/1/tree").status_code == 200
+    assert client.get("/sources/2/tree").status_code == 200
+    assert client.get("/nowhere").status_code == 404
+
+    assert HTTP_REQUEST_SECONDS.count("GET", route) == requests + 2
+    assert HTTP_REQUESTS.value("GET", route, "200") >= 2
+    assert HTTP_REQUESTS.value("GET", "unmatched", "404") >= 1
+    assert HTTP_REQUEST_DB_QUERIES.total(route) == queries + 4
+    assert current_request.get() is None
+
+def test_observe_pools_copies_the_pool_snapshot():
+    pool = PoolMetrics()
+    for seconds in (0.0001, 0.02, 2.0):
+        pool.observe_wait(seconds)
+
+    observe_pools({
+        "serving": {
+            "size": 10, "checked_out": 3, "idle": 7, "waiting": 1, "timeouts": 0,
+            "wait_seconds": pool.wait_seconds, "wait_seconds_histogram": pool.histogram(),
+        }
+    })
+
+    assert metrics.DB_POOL_WAIT_SECONDS.buckets == POOL_WAIT_BUCKETS
+    assert metrics.DB_POOL_SIZE.value("serving") == 10
+    assert metrics.DB_POOL_CONNECTIONS.value("serving", "checked_out") == 3
+    assert metrics.DB_POOL_WAIT_SECONDS.count("serving") == 3
+    assert 'db_pool_wait_seconds_bucket{pool="serving",le="0.025"} 2' in metrics.REGISTRY.render()
+
+def test_histogram_time_records_the_block():
+    histogram = Histogram("block_seconds", "Block time.")
+    with histogram.time():
+        pass
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError
+
+    assert histogram.count() == 2
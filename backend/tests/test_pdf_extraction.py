@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tempfile
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+from app.services.pdf_extraction import extract_pages, extract_page_range, read_pdf_info
+
+@pytest.fixture(scope="module")
+def pdf_file():
+    """A 23-page PDF whose pages say which page they are."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
+        c = canvas.Canvas(tmp_pdf.name, pagesize=letter)
+        c.setTitle("Sharding Test")
+        for page in range(23):
+            c.drawString(100, 750, f"This is page number {page}")
+            c.showPage()
+        c.save()
+    yield tmp_pdf.name
+    Path(tmp_pdf.name).unlink()
+
+def test_read_pdf_info(pdf_file):
+    page_count, metadata = read_pdf_info(pdf_file)
+    assert page_count == 23
+    assert metadata["title"] == "Sharding Test"
+
+def test_read_pdf_from_memory(pdf_file):
+    data = Path(pdf_file).read_bytes()
+    page_count, metadata = read_pdf_info(data)
+    assert page_count == 23
+    assert metadata["title"] == "Sharding Test"
+    assert "page number 22" in extract_page_range(data, 22, 23)[0]
+
+def test_extract_page_range(pdf_file):
+    pages = extract_page_range(pdf_file, 4, 7)
+    assert len(pages) == 3
+    assert "page number 4" in pages[0]
+    assert "page number 6" in pages[2]
+
+@pytest.mark.asyncio
+async def test_extract_pages_in_order_across_processes(pdf_file):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = [
+            (page_num, text)
+            async for page_num, text in extract_pages(
+                pdf_file, 23, executor, shard_size=3, max_in_flight=2
+            )
+        ]
+
+    assert [page_num for page_num, _ in results] == list(range(23))
+    assert all(f"page number {page_num}" in text for page_num, text in results)
+
+@pytest.mark.asyncio
+async def test_extract_pages_stops_early(pdf_file):
+    seen = []
+    async for page_num, _ in extract_pages(pdf_file, 23, shard_size=4, max_in_flight=2):
+        seen.append(page_num)
+        if page_num == 5:
+            break
+    assert seen == list(range(6))
+
+@pytest.mark.asyncio
+async def test_extract_pages_from_memory_across_processes(pdf_file):
+    data = Path(pdf_file).read_bytes()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = [page_num async for page_num, _ in extract_pages(data, 23, executor, shard_size=5)]
+    assert results == list(range(23))
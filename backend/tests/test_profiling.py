@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.profiling import (
+    Profile, ProfilingMiddleware, create_task, current_profile, profile_path, run_in_executor, speedscope
+)
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return seconds
+
+async def sleeping():
+    await asyncio.sleep(0.05)
+
+async def spinning_task():
+    spin(0.05)
+
+def stacks_with(profile, name):
+    return {stack: count for stack, count in profile.stacks.items() if name in stack}
+
+@pytest.mark.asyncio
+async def test_profile_samples_running_and_waiting_code():
+    with Profile(interval=0.001) as profile:
+        assert current_profile.get() is profile
+        spin(0.05)
+        await sleeping()
+        await create_task(spinning_task())
+    assert current_profile.get() is None
+
+    assert profile.samples > 0
+    assert any(stack.split(";")[-1].startswith("spin ") for stack in profile.stacks)
+    assert any("sleeping" in stack and stack.endswith("(waiting)") for stack in profile.stacks)
+    # The child task is sampled from its own coroutine
+    assert any(stack.startswith("spinning_task ") and "spin " in stack for stack in profile.stacks)
+
+@pytest.mark.asyncio
+async def test_executor_calls_are_sampled_in_threads_and_processes():
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        await run_in_executor(executor, spin, 0)  # start the worker outside the profile
+        with Profile(interval=0.001) as profile:
+            assert await run_in_executor(None, spin, 0.05) == 0.05
+            assert await run_in_executor(executor, spin, 0.05) == 0.05
+
+    assert any(stack.startswith("[thread pool];") for stack in stacks_with(profile, "spin "))
+    assert any(stack.startswith("[process pool];") for stack in stacks_with(profile, "spin "))
+
+@pytest.mark.asyncio
+async def test_run_in_executor_without_a_profile():
+    assert await run_in_executor(None, spin, 0) == 0
+
+def test_save_keeps_the_newest_files(tmp_path):
+    for _ in range(3):
+        profile = Profile()
+        profile.stacks["main (app.py:1);work (app.py:5)"] = 3
+        profile.save(str(tmp_path), max_files=2)
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert profile_path(profile.profile_id, str(tmp_path)).endswith(f"{profile.profile_id}.collapsed")
+    assert profile_path("../../etc/passwd", str(tmp_path)) is None
+
+def test_speedscope_conversion():
+    document = speedscope("a;b 3\na;c 1\n", "profile", interval=0.01)
+
+    assert [frame["name"] for frame in document["shared"]["frames"]] == ["a", "b", "c"]
+    profile = document["profiles"][0]
+    assert profile["samples"] == [[0, 1], [0, 2]]
+    assert profile["weights"] == pytest.approx([0.03, 0.01])
+    json.dumps(document)
+
+def profiled_app(tmp_path, **options):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work(seconds: float = 0.02):
+        spin(seconds)
+        return {"status": "ok"}
+
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), interval=0.001, **options)
+    return TestClient(app)
+
+def test_requests_ask_to_be_profiled(tmp_path):
+    client = profiled_app(tmp_path, enabled=True, sample_every=0)
+
+    assert "x-profile-id" not in client.get("/work").headers
+    profile_id = client.get("/work", headers={"X-Profile": "1"}).headers["x-profile-id"]
+    assert client.get("/work?profile=1").headers["x-profile-id"] != profile_id
+
+    with open(profile_path(profile_id, str(tmp_path))) as profile_file:
+        assert "spin " in profile_file.read()
+    assert len(os.listdir(tmp_path)) == 2
+
+def test_requests_cannot_ask_when_profiling_is_disabled(tmp_path):
+    client = profiled_app(tmp_path, enabled=False, sample_every=0)
+
+    assert "x-profile-id" not in client.get("/work", headers={"X-Profile": "1"}).headers
+    assert os.listdir(tmp_path) == []
+
+def test_sampled_requests_are_kept_when_slow(tmp_path):
+    client = profiled_app(tmp_path, enabled=False, sample_every=2, slow_seconds=0.05)
+
+    for _ in range(4):
+        client.get("/work?seconds=0")
+    assert os.listdir(tmp_path) == []
+
+    for _ in range(4):
+        client.get("/work?seconds=0.06")
+    assert len(os.listdir(tmp_path)) == 2
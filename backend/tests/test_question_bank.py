@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.question_bank import (
+    RequestCoalescer,
+    TemplateQuestionGenerator,
+    build_questions_query,
+    build_stale_sections_query,
+    serve_questions,
+)
+
+def compile_query(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+TEXT = (
+    "The mitochondria is the powerhouse of the cell. It produces energy through cellular respiration. "
+    "ATP is generated in this process and carried around the cell. Short one. "
+    "Ribosomes assemble proteins from amino acids in the cytoplasm."
+)
+
+@pytest.mark.asyncio
+async def test_template_generator_is_deterministic():
+    generator = TemplateQuestionGenerator(per_section=3)
+    questions = await generator.generate("Cell Energy", TEXT)
+    assert questions == await generator.generate("Cell Energy", TEXT)
+    assert len(questions) == 3
+    assert questions[0].question_type == "short_answer"
+    for question in questions[1:]:
+        assert question.question_type == "cloze"
+        assert "_____" in question.question and question.answer not in question.question
+    assert generator.name == "template-v1:3"
+
+def test_stale_sections_query_only_selects_changed_content():
+    sql = compile_query(build_stale_sections_query(3, "template-v1:3", after=0, limit=100))
+    assert "LEFT OUTER JOIN question_sets" in sql
+    assert "question_sets.content_hash IS DISTINCT FROM knowledge_base_content.content_hash" in sql
+    assert "question_sets.generator != " in sql
+    forced = compile_query(build_stale_sections_query(3, "template-v1:3", after=0, limit=100, force=True))
+    assert "IS DISTINCT FROM" not in forced
+
+def test_questions_query_pages_by_keyset():
+    sql = compile_query(build_questions_query(21, source_id=3, tag="biology", after=40))
+    assert "questions.source_id = " in sql
+    assert "questions.question_id > " in sql
+    assert "ORDER BY questions.question_id" in sql
+    assert "OFFSET" not in sql
+    assert "EXISTS" in sql and "tags.name = " in sql
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_call():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def load(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    results = await asyncio.gather(*(coalescer.run(key, lambda key=key: load(key)) for key in ["a"] * 10 + ["b"]))
+    assert results == ["a"] * 10 + ["b"]
+    assert sorted(calls) == ["a", "b"]
+    assert coalescer.coalesced == 9
+    # Once done, the next request runs again
+    await coalescer.run("a", lambda: load("a"))
+    assert calls.count("a") == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_call():
+    coalescer = RequestCoalescer()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    first = asyncio.ensure_future(coalescer.run("key", load))
+    second = asyncio.ensure_future(coalescer.run("key", load))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kwargs", [{"limit": 0}, {"limit": 1000}, {"cursor": "abc"}])
+async def test_serve_questions_rejects_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        await serve_questions(**kwargs, session_factory=None)
@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import ReplicaSet, RoutingSession
+from app.models import KnowledgeBaseSource
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one(self):
+        return self.value
+
+class FakeConnection:
+    def __init__(self, replica):
+        self.replica = replica
+
+    async def __aenter__(self):
+        if self.replica.down:
+            raise ConnectionRefusedError("connection refused")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        return FakeResult(self.replica.lag)
+
+class FakePool:
+    def __init__(self, checked_out=0):
+        self.checked_out = checked_out
+
+    def checkedout(self):
+        return self.checked_out
+
+class FakeUrl:
+    host = "replica"
+
+class FakeReplica:
+    """Stand-in for a replica AsyncEngine: its health check answers with `lag`."""
+
+    def __init__(self, name, checked_out=0, lag=0.0, down=False):
+        self.sync_engine = name
+        self.pool = FakePool(checked_out)
+        self.url = FakeUrl()
+        self.lag = lag
+        self.down = down
+
+    def connect(self):
+        return FakeConnection(self)
+
+primary = create_async_engine("postgresql+asyncpg://postgres@primary/studyai")
+
+def routing_session(replica_set):
+    return RoutingSession(bind=primary.sync_engine, replica_set=replica_set)
+
+def test_reads_go_to_a_replica_until_the_session_writes():
+    replica = FakeReplica("replica-1")
+    session = routing_session(ReplicaSet([replica]))
+
+    assert session.get_bind(clause=select(KnowledgeBaseSource)) == "replica-1"
+    assert session.get_bind(clause=text("SET LOCAL hnsw.ef_search = 80"), read_only=True) == "replica-1"
+    assert session.get_bind(clause=select(KnowledgeBaseSource).with_for_update()) is primary.sync_engine
+    # Having touched the primary, the session reads its own writes from there
+    assert session.get_bind(clause=select(KnowledgeBaseSource)) is primary.sync_engine
+
+def test_dml_and_unmarked_text_go_to_the_primary():
+    replica_set = ReplicaSet([FakeReplica("replica-1")])
+
+    assert routing_session(replica_set).get_bind(
+        clause=update(KnowledgeBaseSource).values(name="x")
+    ) is primary.sync_engine
+    assert routing_session(replica_set).get_bind(clause=text("SELECT 1")) is primary.sync_engine
+
+def test_without_replicas_everything_goes_to_the_primary():
+    session = routing_session(ReplicaSet([]))
+
+    assert session.get_bind(clause=select(KnowledgeBaseSource)) is primary.sync_engine
+
+def test_round_robin_and_least_connections():
+    replicas = [FakeReplica("replica-1", checked_out=4), FakeReplica("replica-2", checked_out=1)]
+
+    round_robin = ReplicaSet(replicas)
+    assert [round_robin.choose().sync_engine for _ in range(4)] == ["replica-2", "replica-1", "replica-2", "replica-1"]
+
+    least_connections = ReplicaSet(replicas, policy="least_connections")
+    assert least_connections.choose().sync_engine == "replica-2"
+
+    with pytest.raises(ValueError):
+        ReplicaSet(replicas, policy="random")
+
+@pytest.mark.asyncio
+async def test_unhealthy_replicas_are_skipped_and_primary_is_the_fallback():
+    healthy = FakeReplica("replica-1")
+    lagging = FakeReplica("replica-2", lag=120.0)
+    down = FakeReplica("replica-3", down=True)
+    replica_set = ReplicaSet([healthy, lagging, down], max_lag_seconds=30)
+
+    assert await replica_set.check_all() == [True, False, False]
+    assert {replica_set.choose().sync_engine for _ in range(3)} == {"replica-1"}
+
+    healthy.down = True
+    await replica_set.check_all()
+    assert replica_set.choose() is None
+    assert routing_session(replica_set).get_bind(clause=select(KnowledgeBaseSource)) is primary.sync_engine
+
+    lagging.lag = 1.0
+    await replica_set.check_all()
+    assert replica_set.choose().sync_engine == "replica-2"
+
+def test_read_your_writes_window():
+    replica = FakeReplica("replica-1")
+
+    disabled = ReplicaSet([replica], read_your_writes_seconds=0)
+    disabled.note_write()
+    assert disabled.choose() is replica
+
+    enabled = ReplicaSet([replica], read_your_writes_seconds=60)
+    assert enabled.choose() is replica
+    enabled.note_write()
+    assert enabled.choose() is None
+    assert routing_session(enabled).get_bind(clause=select(KnowledgeBaseSource)) is primary.sync_engine
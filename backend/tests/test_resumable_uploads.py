@@ -0,0 +1,109 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from app import config
+from app.models import UploadPart, UploadSession
+from app.services import resumable_uploads
+from app.services.resumable_uploads import (
+    ChecksumMismatch,
+    assemble_parts,
+    count_parts,
+    expected_part_size,
+    remove_orphan_part_dirs,
+    upload_status,
+    write_part,
+)
+
+MIB = 1024 * 1024
+
+async def body(data, chunk_size=64 * 1024):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def test_count_parts():
+    assert count_parts(10 * MIB, 4 * MIB) == 3
+    assert count_parts(8 * MIB, 4 * MIB) == 2
+    with pytest.raises(ValueError):
+        count_parts(0, 4 * MIB)
+    with pytest.raises(ValueError):
+        count_parts(10 * MIB, 1024)
+
+def test_count_parts_limits_part_count(monkeypatch):
+    monkeypatch.setattr(config, "UPLOAD_MAX_PARTS", 4)
+    with pytest.raises(ValueError):
+        count_parts(5 * MIB, MIB)
+
+def test_expected_part_size():
+    session = UploadSession(size_bytes=10 * MIB + 5, part_size=4 * MIB, part_count=3)
+    assert expected_part_size(session, 1) == 4 * MIB
+    assert expected_part_size(session, 3) == 2 * MIB + 5
+    with pytest.raises(ValueError):
+        expected_part_size(session, 4)
+
+@pytest.mark.asyncio
+async def test_write_part_verifies_checksum(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "UPLOAD_COPY_BUFFER_BYTES", 100 * 1024)
+    data = os.urandom(300 * 1024 + 7)
+    path = str(tmp_path / "00001.part")
+
+    checksum = await write_part(body(data), path, len(data), hashlib.sha256(data).hexdigest().upper())
+
+    assert checksum == hashlib.sha256(data).hexdigest()
+    with open(path, "rb") as part:
+        assert part.read() == data
+    assert os.listdir(tmp_path) == ["00001.part"]
+
+@pytest.mark.asyncio
+async def test_write_part_rejects_corrupted_part(tmp_path):
+    data = os.urandom(1000)
+    path = str(tmp_path / "00001.part")
+
+    with pytest.raises(ChecksumMismatch):
+        await write_part(body(data), path, len(data), hashlib.sha256(b"other").hexdigest())
+    with pytest.raises(ValueError):
+        await write_part(body(data), path, len(data) - 1)
+    with pytest.raises(ValueError):
+        await write_part(body(data), path, len(data) + 1)
+
+    # Nothing half-written is left behind
+    assert os.listdir(tmp_path) == []
+
+def test_assemble_parts(tmp_path):
+    parts = [os.urandom(size) for size in (3000, 3000, 17)]
+    paths = []
+    for number, data in enumerate(parts, start=1):
+        path = tmp_path / f"{number:05d}.part"
+        path.write_bytes(data)
+        paths.append(str(path))
+    digest = hashlib.sha256()
+
+    assemble_parts(paths, str(tmp_path / "book.pdf"), digest)
+
+    whole = b"".join(parts)
+    assert (tmp_path / "book.pdf").read_bytes() == whole
+    assert digest.hexdigest() == hashlib.sha256(whole).hexdigest()
+
+def test_upload_status_lists_missing_parts():
+    session = UploadSession(upload_id="abc", status="open", size_bytes=10, part_size=4, part_count=3)
+    parts = [UploadPart(part_number=3, size_bytes=2, sha256="c"), UploadPart(part_number=1, size_bytes=4, sha256="a")]
+
+    status = upload_status(session, parts)
+
+    assert [part["part_number"] for part in status["parts"]] == [1, 3]
+    assert status["missing_parts"] == [2]
+    assert status["bytes_received"] == 6
+
+def test_remove_orphan_part_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumable_uploads, "PARTS_DIR", str(tmp_path))
+    for name in ("open-session", "orphan", "fresh-orphan"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "00001.part").write_bytes(b"x")
+    old = time.time() - 3600
+    os.utime(tmp_path / "open-session", (old, old))
+    os.utime(tmp_path / "orphan", (old, old))
+
+    assert remove_orphan_part_dirs(["open-session"], older_than=time.time() - 60) == 1
+    assert sorted(os.listdir(tmp_path)) == ["fresh-orphan", "open-session"]
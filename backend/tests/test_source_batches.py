@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from app.routers.sources import parse_source
+from app.services.source_batches import SourceBatchImporter, read_json_items
+
+SOURCE = {
+    "name": "Cell Biology",
+    "source": "OpenStax",
+    "source_type": "textbook",
+    "language": "en",
+    "url": "https://openstax.org/biology/ch1",
+    "content_text": "Overview of cell biology...",
+    "content_type": "chapter",
+}
+
+
+async def chunked(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def read(body: bytes, size: int = 7, max_item_bytes: int = 1000) -> list:
+    return [item async for item in read_json_items(chunked(body, size), max_item_bytes)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+async def test_reads_json_arrays_across_chunk_boundaries(size):
+    items = [{"name": "é" * 3, "n": 1}, [1, 2], 12345, "text", None]
+    body = (" \n" + json.dumps(items, indent=1) + "\n").encode()
+    assert await read(body, size) == [(item, None) for item in items]
+    assert await read(b"[]", size) == []
+    assert await read(b"", size) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 5, 1000])
+async def test_reads_ndjson_and_reports_bad_lines(size):
+    body = b'{"a": 1}\n\nnot json\n{"a": 2}\r\n' + b'"' + b"x" * 50 + b'"\n{"a": 3}'
+    results = await read(body, size, max_item_bytes=40)
+    assert [item for item, error in results] == [{"a": 1}, None, {"a": 2}, None, {"a": 3}]
+    assert results[1][1].startswith("Invalid JSON")
+    assert results[3][1] == "Item longer than 40 bytes"
+
+
+@pytest.mark.asyncio
+async def test_malformed_array_stops_after_the_items_before_it():
+    items = []
+    with pytest.raises(ValueError, match="Expected ',' or ']'"):
+        async for item in read_json_items(chunked(b'[{"a": 1} {"a": 2}]', 4)):
+            items.append(item)
+    assert items == [({"a": 1}, None)]
+    with pytest.raises(ValueError, match="end of the JSON array"):
+        await read(b'[{"a": 1},')
+
+
+def test_parse_source_reports_each_invalid_field():
+    assert parse_source(SOURCE).name == "Cell Biology"
+    with pytest.raises(ValueError) as error:
+        parse_source({**SOURCE, "url": None, "publication_date": "someday", "name": None})
+    assert "name:" in str(error.value) and "url:" in str(error.value) and "publication_date:" in str(error.value)
+    with pytest.raises(ValueError, match="item:"):
+        parse_source([1, 2])
+
+
+class FakeIntake:
+    """Saves batches unless one holds a source named "bad", which also fails alone."""
+
+    def __init__(self):
+        self.batches = []
+        self.next_id = 100
+
+    def _create(self, source):
+        self.next_id += 1
+        return type("Source", (), {"source_id": self.next_id})
+
+    async def process_sources(self, sources):
+        self.batches.append([source.name for source in sources])
+        if any(source.name == "bad" for source in sources):
+            raise RuntimeError("batch failed")
+        return [self._create(source) for source in sources]
+
+    async def process_source(self, source):
+        if source.name == "bad":
+            raise RuntimeError("value too long for type character varying(255)")
+        return self._create(source)
+
+
+class FakeSession:
+    rollbacks = 0
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.mark.asyncio
+async def test_importer_saves_in_batches_and_isolates_failures():
+    names = ["a", "b", "c", "bad", "d"]
+    body = "\n".join(
+        [json.dumps({**SOURCE, "name": name}) for name in names] + [json.dumps({**SOURCE, "language": None})]
+    ).encode()
+    db = FakeSession()
+    importer = SourceBatchImporter(db, parse_source, batch_size=2)
+    importer.intake = FakeIntake()
+
+    results = [result.to_dict() for result in await importer.run(read_json_items(chunked(body, 64)))]
+
+    assert importer.intake.batches == [["a", "b"], ["c", "bad"], ["d"]]
+    assert [result["status"] for result in results] == ["created"] * 3 + ["failed", "created", "failed"]
+    assert [result["source_id"] for result in results if result["status"] == "created"] == [101, 102, 103, 104]
+    assert "character varying" in results[3]["error"]
+    assert results[5]["error"].startswith("language:")
+    assert db.rollbacks == 2  # the failed batch, then its bad source
+
+
+@pytest.mark.asyncio
+async def test_importer_reports_where_a_malformed_array_stopped():
+    importer = SourceBatchImporter(FakeSession(), parse_source)
+    importer.intake = FakeIntake()
+    body = ("[" + json.dumps(SOURCE) + ", oops]").encode()
+    results = [result.to_dict() for result in await importer.run(read_json_items(chunked(body, 16)))]
+    assert [result["status"] for result in results] == ["created", "failed"]
+    assert results[1]["index"] == 1 and "the rest of the body was not read" in results[1]["error"]
@@ -77,4 +77,48 @@ def test_information_source_with_sections():
     assert isinstance(db_source, KnowledgeBaseSource)
     assert len(db_contents) == 2  # Main content + 1 section
     assert db_contents[0].title == "Chapter 1: Cell Biology"
-    assert db_contents[1].title == "1.1 Cell Structure" 
\ No newline at end of file
+    assert db_contents[1].title == "1.1 Cell Structure"
+    
+    # Sections hang off the main content
+    assert db_contents[0].parent is None
+    assert db_contents[1].parent is db_contents[0]
+
+class FakeBulkSession:
+    bind = None  # no asyncpg: content goes through the ORM
+
+    def __init__(self):
+        self.statements = []
+        self.added = []
+        self.committed = False
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+        ids = [(41 + n,) for n in range((params or {}).get("count", 0))]
+        return type("Result", (), {"all": lambda self: ids})()
+
+    def add_all(self, models):
+        self.added.extend(models)
+
+    async def commit(self):
+        self.committed = True
+
+@pytest.mark.asyncio
+async def test_process_sources_writes_a_batch_in_one_transaction():
+    sources = [
+        InformationSource(
+            name=f"Chapter {n}", source="OpenStax", source_description=None, source_type="textbook",
+            author=None, publisher=None, publication_date=None, license=None, language="en",
+            url=f"https://openstax.org/biology/ch{n}", content_text=f"Chapter {n} text", content_type="chapter"
+        )
+        for n in (1, 2)
+    ]
+    db = FakeBulkSession()
+    created = await SourceIntakeService(db).process_sources(sources)
+
+    assert [source.source_id for source in created] == [41, 42]
+    assert [content.source_id for content in db.added] == [41, 42]
+    # The id allocation, then one INSERT with a row per source
+    assert len(db.statements) == 2
+    insert = db.statements[1][0].compile()
+    assert insert.params["source_id_m1"] == 42 and insert.params["name_m1"] == "Chapter 2"
+    assert db.committed
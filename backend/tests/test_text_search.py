@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models import KnowledgeBaseContent, TEXT_SEARCH_DDL
+from app.services.text_search import TextSearchService, build_text_search_query, decode_cursor, encode_cursor
+
+def compile_query(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def test_text_search_query_uses_the_index_and_ranks():
+    sql = compile_query(build_text_search_query("cell membrane", 21))
+    assert "knowledge_base_content.search_vector @@ websearch_to_tsquery" in sql
+    assert "ts_rank_cd(knowledge_base_content.search_vector" in sql
+    assert "ORDER BY rank DESC, knowledge_base_content.content_id DESC" in sql
+    assert "OFFSET" not in sql
+    assert "ts_headline" in sql
+
+def test_text_search_query_pages_by_keyset():
+    sql = compile_query(build_text_search_query("cell", 21, source_id=3, content_type="section", after=(0.5, 10)))
+    assert ", knowledge_base_content.content_id) < (" in sql
+    assert "knowledge_base_content.source_id = " in sql
+    assert "knowledge_base_content.content_type = " in sql
+    # Without a language the query is parsed in the language of the source searched
+    assert "knowledge_base_sources.language" in sql
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(0.0421, 1234)) == (0.0421, 1234)
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor(0.1, 1)[:-3], "W10"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kwargs", [
+    {"q": " "},
+    {"q": "cell", "limit": 0},
+    {"q": "cell", "limit": 1000},
+    {"q": "cell", "cursor": "garbage"},
+])
+async def test_search_rejects_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        await TextSearchService(db=None).search(**kwargs)
+
+def test_search_vector_is_generated_and_indexed():
+    table = KnowledgeBaseContent.__table__
+    assert table.c.search_vector.computed.persisted
+    index = next(index for index in table.indexes if index.name == "ix_knowledge_base_content_search_vector")
+    assert index.dialect_options["postgresql"]["using"] == "gin"
+    assert any("knowledge_base_text_config" in statement for statement in TEXT_SEARCH_DDL)
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from app.models import KnowledgeBaseContent
+from app.services.vector_index import InMemoryVectorIndex, bytes_per_vector
+from app.services.vector_search import VectorSearchService
+
+DIMENSION = 32
+
+def random_vectors(count, seed=0, dimension=DIMENSION):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_top_k(vectors, query, k):
+    return list(np.argsort(-(vectors @ query), kind="stable")[:k])
+
+def build_index(dtype="float32", count=2000, dimension=DIMENSION):
+    index = InMemoryVectorIndex(dimension=dimension, dtype=dtype, track_new_sources=True)
+    vectors = random_vectors(count, dimension=dimension)
+    index.add(1, list(range(count)), vectors, ["section"] * count)
+    return index, vectors
+
+def test_float32_search_is_exact():
+    index, vectors = build_index()
+    query = random_vectors(1, seed=1)[0]
+
+    hits = index.search(query, 10, source_id=1)
+
+    assert [content_id for content_id, _ in hits] == exact_top_k(vectors, query, 10)
+    assert hits[0][1] == pytest.approx(1 - vectors[hits[0][0]] @ query, abs=1e-5)
+    assert [distance for _, distance in hits] == sorted(distance for _, distance in hits)
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantised_search_keeps_recall(dtype):
+    index, vectors = build_index(dtype)
+    recalls = []
+    for seed in range(1, 21):
+        query = random_vectors(1, seed=seed)[0]
+        found = {content_id for content_id, _ in index.search(query, 10, source_id=1)}
+        recalls.append(len(found & set(exact_top_k(vectors, query, 10))) / 10)
+    assert np.mean(recalls) >= 0.9
+
+def test_memory_use_by_dtype():
+    assert bytes_per_vector("float32", 768) == 768 * 4 + 12
+    assert bytes_per_vector("float16", 768) == 768 * 2 + 12
+    assert bytes_per_vector("int8", 768) == 768 + 16
+
+    index, _ = build_index("int8", count=100)
+    assert index.stats()["sources"][1] == {
+        "vectors": 100, "bytes": 100 * bytes_per_vector("int8", DIMENSION), "mapped_bytes": 0
+    }
+
+def test_content_type_filter():
+    index = InMemoryVectorIndex(dimension=DIMENSION, track_new_sources=True)
+    vectors = random_vectors(4)
+    index.add(1, [10, 11, 12, 13], vectors, ["chapter", "section", "section", "chapter"])
+
+    hits = index.search(vectors[0], 10, source_id=1, content_type="section")
+
+    assert sorted(content_id for content_id, _ in hits) == [11, 12]
+    assert index.search(vectors[0], 10, source_id=1, content_type="figure") == []
+
+def test_only_tracked_sources_are_indexed():
+    index = InMemoryVectorIndex(dimension=DIMENSION)
+    vectors = random_vectors(3)
+
+    assert index.add(5, [1, 2, 3], vectors, [None] * 3) == 0
+    assert not index.has_source(5)
+
+def test_add_contents_grows_a_source_incrementally():
+    index = InMemoryVectorIndex(dimension=DIMENSION, track_new_sources=True)
+    vectors = random_vectors(3000)
+    # Written in batches, past the initial capacity of the segment
+    for start in range(0, 3000, 700):
+        index.add_contents([
+            KnowledgeBaseContent(content_id=row, source_id=7, content_type="section", embedding=vectors[row])
+            for row in range(start, min(start + 700, 3000))
+        ])
+
+    assert index.stats()["sources"][7]["vectors"] == 3000
+    assert index.search(vectors[2999], 1, source_id=7)[0][0] == 2999
+    assert index.unload(7)
+    assert not index.has_source(7)
+
+@pytest.mark.asyncio
+async def test_search_service_uses_memory_index_for_loaded_sources():
+    index, vectors = build_index(count=50, dimension=768)
+
+    class FakeRow:
+        def __init__(self, content_id):
+            self.content_id = content_id
+            self._mapping = {
+                "content_id": content_id, "source_id": 1, "parent_content_id": None,
+                "title": f"Vector {content_id}", "content": "...", "content_type": "section",
+            }
+
+    class FakeSession:
+        async def execute(self, statement):
+            if "knowledge_base_sources" in str(statement):
+                # The source's version, unchanged since the index was built
+                return type("Result", (), {"scalar_one_or_none": lambda self: None})()
+            # Only the hits are fetched, by primary key; no vector distance in SQL
+            assert "<=>" not in str(statement)
+            (ids,) = statement.compile().params.values()
+            return [FakeRow(content_id) for content_id in ids]
+
+    # As if its rows had been read from the database while the source was at version None
+    index._versions[1] = None
+    hits = await VectorSearchService(FakeSession(), memory_index=index).search(vectors[3], k=3, source_id=1)
+
+    assert hits[0].content_id == 3
+    assert hits[0].distance == pytest.approx(0.0, abs=1e-5)
+    assert len(hits) == 3
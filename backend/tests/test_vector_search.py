@@ -0,0 +1,100 @@
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.vector_search import SearchHit, VectorIndexManager, VectorSearchService, build_search_query
+
+def compile_query(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def test_search_query_orders_by_cosine_distance():
+    sql = compile_query(build_search_query([0.0] * 768, 5))
+    assert "embedding <=>" in sql
+    assert "ORDER BY distance" in sql
+    assert "LIMIT" in sql
+    assert "source_id =" not in sql
+
+def test_search_query_filters():
+    sql = compile_query(build_search_query([0.0] * 768, 5, source_id=3, content_type="section", tags=["biology"]))
+    assert "knowledge_base_content.source_id = " in sql
+    assert "knowledge_base_content.content_type = " in sql
+    assert "EXISTS" in sql and "tags.name IN" in sql
+
+def test_search_hit_score():
+    hit = SearchHit(1, 2, None, "Cells", "Cells are...", "section", 0.25)
+    assert hit.to_dict()["score"] == 0.75
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kwargs", [
+    {"k": 0},
+    {"k": 10000},
+    {"ef_search": -1},
+    {"probes": "5; DROP TABLE tags"},
+])
+async def test_search_rejects_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        await VectorSearchService(db=None).search([0.0] * 768, **kwargs)
+
+@pytest.mark.asyncio
+async def test_search_rejects_wrong_dimension():
+    with pytest.raises(ValueError, match="768 dimensions"):
+        await VectorSearchService(db=None).search([0.0] * 3)
+
+class FakeIndexEngine:
+    """Records each statement with whether it ran in autocommit or in a transaction."""
+
+    def __init__(self, fail_build=False):
+        self.statements = []
+        self.fail_build = fail_build
+        self.isolation = None
+
+    async def execution_options(self, isolation_level):
+        self.isolation = isolation_level
+        return self
+
+    async def execute(self, statement):
+        sql = str(statement)
+        self.statements.append((self.isolation or "transaction", sql))
+        if self.fail_build and sql.startswith("CREATE INDEX"):
+            raise RuntimeError("could not create unique index")
+        return [type("Row", (), {"indexname": "idx_knowledge_base_content_embedding_hnsw", "indexdef": "USING hnsw"})]
+
+    @asynccontextmanager
+    async def connect(self):
+        self.isolation = None
+        yield self
+
+    @asynccontextmanager
+    async def begin(self):
+        self.isolation = None
+        yield self
+
+@pytest.mark.asyncio
+async def test_index_is_rebuilt_under_a_temporary_name_then_swapped_in():
+    engine = FakeIndexEngine()
+    index = await VectorIndexManager(engine).create_index("hnsw", m=16, ef_construction=64)
+
+    assert index["name"] == "idx_knowledge_base_content_embedding_hnsw"
+    statements = [(isolation, sql.split(" ON ")[0]) for isolation, sql in engine.statements[:-1]]
+    assert statements == [
+        ("AUTOCOMMIT", "DROP INDEX CONCURRENTLY IF EXISTS idx_knowledge_base_content_embedding_hnsw_new"),
+        ("AUTOCOMMIT", "CREATE INDEX CONCURRENTLY idx_knowledge_base_content_embedding_hnsw_new"),
+        ("transaction", "DROP INDEX IF EXISTS idx_knowledge_base_content_embedding_hnsw"),
+        ("transaction", "ALTER INDEX idx_knowledge_base_content_embedding_hnsw_new "
+                        "RENAME TO idx_knowledge_base_content_embedding_hnsw"),
+    ]
+
+@pytest.mark.asyncio
+async def test_failed_rebuild_keeps_the_live_index():
+    engine = FakeIndexEngine(fail_build=True)
+    with pytest.raises(RuntimeError):
+        await VectorIndexManager(engine).create_index("hnsw")
+    assert engine.statements[-1] == (
+        "AUTOCOMMIT", "DROP INDEX CONCURRENTLY IF EXISTS idx_knowledge_base_content_embedding_hnsw_new"
+    )
+    assert not any(isolation == "transaction" for isolation, _ in engine.statements)
+
+def test_search_endpoint_requires_query(test_client):
+    response = test_client.post("/search/", json={})
+    assert response.status_code == 400
@@ -0,0 +1,227 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.vector_index import InMemoryVectorIndex
+from app.services.vector_snapshot import (
+    MANIFEST,
+    Segment,
+    SegmentWriter,
+    SnapshotError,
+    VectorSnapshot,
+    append_snapshot,
+    compact_snapshot,
+)
+
+DIMENSION = 16
+
+def random_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def write_segment(directory, name, rows, dtype="float32"):
+    """rows: list of (source_id, content_id, content_type, vector)"""
+    writer = SegmentWriter(directory / name, DIMENSION, dtype)
+    writer.write(
+        [row[1] for row in rows], [row[0] for row in rows], [row[2] for row in rows],
+        np.stack([row[3] for row in rows])
+    )
+    writer.close()
+    return name
+
+def write_snapshot(directory, segments, dtype="float32"):
+    manifest = {"version": 1, "dtype": dtype, "dimension": DIMENSION, "source_ids": None, "segments": segments}
+    (directory / MANIFEST).write_text(json.dumps(manifest))
+    return VectorSnapshot(directory)
+
+class FakeStreamResult:
+    async def partitions(self, size):
+        return
+        yield
+
+    def scalar_one_or_none(self):
+        return None
+
+class FakeSession:
+    async def stream(self, query):
+        return FakeStreamResult()
+
+    async def execute(self, query):
+        return FakeStreamResult()
+
+def test_segment_round_trip(tmp_path):
+    vectors = random_vectors(3)
+    write_segment(tmp_path, "segment-1.vecs", [
+        (1, 10, "chapter", vectors[0] * 3), (1, 11, None, vectors[1]), (2, 5, "section", vectors[2])
+    ], dtype="float16")
+
+    segment = Segment(tmp_path / "segment-1.vecs")
+
+    assert isinstance(segment.vectors, np.memmap)
+    assert segment.dtype == "float16" and segment.count == 3 and segment.max_content_id == 11
+    assert list(segment.content_ids) == [10, 11, 5]
+    assert [segment.types[code] for code in segment.type_codes] == ["chapter", None, "section"]
+    # Stored normalised
+    np.testing.assert_allclose(segment.vectors[0].astype(np.float32), vectors[0], atol=1e-3)
+    assert segment.source_rows(1) == slice(0, 2)
+    assert segment.source_rows(3) == slice(3, 3)
+
+def test_segment_writer_requires_sorted_rows(tmp_path):
+    writer = SegmentWriter(tmp_path / "segment-1.vecs", DIMENSION)
+    with pytest.raises(SnapshotError):
+        writer.write([2, 1], [1, 1], [None, None], random_vectors(2))
+    writer.abort()
+    assert not list(tmp_path.iterdir())
+
+def test_segment_rejects_other_files(tmp_path):
+    path = tmp_path / "segment-1.vecs"
+    path.write_bytes(b"not a snapshot" * 10)
+    with pytest.raises(SnapshotError):
+        Segment(path)
+
+def test_compaction_merges_segments_newest_first(tmp_path):
+    vectors = random_vectors(4)
+    first = write_segment(tmp_path, "segment-1.vecs", [(1, 1, "a", vectors[0]), (2, 2, "a", vectors[1])])
+    second = write_segment(tmp_path, "segment-2.vecs", [(1, 3, "b", vectors[3]), (2, 2, "b", vectors[2])])
+    write_snapshot(tmp_path, [first, second])
+
+    info = compact_snapshot(tmp_path)
+
+    assert len(info["segments"]) == 1 and info["vectors"] == 3
+    assert sorted(path.name for path in tmp_path.glob("segment-*.vecs")) == [info["segments"][0]["name"]]
+    segment = VectorSnapshot(tmp_path).segments[0]
+    assert list(segment.source_ids) == [1, 1, 2]
+    assert list(segment.content_ids) == [1, 3, 2]
+    # content 2 exists in both segments; the later one wins
+    assert [segment.types[code] for code in segment.type_codes] == ["a", "b", "b"]
+    np.testing.assert_allclose(segment.vectors[2], vectors[2], atol=1e-6)
+
+@pytest.mark.asyncio
+async def test_index_loads_source_from_snapshot(tmp_path):
+    vectors = random_vectors(6)
+    first = write_segment(tmp_path, "segment-1.vecs", [(1, 1, "a", vectors[0]), (1, 2, "a", vectors[1]), (2, 3, "a", vectors[2])])
+    second = write_segment(tmp_path, "segment-2.vecs", [(1, 4, "b", vectors[3])])
+    snapshot = write_snapshot(tmp_path, [first, second])
+    index = InMemoryVectorIndex(dimension=DIMENSION)
+
+    assert await index.load_source(FakeSession(), 1, snapshot) == 3
+    index.add(1, [5], vectors[4:5], ["c"])
+
+    assert index.search(vectors[3], 1, source_id=1)[0][0] == 4
+    assert index.search(vectors[4], 1, source_id=1)[0][0] == 5
+    assert {content_id for content_id, _ in index.search(vectors[0], 10, source_id=1, content_type="a")} == {1, 2}
+    stats = index.stats()["sources"][1]
+    assert stats["vectors"] == 4
+    assert stats["mapped_bytes"] == 3 * DIMENSION * 4 + 3 * 12
+    assert stats["bytes"] == DIMENSION * 4 + 12
+
+class FakeRow:
+    def __init__(self, content_id, source_id, content_type, embedding):
+        self.content_id = content_id
+        self.source_id = source_id
+        self.content_type = content_type
+        self.embedding = embedding
+
+class FakeRowsResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def partitions(self, size):
+        for start in range(0, len(self.rows), size):
+            yield self.rows[start:start + size]
+
+    def all(self):
+        return self.rows
+
+    def scalar_one_or_none(self):
+        return self.rows
+
+class FakeContentSession:
+    """
+    knowledge_base_content as FakeRows: streams of the source's rows, fetches by id;
+    every source is at `version`.
+    """
+
+    def __init__(self, rows, version=None):
+        self.rows = sorted(rows, key=lambda row: (row.source_id, row.content_id))
+        self.version = version
+        self.fetched = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def _matching(self, query):
+        params = query.compile().params
+        rows = self.rows
+        for name, value in params.items():
+            if name.startswith("source_id"):
+                rows = [row for row in rows if row.source_id in (value if isinstance(value, list) else [value])]
+            if name.startswith("content_id"):
+                rows = [row for row in rows if row.content_id in value]
+        return rows
+
+    async def stream(self, query):
+        return FakeRowsResult(self._matching(query))
+
+    async def execute(self, query):
+        if "knowledge_base_sources" in str(query):
+            return FakeRowsResult(self.version)
+        rows = self._matching(query)
+        self.fetched.extend(row.content_id for row in rows)
+        return FakeRowsResult(rows)
+
+@pytest.mark.asyncio
+async def test_index_reads_sources_the_snapshot_was_not_exported_for(tmp_path):
+    vectors = random_vectors(4)
+    segment = write_segment(tmp_path, "segment-1.vecs", [(2, 50, "a", vectors[0])])
+    snapshot = write_snapshot(tmp_path, [segment])
+    snapshot.manifest["source_ids"] = [2]
+    # Source 1 was never exported: all of it comes from the database, ids below 50 included
+    db = FakeContentSession([FakeRow(content_id, 1, "a", vectors[content_id]) for content_id in (1, 2, 3)])
+
+    index = InMemoryVectorIndex(dimension=DIMENSION)
+    assert await index.load_source(db, 1, snapshot) == 3
+    assert index.search(vectors[2], 1, source_id=1)[0][0] == 2
+
+@pytest.mark.asyncio
+async def test_rows_committed_late_with_lower_ids_are_picked_up(tmp_path):
+    vectors = random_vectors(12)
+    segment = write_segment(tmp_path, "segment-1.vecs", [(1, 1, "a", vectors[1]), (1, 10, "a", vectors[10])])
+    write_snapshot(tmp_path, [segment])
+    # Content 5 had its id allocated before 10 but committed after the export
+    db = FakeContentSession([FakeRow(content_id, 1, "a", vectors[content_id]) for content_id in (1, 5, 10)])
+
+    index = InMemoryVectorIndex(dimension=DIMENSION)
+    assert await index.load_source(db, 1, VectorSnapshot(tmp_path)) == 3
+    assert db.fetched == [5]
+    assert index.search(vectors[5], 1, source_id=1)[0][0] == 5
+
+    info = await append_snapshot(db, tmp_path)
+    assert info["vectors"] == 3
+    assert list(VectorSnapshot(tmp_path).content_ids(1)) == [1, 5, 10]
+    assert (await append_snapshot(db, tmp_path))["segments"] == info["segments"]
+
+
+@pytest.mark.asyncio
+async def test_sources_changed_by_other_processes_are_caught_up():
+    vectors = random_vectors(4)
+    db = FakeContentSession([FakeRow(content_id, 1, "a", vectors[content_id]) for content_id in (1, 2)], version="v1")
+    index = InMemoryVectorIndex(dimension=DIMENSION, session_factory=lambda: db)
+    await index.load_source(db, 1)
+    assert await index.in_sync(db, 1)
+    assert not await index.in_sync(db, 2)
+
+    # Another process commits content 3, and indexes it in its own memory only
+    db.rows.append(FakeRow(3, 1, "a", vectors[3]))
+    db.version = "v2"
+    assert not await index.in_sync(db, 1)
+    await index._catch_ups[1]
+
+    assert await index.in_sync(db, 1)
+    assert db.fetched == [3]
+    assert index.stats()["sources"][1]["vectors"] == 3
+    assert index.search(vectors[3], 1, source_id=1)[0][0] == 3
@@ -27,13 +27,120 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-"
         content_id SERIAL PRIMARY KEY,
         source_id INT REFERENCES knowledge_base_sources(source_id) ON DELETE CASCADE,
         parent_content_id INT REFERENCES knowledge_base_content(content_id) ON DELETE CASCADE,
+        path TEXT,
         title VARCHAR(255),
         content TEXT,
         content_type VARCHAR(50),
+        content_hash VARCHAR(64),
         embedding VECTOR(768),
+        search_config REGCONFIG,
+        search_vector TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector(coalesce(search_config, 'simple'), coalesce(title, '')), 'A') ||
+            setweight(to_tsvector(coalesce(search_config, 'simple'), coalesce(content, '')), 'B')
+        ) STORED,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    CREATE INDEX ix_knowledge_base_content_source_id ON knowledge_base_content(source_id);
+    CREATE INDEX ix_knowledge_base_content_content_type ON knowledge_base_content(content_type);
+    CREATE INDEX ix_knowledge_base_content_parent_content_id ON knowledge_base_content(parent_content_id);
+    -- Content digest, to reuse the embeddings of identical text
+    CREATE INDEX ix_knowledge_base_content_content_hash ON knowledge_base_content(content_hash);
+    -- Materialised path of content ids from the root ("12/40/41/"); descendants are prefix matches
+    CREATE INDEX ix_knowledge_base_content_path ON knowledge_base_content(path text_pattern_ops);
+    -- Rows changed since an incremental export's watermark
+    CREATE INDEX ix_knowledge_base_content_updated_at ON knowledge_base_content(updated_at);
+
+    -- Fill in the path of new rows that do not provide one, and rewrite a subtree's
+    -- paths when its root is re-parented
+    CREATE FUNCTION knowledge_base_content_set_path() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' AND NEW.path IS NOT NULL THEN
+            RETURN NEW;
+        END IF;
+        NEW.path := COALESCE(
+            (SELECT path FROM knowledge_base_content WHERE content_id = NEW.parent_content_id), ''
+        ) || NEW.content_id || '/';
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER knowledge_base_content_path
+        BEFORE INSERT OR UPDATE OF parent_content_id ON knowledge_base_content
+        FOR EACH ROW EXECUTE FUNCTION knowledge_base_content_set_path();
+
+    CREATE FUNCTION knowledge_base_content_move_subtree() RETURNS trigger AS $$
+    BEGIN
+        UPDATE knowledge_base_content
+        SET path = NEW.path || substr(path, length(OLD.path) + 1)
+        WHERE path LIKE OLD.path || '%' AND content_id <> NEW.content_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER knowledge_base_content_move
+        AFTER UPDATE OF parent_content_id ON knowledge_base_content
+        FOR EACH ROW WHEN (OLD.path IS DISTINCT FROM NEW.path)
+        EXECUTE FUNCTION knowledge_base_content_move_subtree();
+
+    -- Full-text search: search_vector is parsed with the text search configuration of
+    -- the source's language (an ISO 639-1 code or a configuration name, else 'simple')
+    CREATE INDEX ix_knowledge_base_content_search_vector ON knowledge_base_content USING gin (search_vector);
+
+    CREATE FUNCTION knowledge_base_text_config(language TEXT) RETURNS regconfig AS $$
+        SELECT COALESCE(
+            (
+                SELECT oid::regconfig FROM pg_ts_config
+                WHERE cfgname = CASE lower(split_part(language, '-', 1))
+                    WHEN 'ar' THEN 'arabic' WHEN 'hy' THEN 'armenian' WHEN 'eu' THEN 'basque'
+                    WHEN 'ca' THEN 'catalan' WHEN 'da' THEN 'danish' WHEN 'nl' THEN 'dutch'
+                    WHEN 'en' THEN 'english' WHEN 'fi' THEN 'finnish' WHEN 'fr' THEN 'french'
+                    WHEN 'de' THEN 'german' WHEN 'el' THEN 'greek' WHEN 'hi' THEN 'hindi'
+                    WHEN 'hu' THEN 'hungarian' WHEN 'id' THEN 'indonesian' WHEN 'ga' THEN 'irish'
+                    WHEN 'it' THEN 'italian' WHEN 'lt' THEN 'lithuanian' WHEN 'ne' THEN 'nepali'
+                    WHEN 'no' THEN 'norwegian' WHEN 'nb' THEN 'norwegian' WHEN 'pt' THEN 'portuguese'
+                    WHEN 'ro' THEN 'romanian' WHEN 'ru' THEN 'russian' WHEN 'sr' THEN 'serbian'
+                    WHEN 'es' THEN 'spanish' WHEN 'sv' THEN 'swedish' WHEN 'ta' THEN 'tamil'
+                    WHEN 'tr' THEN 'turkish' WHEN 'yi' THEN 'yiddish'
+                    ELSE lower(language)
+                END
+            ),
+            'simple'::regconfig
+        )
+    $$ LANGUAGE sql STABLE;
+
+    CREATE FUNCTION knowledge_base_content_set_search_config() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.search_config IS NULL THEN
+            NEW.search_config := knowledge_base_text_config(
+                (SELECT language FROM knowledge_base_sources WHERE source_id = NEW.source_id)
+            );
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER knowledge_base_content_search_config
+        BEFORE INSERT ON knowledge_base_content
+        FOR EACH ROW EXECUTE FUNCTION knowledge_base_content_set_search_config();
+
+    CREATE FUNCTION knowledge_base_sources_update_search_config() RETURNS trigger AS $$
+    BEGIN
+        UPDATE knowledge_base_content
+        SET search_config = knowledge_base_text_config(NEW.language)
+        WHERE source_id = NEW.source_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER knowledge_base_sources_search_config
+        AFTER UPDATE OF language ON knowledge_base_sources
+        FOR EACH ROW WHEN (OLD.language IS DISTINCT FROM NEW.language)
+        EXECUTE FUNCTION knowledge_base_sources_update_search_config();
+
+    -- Approximate nearest-neighbour index for cosine similarity search
+    CREATE INDEX idx_knowledge_base_content_embedding_hnsw ON knowledge_base_content
+        USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 
     -- Users Table
     CREATE TABLE users (
@@ -58,6 +165,7 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-"
         tag_id INT REFERENCES tags(tag_id) ON DELETE CASCADE,
         PRIMARY KEY (content_id, tag_id)
     );
+    CREATE INDEX ix_content_tags_tag_id ON content_tags(tag_id);
 
     -- User Activity Log Table
     CREATE TABLE user_activity_log (
@@ -67,4 +175,84 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-"
         activity_type VARCHAR(50),
         activity_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+
+    -- Ingestion Jobs Table (background document processing queue)
+    CREATE TABLE ingestion_jobs (
+        job_id SERIAL PRIMARY KEY,
+        filename VARCHAR(255) NOT NULL,
+        file_path TEXT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        source_id INT REFERENCES knowledge_base_sources(source_id) ON DELETE SET NULL,
+        file_digest VARCHAR(64),
+        pages_total INT,
+        pages_processed INT DEFAULT 0,
+        chunks_processed INT DEFAULT 0,
+        attempts INT DEFAULT 0,
+        error TEXT,
+        profile_id VARCHAR(32),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_ingestion_jobs_status ON ingestion_jobs(status, job_id);
+    CREATE INDEX ix_ingestion_jobs_file_digest ON ingestion_jobs(file_digest);
+
+    -- Uploaded files by content digest, so re-uploads map to the existing source
+    CREATE TABLE source_files (
+        digest VARCHAR(64) PRIMARY KEY,
+        source_id INT NOT NULL REFERENCES knowledge_base_sources(source_id) ON DELETE CASCADE,
+        filename VARCHAR(255),
+        size_bytes BIGINT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX ix_source_files_source_id ON source_files(source_id);
+
+    -- Resumable multi-part uploads: parts are stored under UPLOAD_DIR until completion
+    CREATE TABLE upload_sessions (
+        upload_id VARCHAR(36) PRIMARY KEY,
+        filename VARCHAR(255) NOT NULL,
+        size_bytes BIGINT NOT NULL,
+        part_size INT NOT NULL,
+        part_count INT NOT NULL,
+        file_digest VARCHAR(64),
+        status VARCHAR(20) NOT NULL DEFAULT 'open',
+        job_id INT REFERENCES ingestion_jobs(job_id) ON DELETE SET NULL,
+        source_id INT REFERENCES knowledge_base_sources(source_id) ON DELETE SET NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX ix_upload_sessions_status ON upload_sessions(status);
+    CREATE INDEX ix_upload_sessions_updated_at ON upload_sessions(updated_at);
+
+    CREATE TABLE upload_parts (
+        upload_id VARCHAR(36) REFERENCES upload_sessions(upload_id) ON DELETE CASCADE,
+        part_number INT,
+        size_bytes INT NOT NULL,
+        sha256 VARCHAR(64) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (upload_id, part_number)
+    );
+
+    -- Question bank: practice questions generated per content row, regenerated when
+    -- the content (content_hash) or the generator changes
+    CREATE TABLE question_sets (
+        content_id INT PRIMARY KEY REFERENCES knowledge_base_content(content_id) ON DELETE CASCADE,
+        content_hash VARCHAR(64),
+        generator VARCHAR(100) NOT NULL,
+        question_count INT NOT NULL DEFAULT 0,
+        generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE questions (
+        question_id SERIAL PRIMARY KEY,
+        content_id INT NOT NULL REFERENCES knowledge_base_content(content_id) ON DELETE CASCADE,
+        source_id INT NOT NULL REFERENCES knowledge_base_sources(source_id) ON DELETE CASCADE,
+        question TEXT NOT NULL,
+        answer TEXT,
+        question_type VARCHAR(30),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX ix_questions_source_id ON questions(source_id, question_id);
+    CREATE INDEX ix_questions_content_id ON questions(content_id, question_id);
 EOSQL 
\ No newline at end of file